@@ -56,8 +56,8 @@ def create_app(config_name=None):
     # 用户加载回调函数
     @login_manager.user_loader
     def load_user(user_id):
-        from app.models.user import User
-        return User.query.get(int(user_id))
+        from app.utils.identity_cache import load_user as load_cached_user
+        return load_cached_user(int(user_id))
     
     # 注册蓝图
     from app.views.main import main_bp
@@ -137,6 +137,16 @@ def create_app(config_name=None):
     with app.app_context():
         from app.utils.cache_hooks import setup_cache_invalidation_hooks
         setup_cache_invalidation_hooks()
+        # 注册用户、角色/权限、分厂负责人变更后刷新身份快照、用户权限集合及分厂范围缓存的回调
+        from app.utils import permission_service, factory_scope, identity_cache  # noqa: F401
+    
+    # 初始化Excel后台导入任务
+    from app.utils.import_job_service import import_job_service
+    import_job_service.init_app(app)
+    from app.utils.temp_artifact_service import temp_artifact_service
+    temp_artifact_service.init_app(app)
+    from app.utils.monthly_report_service import monthly_report_service
+    monthly_report_service.init_app(app)
     
     # 初始化会话管理器和黑名单管理器
     from app.utils import init_session_manager, cleanup_session_manager
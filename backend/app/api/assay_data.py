@@ -2,11 +2,13 @@ from flask import Blueprint, jsonify, request, send_file
 from app import db
 from app.models.assay_data import AssayData
 from app.models.attachment import Attachment
-from datetime import datetime
+from app.utils.pagination_service import pagination_service
+from datetime import datetime, timedelta
 import os
 import logging
 from flask_login import current_user
 from app.api.decorators import api_login_required, permission_required
+from app.utils.factory_scope import get_user_factory_ids, factory_scope_filter
 
 # 创建化验数据API蓝图
 api_assay_data_bp = Blueprint('api_assay_data', __name__, url_prefix='/api')
@@ -14,43 +16,91 @@ api_assay_data_bp = Blueprint('api_assay_data', __name__, url_prefix='/api')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 化验数据接口返回的字段（列表接口可通过fields参数投影其中部分字段）
+ASSAY_DATA_FIELDS = [
+    'id', 'sample_name', 'factory_id',
+    'water_content', 'zinc_content', 'lead_content', 'chlorine_content',
+    'fluorine_content', 'iron_content', 'silicon_content', 'sulfur_content',
+    'high_heat', 'low_heat', 'silver_content', 'recovery_rate',
+    'remarks', 'created_by', 'created_at', 'updated_at'
+]
+
+# 列表接口允许排序的字段
+ASSAY_DATA_SORT_FIELDS = ['created_at', 'sample_name', 'factory_id', 'id']
+
+def serialize_assay_data(data, fields=ASSAY_DATA_FIELDS):
+    """序列化化验数据，data可以是ORM对象，也可以是按列查询返回的行"""
+    result = {}
+    for field in fields:
+        value = getattr(data, field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        result[field] = value
+    return result
+
+def get_assay_data_projection():
+    """解析fields参数（逗号分隔），仅保留已知字段，id始终返回"""
+    fields_param = request.args.get('fields', '').strip()
+    if not fields_param:
+        return ASSAY_DATA_FIELDS
+    fields = ['id']
+    for field in fields_param.split(','):
+        field = field.strip()
+        if field in ASSAY_DATA_FIELDS and field not in fields:
+            fields.append(field)
+    return fields
+
 # 化验数据相关API
 @api_assay_data_bp.route('/assay-data', methods=['GET'])
 @api_login_required
 @permission_required('assay_data_read')
 def get_assay_data_list():
-    """获取化验数据列表"""
-    # 根据用户权限获取数据
-    if current_user.has_permission('assay_data_read_all'):
-        # 管理员可以看到所有数据
-        assay_data_list = AssayData.query.all()
-    else:
-        # 其他用户只能看到自己分厂的数据
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
-        assay_data_list = AssayData.query.filter(AssayData.factory_id.in_(factory_ids)).all()
+    """获取化验数据列表
+    
+    支持分页（page/per_page或cursor游标）、排序、筛选（date_from、date_to、factory_id、sample_name）
+    以及字段投影（fields=id,sample_name,zinc_content）。按列查询，不构建ORM对象。
+    """
+    try:
+        date_from = request.args.get('date_from', '').strip()
+        date_to = request.args.get('date_to', '').strip()
+        date_from = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
+        date_to = datetime.strptime(date_to, '%Y-%m-%d') if date_to else None
+    except ValueError:
+        return jsonify({'error': '日期格式不正确，应为YYYY-MM-DD'}), 400
+    
+    fields = get_assay_data_projection()
+    # 查询返回字段及排序字段（游标分页需要读取排序值）
+    columns = fields + [field for field in ASSAY_DATA_SORT_FIELDS if field not in fields]
+    query = db.session.query(*[getattr(AssayData, field) for field in columns])
+    
+    # 根据用户权限获取数据：非管理员只能看到自己分厂的数据
+    if not current_user.has_permission('assay_data_read_all'):
+        query = query.filter(factory_scope_filter(AssayData.factory_id))
+    
+    # 应用筛选条件
+    if date_from:
+        query = query.filter(AssayData.created_at >= date_from)
+    if date_to:
+        # 截止日期包含当天
+        query = query.filter(AssayData.created_at < date_to + timedelta(days=1))
+    factory_id = request.args.get('factory_id', type=int)
+    if factory_id:
+        query = query.filter(AssayData.factory_id == factory_id)
+    sample_name = request.args.get('sample_name', '').strip()
+    if sample_name:
+        query = query.filter(AssayData.sample_name.contains(sample_name))
+    
+    result = pagination_service.paginate_query(
+        query,
+        AssayData,
+        default_sort='created_at',
+        allowed_sorts=ASSAY_DATA_SORT_FIELDS,
+        allow_cursor=True
+    )
+    result['items'] = [serialize_assay_data(row, fields) for row in result['items']]
+    result['fields'] = fields
     
-    return jsonify([{
-        'id': data.id,
-        'sample_name': data.sample_name,
-        'factory_id': data.factory_id,
-        'water_content': data.water_content,
-        'zinc_content': data.zinc_content,
-        'lead_content': data.lead_content,
-        'chlorine_content': data.chlorine_content,
-        'fluorine_content': data.fluorine_content,
-        'iron_content': data.iron_content,
-        'silicon_content': data.silicon_content,
-        'sulfur_content': data.sulfur_content,
-        'high_heat': data.high_heat,
-        'low_heat': data.low_heat,
-        'silver_content': data.silver_content,
-        'recovery_rate': data.recovery_rate,
-        'remarks': data.remarks,
-        'created_by': data.created_by,
-        'created_at': data.created_at.isoformat() if data.created_at else None,
-        'updated_at': data.updated_at.isoformat() if data.updated_at else None
-    } for data in assay_data_list])
+    return jsonify(result)
 
 @api_assay_data_bp.route('/assay-data/<int:data_id>', methods=['GET'])
 @api_login_required
@@ -61,32 +111,11 @@ def get_assay_data(data_id):
     
     # 检查权限
     if not current_user.has_permission('assay_data_update_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if assay_data.factory_id not in factory_ids:
             return jsonify({'error': '您没有权限查看此化验数据'}), 403
     
-    return jsonify({
-        'id': assay_data.id,
-        'sample_name': assay_data.sample_name,
-        'factory_id': assay_data.factory_id,
-        'water_content': assay_data.water_content,
-        'zinc_content': assay_data.zinc_content,
-        'lead_content': assay_data.lead_content,
-        'chlorine_content': assay_data.chlorine_content,
-        'fluorine_content': assay_data.fluorine_content,
-        'iron_content': assay_data.iron_content,
-        'silicon_content': assay_data.silicon_content,
-        'sulfur_content': assay_data.sulfur_content,
-        'high_heat': assay_data.high_heat,
-        'low_heat': assay_data.low_heat,
-        'silver_content': assay_data.silver_content,
-        'recovery_rate': assay_data.recovery_rate,
-        'remarks': assay_data.remarks,
-        'created_by': assay_data.created_by,
-        'created_at': assay_data.created_at.isoformat() if assay_data.created_at else None,
-        'updated_at': assay_data.updated_at.isoformat() if assay_data.updated_at else None
-    })
+    return jsonify(serialize_assay_data(assay_data))
 
 @api_assay_data_bp.route('/assay-data', methods=['POST'])
 @api_login_required
@@ -100,8 +129,7 @@ def create_assay_data():
     
     # 检查权限
     if not current_user.has_permission('assay_data_read_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if int(data['factory_id']) not in factory_ids:
             return jsonify({'error': '您没有权限在此分厂创建化验数据'}), 403
     
@@ -130,27 +158,7 @@ def create_assay_data():
     db.session.add(assay_data)
     db.session.commit()
     
-    return jsonify({
-        'id': assay_data.id,
-        'sample_name': assay_data.sample_name,
-        'factory_id': assay_data.factory_id,
-        'water_content': assay_data.water_content,
-        'zinc_content': assay_data.zinc_content,
-        'lead_content': assay_data.lead_content,
-        'chlorine_content': assay_data.chlorine_content,
-        'fluorine_content': assay_data.fluorine_content,
-        'iron_content': assay_data.iron_content,
-        'silicon_content': assay_data.silicon_content,
-        'sulfur_content': assay_data.sulfur_content,
-        'high_heat': assay_data.high_heat,
-        'low_heat': assay_data.low_heat,
-        'silver_content': assay_data.silver_content,
-        'recovery_rate': assay_data.recovery_rate,
-        'remarks': assay_data.remarks,
-        'created_by': assay_data.created_by,
-        'created_at': assay_data.created_at.isoformat() if assay_data.created_at else None,
-        'updated_at': assay_data.updated_at.isoformat() if assay_data.updated_at else None
-    }), 201
+    return jsonify(serialize_assay_data(assay_data)), 201
 
 @api_assay_data_bp.route('/assay-data/<int:data_id>', methods=['PUT'])
 @api_login_required
@@ -165,8 +173,7 @@ def update_assay_data(data_id):
     
     # 检查权限
     if not current_user.has_permission('assay_data_delete_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if assay_data.factory_id not in factory_ids:
             return jsonify({'error': '您没有权限更新此化验数据'}), 403
     
@@ -177,8 +184,7 @@ def update_assay_data(data_id):
     if 'factory_id' in data:
         # 检查权限
         if not current_user.has_permission('assay_data_create_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if int(data['factory_id']) not in factory_ids:
                 return jsonify({'error': '您没有权限将数据转移到此分厂'}), 403
         assay_data.factory_id = data['factory_id']
@@ -213,27 +219,7 @@ def update_assay_data(data_id):
     
     db.session.commit()
     
-    return jsonify({
-        'id': assay_data.id,
-        'sample_name': assay_data.sample_name,
-        'factory_id': assay_data.factory_id,
-        'water_content': assay_data.water_content,
-        'zinc_content': assay_data.zinc_content,
-        'lead_content': assay_data.lead_content,
-        'chlorine_content': assay_data.chlorine_content,
-        'fluorine_content': assay_data.fluorine_content,
-        'iron_content': assay_data.iron_content,
-        'silicon_content': assay_data.silicon_content,
-        'sulfur_content': assay_data.sulfur_content,
-        'high_heat': assay_data.high_heat,
-        'low_heat': assay_data.low_heat,
-        'silver_content': assay_data.silver_content,
-        'recovery_rate': assay_data.recovery_rate,
-        'remarks': assay_data.remarks,
-        'created_by': assay_data.created_by,
-        'created_at': assay_data.created_at.isoformat() if assay_data.created_at else None,
-        'updated_at': assay_data.updated_at.isoformat() if assay_data.updated_at else None
-    })
+    return jsonify(serialize_assay_data(assay_data))
 
 @api_assay_data_bp.route('/assay-data/<int:data_id>', methods=['DELETE'])
 @api_login_required
@@ -244,8 +230,7 @@ def delete_assay_data(data_id):
     
     # 检查权限
     if not current_user.has_permission('assay_data_delete_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if assay_data.factory_id not in factory_ids:
             return jsonify({'error': '您没有权限删除此化验数据'}), 403
     
@@ -597,8 +582,7 @@ def preview_assay_attachment(attachment_id):
             
         # 检查用户权限
         if not current_user.has_permission('assay_data_read_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if assay_data.factory_id not in factory_ids:
                 return jsonify({'error': '您没有权限查看此附件'}), 403
         
@@ -669,8 +653,7 @@ def delete_assay_attachment(attachment_id):
             
         # 检查用户权限
         if not current_user.has_permission('assay_data_update_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if assay_data.factory_id not in factory_ids:
                 return jsonify({'error': '您没有权限删除此附件'}), 403
         
@@ -724,8 +707,7 @@ def list_assay_attachments(assay_data_id):
         
         # 检查用户权限
         if not current_user.has_permission('assay_data_update_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if assay_data.factory_id not in factory_ids:
                 return jsonify({'error': '您没有权限查看此化验数据的附件'}), 403
         
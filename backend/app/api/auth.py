@@ -190,7 +190,7 @@ def get_session_info():
         if not payload:
             return jsonify({'error': 'Token无效'}), 401
         
-        session_info = session_manager.get_session_info(payload.get('jti'))
+        session_info = session_manager.get_session_info(token)
         
         return jsonify({
             'success': True,
@@ -213,8 +213,7 @@ def get_blacklist_info():
     """获取黑名单信息"""
     try:
         info = {
-            'total_blacklisted': len(blacklist_manager._blacklist),
-            'metadata_count': len(blacklist_manager._blacklist_metadata),
+            'total_blacklisted': blacklist_manager.get_blacklist_count(),
             'file_path': blacklist_manager.get_blacklist_path()
         }
         
@@ -238,7 +237,7 @@ def cleanup_blacklist():
             'message': f'清理完成，移除了 {removed_count} 个过期条目',
             'data': {
                 'removed_count': removed_count,
-                'remaining_count': len(blacklist_manager._blacklist)
+                'remaining_count': blacklist_manager.get_blacklist_count()
             }
         })
     except Exception as e:
@@ -253,7 +252,7 @@ def get_user_blacklisted_tokens():
         # 这里可以根据需要实现获取用户相关的黑名单token
         # 目前返回基本的黑名单统计信息
         info = {
-            'total_blacklisted': len(blacklist_manager._blacklist)
+            'total_blacklisted': blacklist_manager.get_blacklist_count()
         }
         
         return jsonify({
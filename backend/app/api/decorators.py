@@ -1,64 +1,78 @@
 from functools import wraps
-from flask import jsonify, request, g, current_app
+from flask import jsonify, request, g, current_app, _request_ctx_stack
 from flask_login import current_user
-from app.models.permission import Permission
-from app.models.user import User
+from app.utils.identity_cache import load_user
 from app.utils.jwt_utils import JWTManager
 from app.utils.session_manager import session_manager
 
+def _auth_error(message, error_code):
+    """认证失败响应"""
+    return jsonify({
+        'success': False,
+        'message': message,
+        'error_code': error_code
+    }), 401
+
+def _authenticate():
+    """解析请求的身份信息：JWT token优先，其次为session登录
+
+    :return: (用户, 认证方式, token, 错误响应)
+    """
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        token = auth_header.split(' ')[1]
+        payload = JWTManager.verify_token(token)
+        user = load_user(payload.get('user_id')) if payload else None
+        if not user:
+            # JWT验证失败
+            return None, None, None, _auth_error('Token无效或已过期', 'INVALID_TOKEN')
+        
+        # 检查会话超时，未超时时更新会话活动时间
+        timeout_minutes = current_app.config.get('SESSION_TIMEOUT_MINUTES', 30)
+        if not session_manager.refresh_session(token, timeout_minutes):
+            # 会话超时，撤销token
+            JWTManager.revoke_token(token)
+            return None, None, None, _auth_error('会话超时', 'SESSION_TIMEOUT')
+        
+        # 同一请求内的flask_login.current_user也使用该用户（不写入session）
+        _request_ctx_stack.top.user = user
+        return user, 'jwt', token, None
+    
+    # 如果没有JWT token，检查session登录
+    if current_user.is_authenticated:
+        return current_user._get_current_object(), 'session', None, None
+    
+    # 都没有，返回未授权
+    return None, None, None, _auth_error('需要登录才能访问此资源', 'UNAUTHORIZED')
+
+def get_auth_context():
+    """获取当前请求的认证结果
+
+    同一请求内只解析一次（缓存在g上，并记录所属请求，已推入的应用上下文中处理多个请求时不会复用），
+    多个装饰器叠加时不再重复校验token和查询用户。
+    认证成功时设置g.current_user、g.auth_method和g.current_token。
+
+    :return: 错误响应，认证成功时为None
+    """
+    current_request = request._get_current_object()
+    cached = g.get('_auth_context')
+    if cached is None or cached[0] is not current_request:
+        user, method, token, error = _authenticate()
+        g._auth_context = (current_request, error)
+        if error is None:
+            g.current_user = user
+            g.auth_method = method
+            g.current_token = token
+    return g._auth_context[1]
+
 def api_login_required(f):
     """API身份验证装饰器 - 支持JWT token和session验证"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # 首先检查JWT token
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-            payload = JWTManager.verify_token(token)
-            
-            if payload:
-                # JWT验证成功，设置当前用户
-                user_id = payload.get('user_id')
-                user = User.query.get(user_id)
-                if user:
-                    # 检查会话超时
-                    timeout_minutes = current_app.config.get('SESSION_TIMEOUT_MINUTES', 30)
-                    if session_manager.check_session_timeout(token, timeout_minutes):
-                        # 会话超时，撤销token
-                        JWTManager.revoke_token(token)
-                        return jsonify({
-                            'success': False,
-                            'message': '会话超时',
-                            'error_code': 'SESSION_TIMEOUT'
-                        }), 401
-                    
-                    # 更新会话活动时间
-                    session_manager.update_session_activity(token)
-                    
-                    g.current_user = user
-                    g.auth_method = 'jwt'
-                    g.current_token = token
-                    return f(*args, **kwargs)
-            
-            # JWT验证失败
-            return jsonify({
-                'success': False,
-                'message': 'Token无效或已过期',
-                'error_code': 'INVALID_TOKEN'
-            }), 401
-        
-        # 如果没有JWT token，检查session登录
-        if current_user.is_authenticated:
-            g.current_user = current_user
-            g.auth_method = 'session'
-            return f(*args, **kwargs)
-        
-        # 都没有，返回未授权
-        return jsonify({
-            'success': False,
-            'message': '需要登录才能访问此资源',
-            'error_code': 'UNAUTHORIZED'
-        }), 401
+        error = get_auth_context()
+        if error is not None:
+            return error
+        return f(*args, **kwargs)
     return decorated_function
 
 def permission_required(permission_name):
@@ -66,47 +80,19 @@ def permission_required(permission_name):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            # 首先进行身份验证
-            auth_header = request.headers.get('Authorization')
-            user = None
+            # 首先进行身份验证（与api_login_required共用同一请求的认证结果）
+            error = get_auth_context()
+            if error is not None:
+                return error
             
-            if auth_header and auth_header.startswith('Bearer '):
-                # JWT验证
-                token = auth_header.split(' ')[1]
-                payload = JWTManager.verify_token(token)
-                
-                if payload:
-                    user_id = payload.get('user_id')
-                    user = User.query.get(user_id)
-                
-                if not user:
-                    return jsonify({
-                        'success': False,
-                        'message': 'Token无效或已过期',
-                        'error_code': 'INVALID_TOKEN'
-                    }), 401
-            elif current_user.is_authenticated:
-                # Session验证
-                user = current_user
-            else:
-                return jsonify({
-                    'success': False,
-                    'message': '需要登录才能访问此资源',
-                    'error_code': 'UNAUTHORIZED'
-                }), 401
-            
-            # 检查用户是否具有指定权限
-            if not user.has_permission(permission_name):
+            # 检查用户是否具有指定权限（权限集合在请求内只加载一次）
+            if not g.current_user.has_permission(permission_name):
                 return jsonify({
                     'success': False,
                     'message': f'缺少权限: {permission_name}',
                     'error_code': 'INSUFFICIENT_PERMISSIONS'
                 }), 403
             
-            # 设置当前用户到g对象
-            g.current_user = user
-            g.auth_method = 'jwt' if auth_header else 'session'
-            
             return f(*args, **kwargs)
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
@@ -59,7 +59,8 @@ def get_employees():
             model_class=Employee,
             default_sort='created_at',
             allowed_sorts=['name', 'employee_id', 'created_at', 'updated_at'],
-            eager_load=['department']
+            eager_load=['department'],
+            allow_cursor=True
         )
         
         # 格式化数据
@@ -2,23 +2,24 @@
 Excel API接口
 提供Excel导入导出的RESTful API
 """
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from app.api.decorators import api_login_required, permission_required
 from app.utils.excel_service import excel_service
-from app.utils.excel_validator import excel_validator
 from app.utils.excel_template_manager import template_manager
 from app.utils.excel_error_manager import error_manager
+from app.utils.temp_artifact_service import temp_artifact_service
+from app.utils.excel_import_service import import_service, IMPORT_MODULE_LABELS
+from app.utils.excel_export_service import export_service, assay_data_export, material_transaction_export
 from app.models.material_transaction import MaterialTransaction
+from app.models.assay_data import AssayData
 from app.models.customer import Customer
 from app.models.material import Material
-from app.models.department import Department
 from app.models.contract import Contract
-from app import db
+from app.utils.factory_scope import factory_scope_filter
 import os
 import logging
-import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -35,16 +36,11 @@ def download_template(module_name):
     :param module_name: 模块名称
     """
     try:
-        # 根据模块名称生成相应模板
-        if module_name == 'material_transaction':
-            file_path = template_manager.generate_material_transaction_template()
-        elif module_name == 'assay_data':
-            file_path = template_manager.generate_assay_data_template()
-        else:
+        if module_name not in IMPORT_MODULE_LABELS:
             return jsonify({'error': f'不支持的模块: {module_name}'}), 400
         
-        # 返回文件下载
-        return send_file(file_path, as_attachment=True)
+        # 返回内存中缓存的模板（带ETag）
+        return template_manager.send_template(module_name)
         
     except Exception as e:
         logger.error(f"下载模板时发生错误: {str(e)}")
@@ -68,113 +64,51 @@ def import_excel_data(module_name):
         if not file.filename:
             return jsonify({'error': '请选择要上传的文件'}), 400
         
-        # 保存上传文件
-        temp_dir = os.path.join(current_app.config.get('TEMP_FOLDER', 'temp'), 'excel', 'uploads')
-        os.makedirs(temp_dir, exist_ok=True)
+        if module_name not in IMPORT_MODULE_LABELS:
+            return jsonify({'error': f'不支持的模块: {module_name}'}), 400
         
-        file_path = os.path.join(temp_dir, file.filename)
-        file.save(file_path)
+        # 上传文件分块写入临时文件（超过大小上限时拒绝）
+        try:
+            file_path = excel_service.save_upload(file)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # 读取Excel文件
-        df = excel_service.import_from_excel(file_path)
+        try:
+            # 分块读取、校验并写入
+            result = import_service.import_file(module_name, file_path, current_user.id)
+        finally:
+            # 清理临时文件
+            os.remove(file_path)
         
-        # 根据模块名称进行数据验证和处理
-        if module_name == 'material_transaction':
-            # 验证物料进出厂数据
-            validation_result = excel_validator.validate_material_transaction_data(df)
-            if not validation_result['valid']:
-                # 生成错误报告
-                error_file = error_manager.generate_error_report(
-                    [{'type': '验证错误', 'message': validation_result['error']}], 
-                    '物料进出厂数据导入'
-                )
-                return jsonify({
-                    'error': '数据验证失败', 
-                    'error_report': error_file
-                }), 400
-            
-            # 导入数据到数据库
-            success_count = 0
-            error_count = 0
-            errors = []
-            
-            for index, row in df.iterrows():
-                try:
-                    # 处理日期
-                    date_obj = pd.to_datetime(row['日期']).date()
-                    
-                    # 创建物料进出厂记录
-                    transaction = MaterialTransaction(
-                        date=date_obj,
-                        customer=row['客户'],
-                        material_name=row['物料名称'],
-                        factory_id=Department.query.filter_by(name=row['分厂']).first().id if Department.query.filter_by(name=row['分厂']).first() else None,
-                        contract_number=row.get('合同编号', ''),
-                        transaction_type=row['类型'],
-                        packaging=row.get('包装', ''),
-                        vehicle_number=row.get('车号', ''),
-                        shipped_quantity=float(row['发数']),
-                        received_quantity=float(row['到数']),
-                        water_content=float(row['水含量']) if pd.notna(row.get('水含量')) else None,
-                        zinc_content=float(row['锌含量']) if pd.notna(row.get('锌含量')) else None,
-                        lead_content=float(row['铅含量']) if pd.notna(row.get('铅含量')) else None,
-                        chlorine_content=float(row['氯含量']) if pd.notna(row.get('氯含量')) else None,
-                        fluorine_content=float(row['氟含量']) if pd.notna(row.get('氟含量')) else None,
-                        remarks=row.get('备注', '')
-                    )
-                    
-                    db.session.add(transaction)
-                    success_count += 1
-                except Exception as e:
-                    error_count += 1
-                    errors.append({
-                        'type': '导入错误',
-                        'message': f'第{index+1}行导入失败: {str(e)}',
-                        'row': index+1
-                    })
-            
-            if errors:
-                # 生成错误报告
-                error_file = error_manager.generate_error_report(errors, '物料进出厂数据导入')
-                db.session.rollback()
-                return jsonify({
-                    'error': f'部分数据导入失败，成功导入{success_count}条，失败{error_count}条',
-                    'error_report': error_file
-                }), 400
-            else:
-                db.session.commit()
-            
-        elif module_name == 'assay_data':
-            # 验证化验数据
-            validation_result = excel_validator.validate_assay_data(df)
-            if not validation_result['valid']:
-                # 生成错误报告
-                error_file = error_manager.generate_error_report(
-                    [{'type': '验证错误', 'message': validation_result['error']}], 
-                    '化验数据导入'
-                )
-                return jsonify({
-                    'error': '数据验证失败', 
-                    'error_report': error_file
-                }), 400
-            
-            # TODO: 实际的数据导入逻辑需要根据具体的数据模型实现
-            # 这里只是示例，实际需要根据业务逻辑处理数据
-        else:
-            return jsonify({'error': f'不支持的模块: {module_name}'}), 400
-        
-        # 清理临时文件
-        os.remove(file_path)
+        if result['errors']:
+            # 生成错误报告
+            error_file = error_manager.generate_error_report(
+                result['errors'], IMPORT_MODULE_LABELS[module_name], result['error_matrix'], current_user.id
+            )
+            return jsonify({
+                'error': result['message'],
+                'error_report': error_file
+            }), 400
+        error_manager.log_import_result(result['total'], result['success_count'], result['error_count'], IMPORT_MODULE_LABELS[module_name])
         
         return jsonify({
             'message': '数据导入成功',
-            'imported_rows': len(df)
+            'imported_rows': result['total']
         }), 200
         
     except Exception as e:
         logger.error(f"导入Excel数据时发生错误: {str(e)}")
         return jsonify({'error': f'导入Excel数据时发生错误: {str(e)}'}), 500
 
+@excel_api_bp.route('/artifacts/<artifact_id>')
+@api_login_required
+def download_artifact(artifact_id):
+    """下载错误报告等生成的临时文件（创建人或超级管理员）"""
+    meta = temp_artifact_service.get(artifact_id)
+    if meta is None or (meta['owner'] != current_user.id and not current_user.is_superuser):
+        return jsonify({'error': '文件不存在或已过期'}), 404
+    return temp_artifact_service.send(meta)
+
 @excel_api_bp.route('/export/<module_name>')
 @api_login_required
 @permission_required('excel_export')
@@ -192,67 +126,40 @@ def export_excel_data(module_name):
             
             # 根据用户权限筛选数据
             if not current_user.has_permission('assay_data_create_all'):
-                user_departments = current_user.managed_departments
-                factory_ids = [dept.id for dept in user_departments if dept.level == 1]
-                query = query.filter(MaterialTransaction.factory_id.in_(factory_ids))
-            
-            transactions = query.all()
+                query = query.filter(factory_scope_filter(MaterialTransaction.factory_id))
             
-            # 转换为导出格式
-            export_data = []
-            for transaction in transactions:
-                export_data.append({
-                    '日期': transaction.date.strftime('%Y-%m-%d') if transaction.date else '',
-                    '客户': transaction.customer,
-                    '物料名称': transaction.material_name,
-                    '分厂': transaction.factory.name if transaction.factory else '',
-                    '合同编号': transaction.contract_number,
-                    '类型': transaction.transaction_type,
-                    '包装': transaction.packaging,
-                    '车号': transaction.vehicle_number,
-                    '发数': transaction.shipped_quantity,
-                    '到数': transaction.received_quantity,
-                    '水含量': transaction.water_content,
-                    '锌含量': transaction.zinc_content,
-                    '铅含量': transaction.lead_content,
-                    '氯含量': transaction.chlorine_content,
-                    '氟含量': transaction.fluorine_content,
-                    '备注': transaction.remarks
-                })
+            headers, query = material_transaction_export(query)
+            return export_service.export_response(headers, query, f"{module_name}_导出数据")
         elif module_name == 'assay_data':
-            # TODO: 根据模块名称查询相应数据
-            # 这里只是示例数据
-            export_data = [
-                {
-                    '样品名称': '样品1',
-                    '分厂': '一分厂',
-                    '水含量': 10.5,
-                    '锌含量': 20.3,
-                    '铅含量': 5.2,
-                    '氯含量': 1.8,
-                    '氟含量': 0.5,
-                    '铁含量': 3.7,
-                    '硅含量': 2.1,
-                    '硫含量': 1.2,
-                    '高热值': 4500,
-                    '低热值': 3200,
-                    '银含量': 0.01,
-                    '回收率': 95.5,
-                    '备注': '正常'
-                }
-            ]
+            # 查询化验数据
+            query = AssayData.query
+            
+            # 根据用户权限筛选数据
+            if not current_user.has_permission('assay_data_read_all'):
+                query = query.filter(factory_scope_filter(AssayData.factory_id))
+            
+            # 按化验日期（创建时间）和分厂筛选
+            try:
+                date_from = request.args.get('date_from', '').strip()
+                date_to = request.args.get('date_to', '').strip()
+                date_from = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
+                date_to = datetime.strptime(date_to, '%Y-%m-%d') if date_to else None
+            except ValueError:
+                return jsonify({'error': '日期格式不正确，应为YYYY-MM-DD'}), 400
+            if date_from:
+                query = query.filter(AssayData.created_at >= date_from)
+            if date_to:
+                # 截止日期包含当天
+                query = query.filter(AssayData.created_at < date_to + timedelta(days=1))
+            factory_id = request.args.get('factory_id', type=int)
+            if factory_id:
+                query = query.filter(AssayData.factory_id == factory_id)
+            
+            headers, query = assay_data_export(query)
+            return export_service.export_response(headers, query, f"{module_name}_导出数据")
         else:
             return jsonify({'error': f'不支持的模块: {module_name}'}), 400
         
-        # 导出数据
-        file_path = excel_service.export_to_excel(
-            export_data, 
-            f"{module_name}_导出数据"
-        )
-        
-        # 返回文件下载
-        return send_file(file_path, as_attachment=True)
-        
     except Exception as e:
         logger.error(f"导出Excel数据时发生错误: {str(e)}")
         return jsonify({'error': f'导出Excel数据时发生错误: {str(e)}'}), 500
\ No newline at end of file
@@ -1,49 +1,113 @@
 from flask import Blueprint, jsonify, request
 from app import db
 from app.models.material_transaction import MaterialTransaction
-from datetime import datetime
+from app.utils.pagination_service import pagination_service
+from sqlalchemy.orm import load_only
+from datetime import datetime, date
 from app.api.decorators import api_login_required, permission_required
+from app.utils.factory_scope import get_user_factory_ids, factory_scope_filter
 
 # 创建物料交易API蓝图
 api_material_transaction_bp = Blueprint('api_material_transaction', __name__, url_prefix='/api')
 
+# 基础字段（列表、详情、创建、更新接口返回）
+TRANSACTION_FIELDS = [
+    'id', 'date', 'customer', 'material_name', 'factory_id', 'contract_number',
+    'transaction_type', 'packaging', 'vehicle_number', 'shipped_quantity', 'received_quantity',
+    'water_content', 'zinc_content', 'lead_content', 'chlorine_content', 'fluorine_content',
+    'remarks', 'created_at', 'updated_at'
+]
+
+# 含分工协作状态的字段（状态管理、人员分配接口返回）
+TRANSACTION_STATUS_FIELDS = TRANSACTION_FIELDS[:-2] + [
+    'status', 'weighing_completed', 'assaying_completed',
+    'created_by', 'completed_by', 'weighing_by', 'assaying_by'
+] + TRANSACTION_FIELDS[-2:]
+
+# 列表接口允许排序的字段（均为索引列）
+LIST_SORT_FIELDS = ['date', 'created_at', 'customer', 'material_name', 'transaction_type', 'status', 'factory_id']
+
+def serialize_transaction(transaction, fields=TRANSACTION_FIELDS):
+    """按字段列表序列化物料进出厂记录，日期时间转为ISO格式"""
+    data = {}
+    for field in fields:
+        value = getattr(transaction, field)
+        if isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        data[field] = value
+    return data
+
+def get_projection_fields():
+    """解析fields参数（逗号分隔），仅保留可投影字段，id始终返回"""
+    fields_param = request.args.get('fields', '').strip()
+    if not fields_param:
+        return TRANSACTION_FIELDS
+    fields = ['id']
+    for field in fields_param.split(','):
+        field = field.strip()
+        if field in TRANSACTION_STATUS_FIELDS and field not in fields:
+            fields.append(field)
+    return fields
+
+def parse_date_arg(name):
+    """解析YYYY-MM-DD格式的查询参数，格式错误抛出ValueError"""
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
 @api_material_transaction_bp.route('/material-transactions', methods=['GET'])
 @api_login_required
 @permission_required('material_transaction_read')
 def get_material_transactions():
-    """获取物料进出厂记录列表"""
-    # 根据用户权限获取数据
+    """获取物料进出厂记录列表
+    
+    支持分页（page/per_page或cursor游标）、排序（sort_by/sort_order）、
+    筛选（date_from、date_to、customer、material_name、factory_id、status、transaction_type）
+    以及字段投影（fields=id,date,customer）。
+    """
     from flask_login import current_user
-    if current_user.has_permission('material_transaction_read_all'):
-        # 管理员可以看到所有数据
-        transactions = MaterialTransaction.query.all()
-    else:
-        # 其他用户只能看到自己分厂的数据
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
-        transactions = MaterialTransaction.query.filter(MaterialTransaction.factory_id.in_(factory_ids)).all()
-    
-    return jsonify([{
-        'id': transaction.id,
-        'date': transaction.date.isoformat() if transaction.date else None,
-        'customer': transaction.customer,
-        'material_name': transaction.material_name,
-        'factory_id': transaction.factory_id,
-        'contract_number': transaction.contract_number,
-        'transaction_type': transaction.transaction_type,
-        'packaging': transaction.packaging,
-        'vehicle_number': transaction.vehicle_number,
-        'shipped_quantity': transaction.shipped_quantity,
-        'received_quantity': transaction.received_quantity,
-        'water_content': transaction.water_content,
-        'zinc_content': transaction.zinc_content,
-        'lead_content': transaction.lead_content,
-        'chlorine_content': transaction.chlorine_content,
-        'fluorine_content': transaction.fluorine_content,
-        'remarks': transaction.remarks,
-        'created_at': transaction.created_at.isoformat() if transaction.created_at else None,
-        'updated_at': transaction.updated_at.isoformat() if transaction.updated_at else None
-    } for transaction in transactions])
+    try:
+        date_from = parse_date_arg('date_from')
+        date_to = parse_date_arg('date_to')
+    except ValueError:
+        return jsonify({'error': '日期格式不正确，应为YYYY-MM-DD'}), 400
+    
+    fields = get_projection_fields()
+    # 仅加载需要返回的列，排序列一并加载以便生成游标
+    load_columns = set(fields) | set(LIST_SORT_FIELDS)
+    query = MaterialTransaction.query.options(
+        load_only(*[getattr(MaterialTransaction, field) for field in load_columns])
+    )
+    
+    # 根据用户权限获取数据：非管理员只能看到自己分厂的数据
+    if not current_user.has_permission('material_transaction_read_all'):
+        query = query.filter(factory_scope_filter(MaterialTransaction.factory_id))
+    
+    # 应用筛选条件（精确匹配以使用索引）
+    if date_from:
+        query = query.filter(MaterialTransaction.date >= date_from)
+    if date_to:
+        query = query.filter(MaterialTransaction.date <= date_to)
+    factory_id = request.args.get('factory_id', type=int)
+    if factory_id:
+        query = query.filter(MaterialTransaction.factory_id == factory_id)
+    for field in ['customer', 'material_name', 'status', 'transaction_type']:
+        value = request.args.get(field, '').strip()
+        if value:
+            query = query.filter(getattr(MaterialTransaction, field) == value)
+    
+    result = pagination_service.paginate_query(
+        query,
+        MaterialTransaction,
+        default_sort='date',
+        allowed_sorts=LIST_SORT_FIELDS,
+        allow_cursor=True
+    )
+    result['items'] = [serialize_transaction(transaction, fields) for transaction in result['items']]
+    result['fields'] = fields
+    
+    return jsonify(result)
 
 @api_material_transaction_bp.route('/material-transactions/<int:transaction_id>', methods=['GET'])
 @api_login_required
@@ -55,32 +119,11 @@ def get_material_transaction(transaction_id):
     
     # 检查权限
     if not current_user.has_permission('material_transaction_read_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if transaction.factory_id not in factory_ids:
             return jsonify({'error': '您没有权限查看此记录'}), 403
     
-    return jsonify({
-        'id': transaction.id,
-        'date': transaction.date.isoformat() if transaction.date else None,
-        'customer': transaction.customer,
-        'material_name': transaction.material_name,
-        'factory_id': transaction.factory_id,
-        'contract_number': transaction.contract_number,
-        'transaction_type': transaction.transaction_type,
-        'packaging': transaction.packaging,
-        'vehicle_number': transaction.vehicle_number,
-        'shipped_quantity': transaction.shipped_quantity,
-        'received_quantity': transaction.received_quantity,
-        'water_content': transaction.water_content,
-        'zinc_content': transaction.zinc_content,
-        'lead_content': transaction.lead_content,
-        'chlorine_content': transaction.chlorine_content,
-        'fluorine_content': transaction.fluorine_content,
-        'remarks': transaction.remarks,
-        'created_at': transaction.created_at.isoformat() if transaction.created_at else None,
-        'updated_at': transaction.updated_at.isoformat() if transaction.updated_at else None
-    })
+    return jsonify(serialize_transaction(transaction))
 
 @api_material_transaction_bp.route('/material-transactions', methods=['POST'])
 @api_login_required
@@ -95,8 +138,7 @@ def create_material_transaction():
     
     # 检查权限
     if not current_user.has_permission('material_transaction_update_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if int(data['factory_id']) not in factory_ids:
             return jsonify({'error': '您没有权限在此分厂创建记录'}), 403
     
@@ -129,27 +171,7 @@ def create_material_transaction():
     db.session.add(transaction)
     db.session.commit()
     
-    return jsonify({
-        'id': transaction.id,
-        'date': transaction.date.isoformat() if transaction.date else None,
-        'customer': transaction.customer,
-        'material_name': transaction.material_name,
-        'factory_id': transaction.factory_id,
-        'contract_number': transaction.contract_number,
-        'transaction_type': transaction.transaction_type,
-        'packaging': transaction.packaging,
-        'vehicle_number': transaction.vehicle_number,
-        'shipped_quantity': transaction.shipped_quantity,
-        'received_quantity': transaction.received_quantity,
-        'water_content': transaction.water_content,
-        'zinc_content': transaction.zinc_content,
-        'lead_content': transaction.lead_content,
-        'chlorine_content': transaction.chlorine_content,
-        'fluorine_content': transaction.fluorine_content,
-        'remarks': transaction.remarks,
-        'created_at': transaction.created_at.isoformat() if transaction.created_at else None,
-        'updated_at': transaction.updated_at.isoformat() if transaction.updated_at else None
-    }), 201
+    return jsonify(serialize_transaction(transaction)), 201
 
 @api_material_transaction_bp.route('/material-transactions/<int:transaction_id>', methods=['PUT'])
 @api_login_required
@@ -165,8 +187,7 @@ def update_material_transaction(transaction_id):
     
     # 检查权限
     if not current_user.has_permission('material_transaction_update_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if transaction.factory_id not in factory_ids:
             return jsonify({'error': '您没有权限更新此记录'}), 403
     
@@ -186,8 +207,7 @@ def update_material_transaction(transaction_id):
     if 'factory_id' in data:
         # 检查权限
         if not current_user.has_permission('material_transaction_create_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if int(data['factory_id']) not in factory_ids:
                 return jsonify({'error': '您没有权限将记录转移到此分厂'}), 403
         transaction.factory_id = data['factory_id']
@@ -230,27 +250,7 @@ def update_material_transaction(transaction_id):
     
     db.session.commit()
     
-    return jsonify({
-        'id': transaction.id,
-        'date': transaction.date.isoformat() if transaction.date else None,
-        'customer': transaction.customer,
-        'material_name': transaction.material_name,
-        'factory_id': transaction.factory_id,
-        'contract_number': transaction.contract_number,
-        'transaction_type': transaction.transaction_type,
-        'packaging': transaction.packaging,
-        'vehicle_number': transaction.vehicle_number,
-        'shipped_quantity': transaction.shipped_quantity,
-        'received_quantity': transaction.received_quantity,
-        'water_content': transaction.water_content,
-        'zinc_content': transaction.zinc_content,
-        'lead_content': transaction.lead_content,
-        'chlorine_content': transaction.chlorine_content,
-        'fluorine_content': transaction.fluorine_content,
-        'remarks': transaction.remarks,
-        'created_at': transaction.created_at.isoformat() if transaction.created_at else None,
-        'updated_at': transaction.updated_at.isoformat() if transaction.updated_at else None
-    })
+    return jsonify(serialize_transaction(transaction))
 
 @api_material_transaction_bp.route('/material-transactions/<int:transaction_id>', methods=['DELETE'])
 @api_login_required
@@ -262,8 +262,7 @@ def delete_material_transaction(transaction_id):
     
     # 检查权限
     if not current_user.has_permission('material_transaction_update_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if transaction.factory_id not in factory_ids:
             return jsonify({'error': '您没有权限删除此记录'}), 403
     
@@ -282,8 +281,7 @@ def update_material_transaction_status(transaction_id):
     
     # 检查权限
     if not current_user.has_permission('material_transaction_delete_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if transaction.factory_id not in factory_ids:
             return jsonify({'error': '您没有权限更新此记录状态'}), 403
     
@@ -302,34 +300,7 @@ def update_material_transaction_status(transaction_id):
     
     db.session.commit()
     
-    return jsonify({
-        'id': transaction.id,
-        'date': transaction.date.isoformat() if transaction.date else None,
-        'customer': transaction.customer,
-        'material_name': transaction.material_name,
-        'factory_id': transaction.factory_id,
-        'contract_number': transaction.contract_number,
-        'transaction_type': transaction.transaction_type,
-        'packaging': transaction.packaging,
-        'vehicle_number': transaction.vehicle_number,
-        'shipped_quantity': transaction.shipped_quantity,
-        'received_quantity': transaction.received_quantity,
-        'water_content': transaction.water_content,
-        'zinc_content': transaction.zinc_content,
-        'lead_content': transaction.lead_content,
-        'chlorine_content': transaction.chlorine_content,
-        'fluorine_content': transaction.fluorine_content,
-        'remarks': transaction.remarks,
-        'status': transaction.status,
-        'weighing_completed': transaction.weighing_completed,
-        'assaying_completed': transaction.assaying_completed,
-        'created_by': transaction.created_by,
-        'completed_by': transaction.completed_by,
-        'weighing_by': transaction.weighing_by,
-        'assaying_by': transaction.assaying_by,
-        'created_at': transaction.created_at.isoformat() if transaction.created_at else None,
-        'updated_at': transaction.updated_at.isoformat() if transaction.updated_at else None
-    })
+    return jsonify(serialize_transaction(transaction, TRANSACTION_STATUS_FIELDS))
 
 @api_material_transaction_bp.route('/material-transactions/<int:transaction_id>/assign', methods=['PUT'])
 @api_login_required
@@ -342,8 +313,7 @@ def assign_material_transaction_operators(transaction_id):
     
     # 检查权限
     if not current_user.has_permission('material_transaction_delete_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if transaction.factory_id not in factory_ids:
             return jsonify({'error': '您没有权限分配此记录的操作人员'}), 403
     
@@ -356,31 +326,4 @@ def assign_material_transaction_operators(transaction_id):
     
     db.session.commit()
     
-    return jsonify({
-        'id': transaction.id,
-        'date': transaction.date.isoformat() if transaction.date else None,
-        'customer': transaction.customer,
-        'material_name': transaction.material_name,
-        'factory_id': transaction.factory_id,
-        'contract_number': transaction.contract_number,
-        'transaction_type': transaction.transaction_type,
-        'packaging': transaction.packaging,
-        'vehicle_number': transaction.vehicle_number,
-        'shipped_quantity': transaction.shipped_quantity,
-        'received_quantity': transaction.received_quantity,
-        'water_content': transaction.water_content,
-        'zinc_content': transaction.zinc_content,
-        'lead_content': transaction.lead_content,
-        'chlorine_content': transaction.chlorine_content,
-        'fluorine_content': transaction.fluorine_content,
-        'remarks': transaction.remarks,
-        'status': transaction.status,
-        'weighing_completed': transaction.weighing_completed,
-        'assaying_completed': transaction.assaying_completed,
-        'created_by': transaction.created_by,
-        'completed_by': transaction.completed_by,
-        'weighing_by': transaction.weighing_by,
-        'assaying_by': transaction.assaying_by,
-        'created_at': transaction.created_at.isoformat() if transaction.created_at else None,
-        'updated_at': transaction.updated_at.isoformat() if transaction.updated_at else None
-    })
\ No newline at end of file
+    return jsonify(serialize_transaction(transaction, TRANSACTION_STATUS_FIELDS))
\ No newline at end of file
@@ -3,14 +3,20 @@ from flask_login import login_required, current_user
 from app import db
 from app.models.metal_price import MetalPrice
 from app.utils.cache_service import cache_service, CACHE_TIMEOUT
+from app.utils.response_cache import cache_response
+from app.utils.excel_export_service import export_service, metal_price_export
+from app.utils.excel_template_manager import template_manager
+from app.utils.metal_price_import import (
+    METAL_PRICE_REQUIRED_COLUMNS, prepare_metal_prices, upsert_metal_prices, price_key_exists
+)
 from datetime import datetime
 import pandas as pd
 import os
-from io import BytesIO
 
 api_metal_price_bp = Blueprint('api_metal_price', __name__, url_prefix='/api/metal-prices')
 
-@cache_service.cache_query_result('latest_metal_prices', CACHE_TIMEOUT['MEDIUM'])
+@cache_service.cache_query_result('latest_metal_prices', CACHE_TIMEOUT['LONG'], tags=[MetalPrice.__tablename__],
+                                   stale_ttl=CACHE_TIMEOUT['MEDIUM'])
 def get_latest_metal_prices_cached(metal_type=None, limit=10):
     """获取最新金属价格（带缓存）"""
     query = MetalPrice.query
@@ -22,7 +28,7 @@ def get_latest_metal_prices_cached(metal_type=None, limit=10):
 
 @api_metal_price_bp.route('/', methods=['GET'])
 @login_required
-@cache_service.cache_query_result('metal_prices_list', CACHE_TIMEOUT['MEDIUM'])
+@cache_response('metal_prices_list', CACHE_TIMEOUT['LONG'], tags=[MetalPrice.__tablename__], vary_on_user=False)
 def get_metal_prices():
     """获取金属价格列表"""
     # 获取筛选参数
@@ -115,9 +121,13 @@ def create_metal_price():
     except ValueError:
         return jsonify({'error': '价格字段必须是有效的数字'}), 400
     
+    metal_type = data.get('metal_type', '1#锌')
+    if price_key_exists(metal_type, quote_date):
+        return jsonify({'error': '该金属种类在该日期已有报价'}), 400
+    
     # 创建记录
     metal_price = MetalPrice(
-        metal_type=data.get('metal_type', '1#锌'),
+        metal_type=metal_type,
         quote_date=quote_date,
         high_price=high_price,
         low_price=low_price,
@@ -199,6 +209,9 @@ def update_metal_price(price_id):
         except ValueError:
             return jsonify({'error': '最低价必须是有效的数字'}), 400
     
+    if price_key_exists(metal_price.metal_type, metal_price.quote_date, exclude_id=metal_price.id):
+        return jsonify({'error': '该金属种类在该日期已有报价'}), 400
+    
     db.session.commit()
     
     return jsonify(metal_price.to_dict())
@@ -243,37 +256,9 @@ def export_metal_prices():
         except ValueError:
             pass
     
-    # 获取数据
-    prices = query.order_by(MetalPrice.quote_date.desc()).all()
-    
-    # 转换为DataFrame
-    data = []
-    for price in prices:
-        data.append({
-            '金属种类': price.metal_type,
-            '报价日期': price.quote_date.strftime('%Y-%m-%d') if price.quote_date else '',
-            '最高价': price.high_price,
-            '最低价': price.low_price,
-            '均价': price.average_price,
-            '涨跌': price.price_change
-        })
-    
-    df = pd.DataFrame(data)
-    
-    # 创建Excel文件
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='金属价格')
-    
-    output.seek(0)
-    
-    # 返回Excel文件
-    from flask import Response
-    return Response(
-        output.getvalue(),
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        headers={'Content-Disposition': 'attachment; filename=metal_prices.xlsx'}
-    )
+    # 只查询导出列，流式写出
+    headers, query = metal_price_export(query.order_by(MetalPrice.quote_date.desc()))
+    return export_service.export_response(headers, query, 'metal_prices', sheet_name='金属价格')
 
 @api_metal_price_bp.route('/import', methods=['POST'])
 @login_required
@@ -295,71 +280,23 @@ def import_metal_prices():
         df = pd.read_excel(file)
         
         # 检查必需字段
-        required_columns = ['金属种类', '报价日期', '均价', '涨跌']
-        for col in required_columns:
+        for col in METAL_PRICE_REQUIRED_COLUMNS:
             if col not in df.columns:
                 return jsonify({'error': f'缺少必需列: {col}'}), 400
         
-        # 处理数据
-        created_count = 0
-        errors = []
-        
-        for index, row in df.iterrows():
-            try:
-                # 检查必填字段
-                if pd.isna(row['报价日期']) or pd.isna(row['均价']) or pd.isna(row['涨跌']):
-                    errors.append(f'第{index+1}行: 必填字段不能为空')
-                    continue
-                
-                # 处理日期
-                if isinstance(row['报价日期'], str):
-                    quote_date = datetime.strptime(row['报价日期'], '%Y-%m-%d').date()
-                else:
-                    quote_date = row['报价日期'].date()
-                
-                # 处理数值
-                average_price = float(row['均价'])
-                price_change = float(row['涨跌'])
-                
-                # 处理可选字段
-                high_price = float(row['最高价']) if '最高价' in df.columns and not pd.isna(row['最高价']) else average_price
-                low_price = float(row['最低价']) if '最低价' in df.columns and not pd.isna(row['最低价']) else average_price
-                
-                # 验证逻辑：最高价应大于等于最低价
-                if high_price < low_price:
-                    errors.append(f'第{index+1}行: 最高价不能低于最低价')
-                    continue
-                    
-                # 验证逻辑：均价应在最高价和最低价之间
-                if '最高价' in df.columns and not pd.isna(row['最高价']) and average_price > high_price:
-                    errors.append(f'第{index+1}行: 均价不能高于最高价')
-                    continue
-                    
-                if '最低价' in df.columns and not pd.isna(row['最低价']) and average_price < low_price:
-                    errors.append(f'第{index+1}行: 均价不能低于最低价')
-                    continue
-                
-                # 创建记录
-                metal_price = MetalPrice(
-                    metal_type=row['金属种类'] if not pd.isna(row['金属种类']) else '1#锌',
-                    quote_date=quote_date,
-                    high_price=high_price,
-                    low_price=low_price,
-                    average_price=average_price,
-                    price_change=price_change
-                )
-                
-                db.session.add(metal_price)
-                created_count += 1
-            except Exception as e:
-                errors.append(f'第{index+1}行: {str(e)}')
-        
+        # 按列校验，存在错误行时不导入任何数据
+        prices, errors = prepare_metal_prices(df)
         if errors:
-            db.session.rollback()
             return jsonify({'error': '导入过程中出现错误', 'details': errors}), 400
         
+        # 按(金属种类, 报价日期)新增或更新
+        created_count, updated_count = upsert_metal_prices(prices)
         db.session.commit()
-        return jsonify({'message': f'成功导入{created_count}条记录'})
+        return jsonify({
+            'message': f'成功导入{created_count + updated_count}条记录（新增{created_count}条，更新{updated_count}条）',
+            'created': created_count,
+            'updated': updated_count
+        })
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'导入失败: {str(e)}'}), 500
@@ -368,29 +305,4 @@ def import_metal_prices():
 @login_required
 def download_template():
     """下载Excel模板"""
-    # 创建模板数据
-    data = [{
-        '金属种类': '1#锌',
-        '报价日期': '2023-01-01',
-        '最高价': 25000,
-        '最低价': 24000,
-        '均价': 24500,
-        '涨跌': 100
-    }]
-    
-    df = pd.DataFrame(data)
-    
-    # 创建Excel文件
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='金属价格模板')
-    
-    output.seek(0)
-    
-    # 返回Excel文件
-    from flask import Response
-    return Response(
-        output.getvalue(),
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        headers={'Content-Disposition': 'attachment; filename=metal_price_template.xlsx'}
-    )
\ No newline at end of file
+    return template_manager.send_template('metal_price')
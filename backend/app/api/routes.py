@@ -33,6 +33,7 @@ from app.api import vehicle
 from flask import jsonify, request
 from app.api import api_bp
 from app import db
+from app.utils.factory_scope import get_user_factory_ids
 from datetime import datetime
 import logging
 from flask_login import current_user
@@ -57,8 +58,7 @@ def delete_production_record(record_id):
     
     # 检查权限
     if not current_user.has_permission('assay_data_read_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if record.factory_id not in factory_ids:
             return jsonify({'error': '您没有权限删除此记录'}), 403
     
@@ -77,8 +77,7 @@ def update_production_record_status(record_id):
     
     # 检查权限
     if not current_user.has_permission('assay_data_read_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if record.factory_id not in factory_ids:
             return jsonify({'error': '您没有权限更新此记录状态'}), 403
     
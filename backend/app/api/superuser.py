@@ -128,7 +128,7 @@ def check_superuser_status(user_id):
                 'is_superuser': user.is_superuser,
                 'is_active': user.is_active,
                 'roles': [role.name for role in user.roles],
-                'permission_count': len(user.get_all_permissions())
+                'permission_count': len(user.get_permission_names())
             }
         })
     except Exception as e:
@@ -6,7 +6,7 @@ class AssayData(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     sample_name = db.Column(db.String(100), nullable=False, comment='样品名称')
-    factory_id = db.Column(db.Integer, nullable=False, comment='分厂ID')
+    factory_id = db.Column(db.Integer, nullable=False, index=True, comment='分厂ID')
     
     # 常用指标
     water_content = db.Column(db.Float, comment='水含量')
@@ -29,7 +29,7 @@ class AssayData(db.Model):
     
     # 关联信息
     created_by = db.Column(db.Integer, comment='创建人ID')
-    created_at = db.Column(db.DateTime, default=datetime.now, comment='创建时间')
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True, comment='创建时间')
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
     
     def __repr__(self):
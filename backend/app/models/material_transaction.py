@@ -25,7 +25,7 @@ class MaterialTransaction(db.Model):
     updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())  # 更新时间
     
     # 分工协作支持字段
-    status = db.Column(db.String(20), default='draft')  # 记录状态: draft(草稿), weighing(过磅完成), assaying(化验完成), completed(完成)
+    status = db.Column(db.String(20), default='draft', index=True)  # 记录状态（添加索引用于状态筛选）: draft(草稿), weighing(过磅完成), assaying(化验完成), completed(完成)
     weighing_completed = db.Column(db.Boolean, default=False)  # 过磅数据是否完成
     assaying_completed = db.Column(db.Boolean, default=False)  # 化验数据是否完成
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))  # 创建人ID
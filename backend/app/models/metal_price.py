@@ -3,6 +3,10 @@ from datetime import datetime
 
 class MetalPrice(db.Model):
     __tablename__ = 'metal_prices'
+    __table_args__ = (
+        # 同一金属种类每天只有一条报价，导入时按此键新增或更新
+        db.Index('uq_metal_prices_type_date', 'metal_type', 'quote_date', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     metal_type = db.Column(db.String(50), default='1#锌', index=True)  # 金属种类 - 添加索引用于金属搜索
@@ -1,4 +1,5 @@
 from app import db
+from app.utils.cache_hooks import mark_tables_changed
 
 class Role(db.Model):
     __tablename__ = 'roles'
@@ -61,6 +62,8 @@ class Role(db.Model):
                 text("INSERT INTO role_permissions (role_id, permission_id) VALUES (:role_id, :permission_id)"),
                 {'role_id': self.id, 'permission_id': permission_id}
             )
+            # 原生SQL不经过flush，需显式登记变更以便提交后刷新权限缓存
+            mark_tables_changed(db.session, 'role_permissions')
     
     def remove_permission(self, permission):
         """为角色移除权限"""
@@ -84,6 +87,77 @@ class Role(db.Model):
             text("DELETE FROM role_permissions WHERE role_id = :role_id AND permission_id = :permission_id"),
             {'role_id': self.id, 'permission_id': permission_id}
         )
+        mark_tables_changed(db.session, 'role_permissions')
+
+    def get_permission_ids(self):
+        """一次查询获取角色已有的全部权限ID"""
+        from sqlalchemy import text
+        
+        rows = db.session.execute(
+            text("SELECT permission_id FROM role_permissions WHERE role_id = :role_id"),
+            {'role_id': self.id}
+        )
+        return {row[0] for row in rows}
+    
+    @staticmethod
+    def _resolve_permission_ids(permissions):
+        """将权限名、Permission对象或权限ID统一转换为权限ID集合（权限名一次查询解析）"""
+        from sqlalchemy import text, bindparam
+        
+        permission_ids = set()
+        names = []
+        for permission in permissions:
+            if isinstance(permission, str):
+                names.append(permission)
+            elif isinstance(permission, int):
+                permission_ids.add(permission)
+            else:
+                permission_ids.add(permission.id)
+        if names:
+            stmt = text("SELECT id FROM permissions WHERE name IN :names").bindparams(bindparam('names', expanding=True))
+            permission_ids.update(row[0] for row in db.session.execute(stmt, {'names': names}))
+        return permission_ids
+    
+    def _insert_permission_ids(self, permission_ids):
+        """一条多行INSERT写入角色权限关联"""
+        from app.models.permission import RolePermission
+        
+        if not permission_ids:
+            return 0
+        db.session.execute(
+            RolePermission.__table__.insert(),
+            [{'role_id': self.id, 'permission_id': permission_id} for permission_id in sorted(permission_ids)]
+        )
+        mark_tables_changed(db.session, 'role_permissions')
+        return len(permission_ids)
+    
+    def _delete_permission_ids(self, permission_ids):
+        """一条DELETE语句删除角色权限关联"""
+        from sqlalchemy import text, bindparam
+        
+        if not permission_ids:
+            return 0
+        stmt = text(
+            "DELETE FROM role_permissions WHERE role_id = :role_id AND permission_id IN :permission_ids"
+        ).bindparams(bindparam('permission_ids', expanding=True))
+        result = db.session.execute(stmt, {'role_id': self.id, 'permission_ids': sorted(permission_ids)})
+        mark_tables_changed(db.session, 'role_permissions')
+        return result.rowcount
+    
+    def add_permissions(self, permissions):
+        """批量添加权限（权限名、Permission对象或ID），只写入缺少的权限，返回新增数量"""
+        to_add = self._resolve_permission_ids(permissions) - self.get_permission_ids()
+        return self._insert_permission_ids(to_add)
+    
+    def remove_permissions(self, permissions):
+        """批量移除权限，返回删除数量"""
+        return self._delete_permission_ids(self._resolve_permission_ids(permissions))
+    
+    def set_permissions(self, permissions):
+        """将角色权限设置为给定集合，只增删差异部分，返回 (新增数量, 删除数量)"""
+        target = self._resolve_permission_ids(permissions)
+        current = self.get_permission_ids()
+        return self._insert_permission_ids(target - current), self._delete_permission_ids(current - target)
 
 class UserRole(db.Model):
     __tablename__ = 'user_roles'
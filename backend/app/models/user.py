@@ -26,11 +26,9 @@ class User(UserMixin, db.Model):
         if self.is_superuser:
             return True
         
-        # 普通用户通过角色权限检查
-        for role in self.roles:
-            if role.has_permission(permission):
-                return True
-        return False
+        # 普通用户使用预先加载的权限集合（请求内及跨请求缓存）
+        from app.utils.permission_service import user_has_permission
+        return user_has_permission(self, permission)
     
     def has_role(self, role_name):
         """检查用户是否具有特定角色"""
@@ -38,23 +36,25 @@ class User(UserMixin, db.Model):
     
     
     def get_all_permissions(self):
-        """获取用户的所有权限"""
-        from app.models.permission import Permission, RolePermission
+        """获取用户的所有权限（单次联表查询）"""
+        from app.models.permission import Permission
         
         # 超级管理员拥有所有权限
         if self.is_superuser:
             return Permission.query.all()
         
         # 普通用户通过角色获取权限
-        permissions = set()
-        for role in self.roles:
-            # 通过RolePermission中间表获取权限
-            role_perms = RolePermission.query.filter_by(role_id=role.id).all()
-            for rp in role_perms:
-                permission = Permission.query.get(rp.permission_id)
-                if permission:
-                    permissions.add(permission)
-        return list(permissions)
+        from app.utils.permission_service import resolve_permissions
+        return resolve_permissions(self.id)
+    
+    def get_permission_names(self):
+        """获取用户的所有权限名（使用缓存的权限集合）"""
+        if self.is_superuser:
+            from app.models.permission import Permission
+            return frozenset(name for (name,) in db.session.query(Permission.name))
+        
+        from app.utils.permission_service import get_permission_set
+        return get_permission_set(self)
     
     def set_superuser(self, is_superuser=True):
         """设置/取消超级管理员状态"""
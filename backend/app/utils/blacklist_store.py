@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Token黑名单存储
+每次撤销只写入对应条目，批量撤销在一个事务/管道中完成，各worker共享：
+- SQLiteBlacklistStore：实例目录下的SQLite文件（WAL模式），同一主机的多个worker共享
+- RedisBlacklistStore：条目按保留截止时间自动过期，适用于多主机部署
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (jti, 元数据, 保留截止时间戳)
+BlacklistEntry = Tuple[str, dict, float]
+
+
+class SQLiteBlacklistStore:
+    """SQLite黑名单存储"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # 每个线程使用独立连接，fork后的子进程重新连接
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS token_blacklist ('
+                'jti TEXT PRIMARY KEY, user_id INTEGER, metadata TEXT NOT NULL, retain_until REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_token_blacklist_user_id ON token_blacklist (user_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_token_blacklist_retain_until ON token_blacklist (retain_until)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def location(self) -> str:
+        return self.path
+
+    def add_many(self, entries: Iterable[BlacklistEntry], replace: bool = False) -> None:
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        rows = [(jti, metadata.get('user_id'), json.dumps(metadata, ensure_ascii=False), retain_until)
+                for jti, metadata, retain_until in entries]
+        with self._connect() as conn:
+            conn.executemany(
+                f'{verb} INTO token_blacklist (jti, user_id, metadata, retain_until) VALUES (?, ?, ?, ?)', rows
+            )
+
+    def remove(self, jti: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM token_blacklist WHERE jti = ?', (jti,)).rowcount > 0
+
+    def contains(self, jti: str) -> bool:
+        return self._connect().execute('SELECT 1 FROM token_blacklist WHERE jti = ?', (jti,)).fetchone() is not None
+
+    def get(self, jti: str) -> Optional[dict]:
+        row = self._connect().execute('SELECT metadata FROM token_blacklist WHERE jti = ?', (jti,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count(self) -> int:
+        return self._connect().execute('SELECT COUNT(*) FROM token_blacklist').fetchone()[0]
+
+    def user_entries(self, user_id: int) -> List[Tuple[str, dict]]:
+        rows = self._connect().execute('SELECT jti, metadata FROM token_blacklist WHERE user_id = ?', (user_id,))
+        return [(jti, json.loads(metadata)) for jti, metadata in rows]
+
+    def remove_expired(self, now: float) -> int:
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM token_blacklist WHERE retain_until <= ?', (now,)).rowcount
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute('DELETE FROM token_blacklist')
+
+    def export(self) -> Dict[str, dict]:
+        rows = self._connect().execute('SELECT jti, metadata FROM token_blacklist')
+        return {jti: json.loads(metadata) for jti, metadata in rows}
+
+
+class RedisBlacklistStore:
+    """Redis黑名单存储
+
+    - <前缀>:<jti>：条目元数据，保留截止时间到期后由Redis删除
+    - <前缀>:all、<前缀>:user:<用户ID>：索引（有序集合，分值为保留截止时间），用于统计、导出和按用户查询；
+      过期成员在写入、读取和定期清理时按分值区间移除
+    """
+
+    def __init__(self, client, prefix: str = 'jwt_blacklist'):
+        self.client = client
+        self.prefix = prefix
+        self._all_key = f"{prefix}:all"
+
+    def _key(self, jti: str) -> str:
+        return f"{self.prefix}:{jti}"
+
+    def _user_key(self, user_id) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    def location(self) -> str:
+        return f"redis:{self.prefix}"
+
+    def add_many(self, entries: Iterable[BlacklistEntry], replace: bool = False) -> None:
+        now = time.time()
+        pruned = set()
+        pipe = self.client.pipeline()
+        for jti, metadata, retain_until in entries:
+            pipe.set(self._key(jti), json.dumps(metadata, ensure_ascii=False),
+                     pxat=int(retain_until * 1000), nx=not replace)
+            pipe.zadd(self._all_key, {jti: retain_until})
+            user_id = metadata.get('user_id')
+            if user_id:
+                # 顺带按分值区间移除该用户索引中已过期的成员
+                if user_id not in pruned:
+                    pipe.zremrangebyscore(self._user_key(user_id), '-inf', now)
+                    pruned.add(user_id)
+                pipe.zadd(self._user_key(user_id), {jti: retain_until})
+        pipe.execute()
+
+    def remove(self, jti: str) -> bool:
+        metadata = self.get(jti)
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(jti))
+        pipe.zrem(self._all_key, jti)
+        if metadata and metadata.get('user_id'):
+            pipe.zrem(self._user_key(metadata['user_id']), jti)
+        return pipe.execute()[0] > 0
+
+    def contains(self, jti: str) -> bool:
+        return bool(self.client.exists(self._key(jti)))
+
+    def get(self, jti: str) -> Optional[dict]:
+        data = self.client.get(self._key(jti))
+        return json.loads(data) if data else None
+
+    def count(self) -> int:
+        return self.client.zcount(self._all_key, f"({time.time()}", '+inf')
+
+    def _load(self, jtis: List[str]) -> List[Tuple[str, dict]]:
+        if not jtis:
+            return []
+        values = self.client.mget([self._key(jti) for jti in jtis])
+        return [(jti, json.loads(value)) for jti, value in zip(jtis, values) if value]
+
+    def user_entries(self, user_id: int) -> List[Tuple[str, dict]]:
+        user_key = self._user_key(user_id)
+        self.client.zremrangebyscore(user_key, '-inf', time.time())
+        return self._load(self.client.zrange(user_key, 0, -1))
+
+    def remove_expired(self, now: float) -> int:
+        # 条目由Redis自动过期，这里只清理全部条目索引；用户索引在读取时清理
+        return self.client.zremrangebyscore(self._all_key, '-inf', now)
+
+    def clear(self) -> None:
+        for _, metadata in self.export().items():
+            if metadata.get('user_id'):
+                self.client.delete(self._user_key(metadata['user_id']))
+        jtis = self.client.zrange(self._all_key, 0, -1)
+        for start in range(0, len(jtis), 500):
+            self.client.delete(*[self._key(jti) for jti in jtis[start:start + 500]])
+        self.client.delete(self._all_key)
+
+    def export(self) -> Dict[str, dict]:
+        return dict(self._load(self.client.zrangebyscore(self._all_key, f"({time.time()}", '+inf')))
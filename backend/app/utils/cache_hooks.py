@@ -1,18 +1,88 @@
 from flask import current_app
+from sqlalchemy import event, inspect
 from app.utils.cache_service import cache_service
 
+# session.info中记录本次事务涉及的表名（缓存标签）
+PENDING_TAGS_KEY = 'cache_invalidation_tags'
+
+# 表变更提交后的回调：[(关注的表名集合, 回调函数)]
+_commit_listeners = []
+
+def on_tables_committed(tables, callback):
+    """注册回调：事务提交且涉及tables中任一表时调用callback(变更的表名集合)"""
+    _commit_listeners.append((frozenset(tables), callback))
+
+def mark_tables_changed(session, *tables):
+    """登记本事务中变更的表，提交后失效对应标签
+
+    批量写入（bulk_insert_mappings、Core insert/update）不会出现在flush的对象集合中，
+    需要调用方显式登记。
+    """
+    session.info.setdefault(PENDING_TAGS_KEY, set()).update(tables)
+
+def _changed_secondary_tables(obj):
+    """对象上有变更的多对多关系集合对应的关联表（如通过user.roles修改角色时的user_roles）"""
+    state = inspect(obj)
+    return {
+        relationship.secondary.name
+        for relationship in state.mapper.relationships
+        if relationship.secondary is not None and state.attrs[relationship.key].history.has_changes()
+    }
+
+def _collect_flushed_tables(session, flush_context):
+    """flush后收集新增、修改、删除对象所属的表，以及通过关系集合修改的关联表"""
+    tables = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table_name = getattr(obj, '__tablename__', None)
+        if table_name:
+            tables.add(table_name)
+            tables.update(_changed_secondary_tables(obj))
+    if tables:
+        mark_tables_changed(session, *tables)
+
+def _collect_bulk_tables(update_context):
+    """Query.update()/Query.delete()批量操作涉及的表"""
+    mapper = getattr(update_context, 'mapper', None)
+    if mapper is not None:
+        mark_tables_changed(update_context.session, mapper.local_table.name)
+
+def _invalidate_committed_tables(session):
+    """事务提交后按表名标签失效缓存"""
+    tables = session.info.pop(PENDING_TAGS_KEY, None)
+    if not tables:
+        return
+    if cache_service.enabled:
+        cache_service.invalidate_tags(*tables)
+    for watched_tables, callback in _commit_listeners:
+        if watched_tables & tables:
+            callback(tables)
+
+def _discard_pending_tables(session):
+    """事务回滚时丢弃已登记的表"""
+    session.info.pop(PENDING_TAGS_KEY, None)
+
 def setup_cache_invalidation_hooks():
-    """简化的缓存管理（小系统适用）"""
-    # 对于小系统，使用简单的手动缓存清理
-    # 或者设置较短的缓存时间来避免复杂的自动失效机制
-    current_app.logger.info("缓存服务已启用，使用简化的缓存管理策略")
-    
+    """注册基于表名标签的缓存失效钩子
+
+    缓存写入时以表名作为标签（cache_service.set(..., tags=[...])），
+    事务提交后只失效本次flush涉及的表对应的缓存。
+    """
+    from app import db
+
+    if not event.contains(db.session, 'after_flush', _collect_flushed_tables):
+        event.listen(db.session, 'after_flush', _collect_flushed_tables)
+        event.listen(db.session, 'after_bulk_update', _collect_bulk_tables)
+        event.listen(db.session, 'after_bulk_delete', _collect_bulk_tables)
+        event.listen(db.session, 'after_commit', _invalidate_committed_tables)
+        event.listen(db.session, 'after_rollback', _discard_pending_tables)
+    current_app.logger.info("缓存服务已启用，使用表名标签自动失效缓存")
+
     # 提供手动清理缓存的方法
     def clear_cache_manually():
         """手动清理所有缓存"""
         if cache_service.enabled:
             cache_service.clear_all()
             current_app.logger.info("手动清理缓存完成")
-    
+
     # 将清理方法添加到应用上下文
-    current_app.clear_cache = clear_cache_manually
\ No newline at end of file
+    current_app.clear_cache = clear_cache_manually
@@ -1,10 +1,28 @@
 import redis
 import json
 import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import timedelta
 from flask import current_app
-from typing import Any, Optional, Dict, List
+from typing import Any, Optional, Dict, List, Iterable
 from functools import wraps
+from app.utils.local_cache import LocalCache, MISSING
+
+# 标签集合的键前缀：cache:tag:<标签名> 保存该标签下的所有缓存键
+TAG_KEY_PREFIX = 'cache:tag:'
+# 一级缓存跨进程失效通知频道
+INVALIDATION_CHANNEL = 'cache:invalidate'
+# 单飞锁键前缀：同一缓存键同一时间只有一个进程重新计算
+LOCK_KEY_PREFIX = 'cache:lock:'
+# 过期后仍可返回旧值模式下，缓存值包装中记录新鲜截止时间的字段
+SWR_FRESH_UNTIL = '__fresh_until__'
+
+logger = logging.getLogger(__name__)
 
 class CacheService:
     """Redis缓存服务"""
@@ -12,6 +30,14 @@ class CacheService:
     def __init__(self):
         self.redis_client = None
         self.enabled = False
+        # 进程内一级缓存（可选），通过Redis发布订阅跨进程失效
+        self.local_cache = None
+        self._instance_id = uuid.uuid4().hex
+        self._subscriber_pid = None
+        self._subscriber_lock = threading.Lock()
+        # 进程内按键的锁：缓存键 -> [锁, 引用数]，无人使用时移除；Redis锁不可用时仍能合并同一进程内的并发计算
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
     
     def init_app(self, app):
         """初始化Redis连接"""
@@ -25,11 +51,84 @@ class CacheService:
         except Exception as e:
             app.logger.warning(f"Redis连接失败，缓存功能已禁用: {e}")
             self.enabled = False
+        
+        # 一级缓存依赖Redis发布订阅保证各进程一致，Redis不可用时不启用
+        if self.enabled and app.config.get('CACHE_L1_ENABLED', False):
+            self.local_cache = LocalCache(
+                max_items=app.config.get('CACHE_L1_MAX_ITEMS', 1000),
+                max_ttl=app.config.get('CACHE_L1_MAX_TTL', 60),
+                prefix_limits=app.config.get('CACHE_L1_PREFIX_LIMITS')
+            )
+            app.logger.info("进程内一级缓存已启用")
+    
+    def _origin(self) -> str:
+        """当前进程标识（fork后的子进程共享实例ID，需要加上进程号区分）"""
+        return f"{self._instance_id}:{os.getpid()}"
+    
+    def _ensure_subscriber(self):
+        """在当前进程中订阅失效通知（gunicorn预加载后fork的进程需要重新订阅）"""
+        if self._subscriber_pid == os.getpid():
+            return
+        with self._subscriber_lock:
+            if self._subscriber_pid == os.getpid():
+                return
+            # fork前继承的一级缓存条目可能已错过失效通知
+            self.local_cache.clear()
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: self._handle_invalidation})
+            pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=self._handle_subscriber_error)
+            self._subscriber_pid = os.getpid()
+    
+    def _handle_invalidation(self, message):
+        """处理其他进程发布的失效通知"""
+        try:
+            payload = json.loads(message['data'])
+        except (TypeError, ValueError):
+            return
+        if payload.get('origin') == self._origin():
+            return
+        if payload.get('all'):
+            self.local_cache.clear()
+        else:
+            self.local_cache.delete(payload.get('keys', []))
+    
+    def _handle_subscriber_error(self, exc, pubsub, thread):
+        """订阅连接异常时清空一级缓存，并在下次读取时重新订阅"""
+        logger.warning(f"缓存失效订阅中断，一级缓存已清空: {exc}")
+        thread.stop()
+        pubsub.close()
+        self.local_cache.clear()
+        self._subscriber_pid = None
+    
+    def _invalidate_local(self, keys: Optional[Iterable[str]] = None):
+        """删除本进程一级缓存并通知其他进程，keys为None表示全部清空"""
+        if self.local_cache is None:
+            return
+        if keys is None:
+            self.local_cache.clear()
+            payload = {'origin': self._origin(), 'all': True}
+        else:
+            keys = list(keys)
+            if not keys:
+                return
+            self.local_cache.delete(keys)
+            payload = {'origin': self._origin(), 'keys': keys}
+        try:
+            self.redis_client.publish(INVALIDATION_CHANNEL, json.dumps(payload))
+        except Exception as e:
+            current_app.logger.error(f"缓存失效通知发布失败: {e}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存统计信息（一级缓存各前缀的命中率、条目数等）"""
+        return {
+            'enabled': self.enabled,
+            'local_cache': self.local_cache.get_stats() if self.local_cache is not None else None
+        }
     
     def _generate_key(self, prefix: str, **kwargs) -> str:
         """生成缓存键"""
         key_data = json.dumps(kwargs, sort_keys=True, default=str)
-        key_hash = hashlib.md5(key_data.encode()).hexdigest()[:8]
+        key_hash = hashlib.sha256(key_data.encode()).hexdigest()
         return f"{prefix}:{key_hash}"
     
     def get(self, key: str) -> Optional[Any]:
@@ -37,32 +136,114 @@ class CacheService:
         if not self.enabled:
             return None
         
+        if self.local_cache is not None:
+            self._ensure_subscriber()
+            value = self.local_cache.get(key)
+            if value is not MISSING:
+                return value
+        
         try:
-            data = self.redis_client.get(key)
+            if self.local_cache is None:
+                data = self.redis_client.get(key)
+                if data:
+                    return json.loads(data)
+                return None
+            
+            # 同时读取剩余有效期，一级缓存条目不晚于Redis过期
+            data, ttl = self.redis_client.pipeline().get(key).ttl(key).execute()
             if data:
-                return json.loads(data)
+                value = json.loads(data)
+                # ttl为-1表示键未设置过期（如版本号计数器），按一级缓存最长时间保存
+                if ttl == -1 or (ttl and ttl > 0):
+                    self.local_cache.set(key, value, ttl if ttl > 0 else self.local_cache.max_ttl)
+                return value
         except Exception as e:
             current_app.logger.error(f"缓存获取失败: {e}")
         return None
     
-    def set(self, key: str, value: Any, expire: int = 300) -> bool:
-        """设置缓存"""
+    def set(self, key: str, value: Any, expire: int = 300, tags: Optional[Iterable[str]] = None) -> bool:
+        """设置缓存
+        
+        Args:
+            tags: 缓存所属标签（通常为表名），标签失效时该缓存一并删除
+        """
         if not self.enabled:
             return False
         
         try:
             data = json.dumps(value, default=str)
-            return self.redis_client.setex(key, expire, data)
+            tag_keys = [f"{TAG_KEY_PREFIX}{tag}" for tag in tags or ()]
+            tag_ttls = []
+            if tag_keys:
+                # 一次往返读取各标签集合的剩余时间
+                pipe = self.redis_client.pipeline()
+                for tag_key in tag_keys:
+                    pipe.ttl(tag_key)
+                tag_ttls = pipe.execute()
+            pipe = self.redis_client.pipeline()
+            pipe.setex(key, expire, data)
+            for tag_key, tag_ttl in zip(tag_keys, tag_ttls):
+                pipe.sadd(tag_key, key)
+                # 标签集合至少与其中的缓存键存活同样久，避免残留
+                pipe.expire(tag_key, max(expire, tag_ttl or 0))
+            result = bool(pipe.execute()[0])
+            if result and self.local_cache is not None:
+                # 其他进程中同一键的旧值失效，本进程写入新值
+                self._invalidate_local([key])
+                self.local_cache.set(key, value, expire)
+            return result
         except Exception as e:
             current_app.logger.error(f"缓存设置失败: {e}")
             return False
     
+    def invalidate_tags(self, *tags: str) -> int:
+        """按标签失效缓存，返回删除的缓存键数量"""
+        if not self.enabled or not tags:
+            return 0
+        
+        try:
+            tag_keys = [f"{TAG_KEY_PREFIX}{tag}" for tag in tags]
+            pipe = self.redis_client.pipeline()
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+            members_by_tag = pipe.execute()
+            keys = set()
+            for members in members_by_tag:
+                keys.update(members)
+            if keys:
+                # 只移除读取到的成员：期间新写入并加入标签的缓存键仍保留在标签集合中
+                pipe = self.redis_client.pipeline()
+                pipe.delete(*keys)
+                for tag_key, members in zip(tag_keys, members_by_tag):
+                    if members:
+                        pipe.srem(tag_key, *members)
+                pipe.execute()
+            self._invalidate_local(keys)
+            return len(keys)
+        except Exception as e:
+            current_app.logger.error(f"按标签失效缓存失败: {e}")
+            return 0
+    
+    def incr(self, key: str) -> Optional[int]:
+        """原子递增计数器（用于版本号），返回新值"""
+        if not self.enabled:
+            return None
+        
+        try:
+            value = self.redis_client.incr(key)
+            self._invalidate_local([key])
+            return value
+        except Exception as e:
+            current_app.logger.error(f"缓存计数递增失败: {e}")
+            return None
+    
     def delete(self, key: str) -> bool:
         """删除缓存"""
         if not self.enabled:
             return False
         
         try:
+            self._invalidate_local([key])
             return bool(self.redis_client.delete(key))
         except Exception as e:
             current_app.logger.error(f"缓存删除失败: {e}")
@@ -75,13 +256,89 @@ class CacheService:
         
         try:
             self.redis_client.flushdb()
+            self._invalidate_local()
             return True
         except Exception as e:
             current_app.logger.error(f"清除缓存失败: {e}")
             return False
     
-    def cache_query_result(self, prefix: str, expire: int = 300):
-        """简单查询结果缓存装饰器"""
+    @contextmanager
+    def single_flight(self, key: str, timeout: int = 30, wait: float = 10, blocking: bool = True):
+        """同一缓存键的重新计算互斥锁，yield是否获得锁
+        
+        先获取该键的进程内锁合并本进程线程，再获取Redis锁合并各worker；
+        Redis锁异常时退化为仅使用进程内锁。不同的键互不阻塞。
+        """
+        with self._key_locks_guard:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        local_lock = entry[0]
+        local_acquired = False
+        try:
+            local_acquired = local_lock.acquire(blocking, wait if blocking else -1)
+            if not local_acquired:
+                yield False
+                return
+            redis_lock = None
+            try:
+                redis_lock = self.redis_client.lock(
+                    f"{LOCK_KEY_PREFIX}{key}", timeout=timeout,
+                    blocking=blocking, blocking_timeout=wait if blocking else None
+                )
+                acquired = redis_lock.acquire()
+            except Exception as e:
+                current_app.logger.warning(f"缓存锁获取失败，使用进程内锁: {e}")
+                redis_lock = None
+                acquired = True
+            try:
+                yield acquired
+            finally:
+                if redis_lock is not None and acquired:
+                    try:
+                        redis_lock.release()
+                    except Exception:
+                        # 计算超过锁超时时间，锁已自动释放
+                        pass
+        finally:
+            if local_acquired:
+                local_lock.release()
+            with self._key_locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+    
+    def cache_query_result(self, prefix: str, expire: int = 300, tags: Optional[Iterable[str]] = None,
+                           stale_ttl: int = 0, lock_timeout: int = 30, lock_wait: float = 10):
+        """简单查询结果缓存装饰器
+        
+        缓存未命中时只有一个请求执行查询，其余请求等待其结果（单飞）。
+        
+        Args:
+            tags: 结果依赖的表名，相关表提交变更后缓存自动失效
+            stale_ttl: 过期后仍可返回旧值的秒数，期间由一个请求刷新，其余请求直接返回旧值
+            lock_timeout: 单飞锁自动释放时间（秒）
+            lock_wait: 未命中时等待其他请求计算结果的最长时间（秒），超时后自行查询
+        """
+        def unwrap(entry):
+            """返回 (缓存值, 是否新鲜)，未命中返回 (None, False)"""
+            if entry is None:
+                return None, False
+            if not stale_ttl:
+                return entry, True
+            if not isinstance(entry, dict) or SWR_FRESH_UNTIL not in entry:
+                return None, False
+            return entry['value'], entry[SWR_FRESH_UNTIL] > time.time()
+        
+        def compute_and_store(cache_key, func, args, kwargs):
+            result = func(*args, **kwargs)
+            if result is not None:
+                if stale_ttl:
+                    entry = {SWR_FRESH_UNTIL: time.time() + expire, 'value': result}
+                    self.set(cache_key, entry, expire + stale_ttl, tags=tags)
+                else:
+                    self.set(cache_key, result, expire, tags=tags)
+            return result
+        
         def decorator(func):
             @wraps(func)
             def wrapper(*args, **kwargs):
@@ -93,18 +350,23 @@ class CacheService:
                 cache_key = self._generate_key(prefix, args=args, kwargs=kwargs)
                 
                 # 尝试从缓存获取
-                cached_result = self.get(cache_key)
-                if cached_result is not None:
-                    return cached_result
-                
-                # 执行查询
-                result = func(*args, **kwargs)
+                value, fresh = unwrap(self.get(cache_key))
+                if fresh:
+                    return value
                 
-                # 缓存结果
-                if result is not None:
-                    self.set(cache_key, result, expire)
+                if value is not None:
+                    # 旧值仍可用：抢到锁的请求刷新，其余请求直接返回旧值
+                    with self.single_flight(cache_key, lock_timeout, blocking=False) as acquired:
+                        if acquired:
+                            return compute_and_store(cache_key, func, args, kwargs)
+                    return value
                 
-                return result
+                # 未命中：等待锁，拿到锁后再检查一次，可能已由其他请求写入
+                with self.single_flight(cache_key, lock_timeout, lock_wait):
+                    value, fresh = unwrap(self.get(cache_key))
+                    if fresh:
+                        return value
+                    return compute_and_store(cache_key, func, args, kwargs)
             return wrapper
         return decorator
     
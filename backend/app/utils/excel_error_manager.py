@@ -3,9 +3,8 @@ Excel错误管理器
 处理Excel导入导出过程中的错误
 """
 import pandas as pd
-import os
 from datetime import datetime
-from flask import current_app
+from app.utils.temp_artifact_service import temp_artifact_service
 import logging
 
 # 配置日志
@@ -19,22 +18,20 @@ class ExcelErrorManager:
         """初始化错误管理器"""
         pass
     
-    def generate_error_report(self, errors, filename):
+    def generate_error_report(self, errors, filename, error_matrix=None, owner_id=None):
         """
         生成错误报告
         
         :param errors: 错误列表
         :param filename: 报告文件名
-        :return: 报告文件路径
+        :param error_matrix: 行×列错误矩阵（excel_validator.validate_frame返回），提供时另存为"错误矩阵"工作表
+        :param owner_id: 可下载报告的用户ID
+        :return: 报告文件ID，通过/excel/artifacts/<文件ID>下载
         """
         try:
-            # 创建临时目录
-            temp_dir = os.path.join(current_app.config.get('TEMP_FOLDER', 'excel'), 'errors')
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # 生成文件路径
+            # 生成下载文件名
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            file_path = os.path.join(temp_dir, f"{filename}_错误报告_{timestamp}.xlsx")
+            download_name = f"{filename}_错误报告_{timestamp}.xlsx"
             
             # 创建错误报告DataFrame
             error_data = []
@@ -50,11 +47,18 @@ class ExcelErrorManager:
             
             df = pd.DataFrame(error_data)
             
-            # 保存为Excel文件
-            df.to_excel(file_path, index=False)
+            # 写入缓冲文件后交由临时文件服务保存（过期后自动清理）
+            with temp_artifact_service.spool() as output:
+                with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                    if error_matrix is None:
+                        df.to_excel(writer, index=False)
+                    else:
+                        df.to_excel(writer, sheet_name='错误列表', index=False)
+                        error_matrix.to_excel(writer, sheet_name='错误矩阵')
+                artifact_id = temp_artifact_service.save('errors', output, download_name, owner_id)
             
-            logger.info(f"错误报告生成成功: {file_path}")
-            return file_path
+            logger.info(f"错误报告生成成功: {download_name}")
+            return artifact_id
             
         except Exception as e:
             logger.error(f"生成错误报告时发生错误: {str(e)}")
@@ -0,0 +1,196 @@
+"""
+Excel流式导出服务
+按批读取查询结果，边读边写，内存占用与数据量无关
+"""
+import codecs
+import csv
+import io
+import logging
+from datetime import date, datetime
+from urllib.parse import quote
+from flask import Response, request, stream_with_context
+from openpyxl import Workbook
+from sqlalchemy.orm import aliased
+from app.models.assay_data import AssayData
+from app.models.department import Department
+from app.models.material_transaction import MaterialTransaction
+from app.models.metal_price import MetalPrice
+from app.models.production_record import ProductionRecord
+from app.utils.temp_artifact_service import temp_artifact_service
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+def material_transaction_export(query):
+    """物料进出厂记录导出：(表头, 只查询导出列的查询)"""
+    columns = [
+        ('日期', MaterialTransaction.date),
+        ('客户', MaterialTransaction.customer),
+        ('物料名称', MaterialTransaction.material_name),
+        ('分厂', Department.name),
+        ('合同编号', MaterialTransaction.contract_number),
+        ('类型', MaterialTransaction.transaction_type),
+        ('包装', MaterialTransaction.packaging),
+        ('车号', MaterialTransaction.vehicle_number),
+        ('发数', MaterialTransaction.shipped_quantity),
+        ('到数', MaterialTransaction.received_quantity),
+        ('水含量', MaterialTransaction.water_content),
+        ('锌含量', MaterialTransaction.zinc_content),
+        ('铅含量', MaterialTransaction.lead_content),
+        ('氯含量', MaterialTransaction.chlorine_content),
+        ('氟含量', MaterialTransaction.fluorine_content),
+        ('备注', MaterialTransaction.remarks)
+    ]
+    query = query.outerjoin(Department, Department.id == MaterialTransaction.factory_id)
+    return [header for header, _ in columns], query.with_entities(*(column for _, column in columns))
+
+def production_record_export(query):
+    """产能记录导出：(表头, 只查询导出列的查询)"""
+    factory = aliased(Department)
+    team = aliased(Department)
+    columns = [
+        ('日期', ProductionRecord.date),
+        ('分厂', factory.name),
+        ('班组', team.name),
+        ('物料名称', ProductionRecord.material_name),
+        ('产量', ProductionRecord.quantity),
+        ('水含量', ProductionRecord.water_content),
+        ('锌含量', ProductionRecord.zinc_content),
+        ('铅含量', ProductionRecord.lead_content),
+        ('氯含量', ProductionRecord.chlorine_content),
+        ('氟含量', ProductionRecord.fluorine_content),
+        ('备注', ProductionRecord.remarks)
+    ]
+    query = (query.outerjoin(factory, factory.id == ProductionRecord.factory_id)
+             .outerjoin(team, team.id == ProductionRecord.team_id))
+    return [header for header, _ in columns], query.with_entities(*(column for _, column in columns))
+
+def assay_data_export(query):
+    """化验数据导出：(表头, 只查询导出列的查询)，列与导入模板一致"""
+    columns = [
+        ('样品名称', AssayData.sample_name),
+        ('分厂', Department.name),
+        ('水含量', AssayData.water_content),
+        ('锌含量', AssayData.zinc_content),
+        ('铅含量', AssayData.lead_content),
+        ('氯含量', AssayData.chlorine_content),
+        ('氟含量', AssayData.fluorine_content),
+        ('铁含量', AssayData.iron_content),
+        ('硅含量', AssayData.silicon_content),
+        ('硫含量', AssayData.sulfur_content),
+        ('高热值', AssayData.high_heat),
+        ('低热值', AssayData.low_heat),
+        ('银含量', AssayData.silver_content),
+        ('回收率', AssayData.recovery_rate),
+        ('备注', AssayData.remarks)
+    ]
+    query = query.outerjoin(Department, Department.id == AssayData.factory_id)
+    return [header for header, _ in columns], query.with_entities(*(column for _, column in columns))
+
+def metal_price_export(query):
+    """金属价格导出：(表头, 只查询导出列的查询)"""
+    columns = [
+        ('金属种类', MetalPrice.metal_type),
+        ('报价日期', MetalPrice.quote_date),
+        ('最高价', MetalPrice.high_price),
+        ('最低价', MetalPrice.low_price),
+        ('均价', MetalPrice.average_price),
+        ('涨跌', MetalPrice.price_change)
+    ]
+    return [header for header, _ in columns], query.with_entities(*(column for _, column in columns))
+
+class ExcelExportService:
+    """Excel流式导出服务"""
+
+    def __init__(self, batch_size=1000, chunk_size=64 * 1024):
+        """
+        初始化导出服务
+
+        :param batch_size: 每批从数据库读取的行数（yield_per）
+        :param chunk_size: 每次向客户端发送的字节数
+        """
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _format_value(value):
+        """日期按原导出格式转为字符串，其余值原样写入"""
+        if isinstance(value, datetime):
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        if isinstance(value, date):
+            return value.strftime('%Y-%m-%d')
+        return value
+
+    def iter_rows(self, query):
+        """按批读取查询结果（服务端游标），逐行返回格式化后的值列表"""
+        for row in query.yield_per(self.batch_size):
+            yield [self._format_value(value) for value in row]
+
+    def stream_csv(self, headers, rows):
+        """逐批生成CSV字节流（带BOM，Excel可直接打开中文）"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        yield codecs.BOM_UTF8
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= self.chunk_size:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+    def stream_xlsx(self, headers, rows, sheet_name='Sheet1'):
+        """使用openpyxl只写模式生成xlsx并分块发送
+
+        只写模式下行数据直接写入临时文件，不在内存中保留单元格对象；
+        生成的文件较小时保存在内存中，较大时转存到临时目录；
+        xlsx为zip格式，需写完后才能发送。
+        """
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(headers)
+        for row in rows:
+            worksheet.append(row)
+
+        with temp_artifact_service.spool() as output:
+            workbook.save(output)
+            output.seek(0)
+            while True:
+                chunk = output.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def export_response(self, headers, query, filename, sheet_name='Sheet1', file_format=None):
+        """
+        生成流式下载响应
+
+        :param headers: 表头列表，与查询列一一对应
+        :param query: 只查询导出列的查询
+        :param filename: 下载文件名（不含扩展名）
+        :param file_format: xlsx或csv，默认取请求参数format，未指定时为xlsx
+        """
+        file_format = (file_format or request.args.get('format', 'xlsx')).lower()
+        rows = self.iter_rows(query)
+        if file_format == 'csv':
+            body = self.stream_csv(headers, rows)
+            mimetype = 'text/csv'
+        else:
+            file_format = 'xlsx'
+            body = self.stream_xlsx(headers, rows, sheet_name)
+            mimetype = XLSX_MIMETYPE
+
+        download_name = quote(f"{filename}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{file_format}")
+        logger.info(f"开始流式导出: {filename}.{file_format}")
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f"attachment; filename*=UTF-8''{download_name}"}
+        )
+
+# 创建全局实例
+export_service = ExcelExportService()
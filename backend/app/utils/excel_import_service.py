@@ -0,0 +1,372 @@
+"""
+Excel批量导入服务
+按列整体转换和校验数据，分块批量写入数据库
+"""
+import pandas as pd
+import logging
+from flask import current_app
+from app import db
+from app.models.assay_data import AssayData
+from app.models.department import Department
+from app.models.material import Material
+from app.models.material_transaction import MaterialTransaction
+from app.models.production_record import ProductionRecord
+from app.utils.cache_hooks import mark_tables_changed
+from app.utils.excel_service import excel_service
+from app.utils.excel_validator import excel_validator
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 支持导入的模块及错误报告名称
+IMPORT_MODULE_LABELS = {
+    'material_transaction': '物料进出厂数据导入',
+    'assay_data': '化验数据导入',
+    'production_record': '产能记录数据导入'
+}
+
+# 物料进出厂记录：Excel列名 -> 数据库字段
+MATERIAL_TRANSACTION_TEXT_COLUMNS = {
+    '客户': 'customer',
+    '物料名称': 'material_name',
+    '类型': 'transaction_type',
+    '合同编号': 'contract_number',
+    '包装': 'packaging',
+    '车号': 'vehicle_number',
+    '备注': 'remarks'
+}
+MATERIAL_TRANSACTION_NUMERIC_COLUMNS = {
+    '发数': 'shipped_quantity',
+    '到数': 'received_quantity',
+    '水含量': 'water_content',
+    '锌含量': 'zinc_content',
+    '铅含量': 'lead_content',
+    '氯含量': 'chlorine_content',
+    '氟含量': 'fluorine_content'
+}
+MATERIAL_TRANSACTION_REQUIRED_COLUMNS = ['日期', '客户', '物料名称', '分厂', '类型', '发数', '到数']
+
+# 产能记录：Excel列名 -> 数据库字段
+PRODUCTION_RECORD_NUMERIC_COLUMNS = {
+    '产量': 'quantity',
+    '水含量': 'water_content',
+    '锌含量': 'zinc_content',
+    '铅含量': 'lead_content',
+    '氯含量': 'chlorine_content',
+    '氟含量': 'fluorine_content'
+}
+PRODUCTION_RECORD_REQUIRED_COLUMNS = ['日期', '分厂', '物料名称', '产量']
+
+# 化验数据：Excel列名 -> 数据库字段
+ASSAY_DATA_NUMERIC_COLUMNS = {
+    '水含量': 'water_content',
+    '锌含量': 'zinc_content',
+    '铅含量': 'lead_content',
+    '氯含量': 'chlorine_content',
+    '氟含量': 'fluorine_content',
+    '铁含量': 'iron_content',
+    '硅含量': 'silicon_content',
+    '硫含量': 'sulfur_content',
+    '高热值': 'high_heat',
+    '低热值': 'low_heat',
+    '银含量': 'silver_content',
+    '回收率': 'recovery_rate'
+}
+ASSAY_DATA_REQUIRED_COLUMNS = ['样品名称', '分厂']
+
+class ImportCancelled(Exception):
+    """导入任务已被取消"""
+
+class _FrameConverter:
+    """按列转换DataFrame并收集逐行错误（每行只记录第一个错误）"""
+
+    def __init__(self, df, required_columns, coerced=None):
+        """
+        :param coerced: excel_validator整表校验时已转换的列 {列名: 转换后的列}，这些列不再重复解析
+        """
+        self.df = df
+        self.required_columns = required_columns
+        self.coerced = coerced or {}
+        self.errors = []
+        self.failed = pd.Series(False, index=df.index)
+        self.records = pd.DataFrame(index=df.index)
+
+    def check(self, mask, column, message, values=None):
+        """将错误掩码转换为错误列表（行号与原逐行导入保持一致，从1开始）"""
+        mask = mask & ~self.failed
+        if not mask.any():
+            return
+        values = self.df[column] if values is None else values
+        self.errors.extend(
+            {
+                'type': '导入错误',
+                'message': f'第{index + 1}行{message}',
+                'row': index + 1,
+                'column': column,
+                'value': '' if pd.isna(values.at[index]) else values.at[index]
+            }
+            for index in self.df.index[mask]
+        )
+        self.failed = self.failed | mask
+
+    def _column(self, column):
+        if column in self.df.columns:
+            return self.df[column]
+        return pd.Series(None, index=self.df.index, dtype=object)
+
+    @staticmethod
+    def text_values(series):
+        """文本列：去除首尾空白，空值及空字符串为None；整数形式的浮点数（如合同编号123.0）还原为整数文本"""
+        def to_text(value):
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            text = str(value).strip()
+            return text or None
+
+        return series.map(to_text, na_action='ignore').astype(object).where(series.notna(), None)
+
+    def date(self, column, field):
+        values = self.coerced.get(column)
+        if values is None:
+            values = pd.to_datetime(self._column(column), errors='coerce')
+        self.check(values.isna(), column, '日期格式不正确')
+        self.records[field] = values.dt.date
+
+    def text(self, column, field):
+        values = self.text_values(self._column(column))
+        if column in self.required_columns:
+            self.check(values.isna(), column, f'{column}不能为空')
+        self.records[field] = values
+
+    def numeric(self, column, field):
+        raw = self._column(column)
+        values = self.coerced.get(column)
+        if values is None:
+            values = pd.to_numeric(raw, errors='coerce')
+        if column in self.required_columns:
+            self.check(values.isna(), column, f'{column}不能为空或非数值')
+        else:
+            self.check(values.isna() & raw.notna(), column, f'{column}不是有效数值')
+        self.records[field] = values
+
+    def lookup(self, column, field, mapping, label):
+        """按名称映射为ID；必需列名称不存在时报错，可选列不存在时为空"""
+        names = self.text_values(self._column(column))
+        # 可空整数类型，避免存在空值时ID被转换为浮点数
+        ids = names.map(mapping).astype('Int64')
+        if column in self.required_columns:
+            self.check(names.isna(), column, f'{column}不能为空')
+            self.check(ids.isna(), column, f'{label}不存在')
+        self.records[field] = ids
+        return names
+
+    def to_mappings(self, **constants):
+        """转换为批量写入的字典列表（NaN统一替换为None，数值为Python原生类型）"""
+        records = self.records.assign(**constants)
+        return records.astype(object).where(records.notna(), None).to_dict('records')
+
+class ExcelImportService:
+    """Excel批量导入服务"""
+
+    def __init__(self, chunk_size=1000):
+        """
+        初始化导入服务
+
+        :param chunk_size: 每批写入的行数
+        """
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _result(total, success_count=0, errors=None, error_count=0, message=None, error_matrix=None):
+        return {
+            'total': total,
+            'success_count': success_count,
+            'error_count': error_count,
+            'errors': errors or [],
+            'message': message,
+            'error_matrix': error_matrix
+        }
+
+    @staticmethod
+    def _outcome(count=0, model=None, mappings=None, fatal=None, errors=None, error_rows=0, error_matrix=None):
+        """单块数据的处理结果：fatal为整个文件无法导入的错误（如缺少必需字段）"""
+        return {
+            'count': count,
+            'model': model,
+            'mappings': mappings or [],
+            'fatal': fatal,
+            'errors': errors or [],
+            'error_rows': error_rows,
+            'error_matrix': error_matrix
+        }
+
+    @staticmethod
+    def get_department_map(level):
+        """部门名称 -> ID（一次查询），level=1为分厂，level=2为班组"""
+        rows = db.session.query(Department.name, Department.id).filter(Department.level == level).all()
+        return {name: department_id for name, department_id in rows}
+
+    def _load_context(self, module_name):
+        """导入开始时一次性加载名称映射，各块共用"""
+        if module_name in ('material_transaction', 'assay_data'):
+            return {'factories': self.get_department_map(1)}
+        if module_name == 'production_record':
+            return {
+                'factories': self.get_department_map(1),
+                'teams': self.get_department_map(2),
+                'products': {name for (name,) in db.session.query(Material.name).filter(Material.purpose == '产品')}
+            }
+        return {}
+
+    def _frame_validation_failed(self, validation_result):
+        """excel_validator整表校验失败：缺少字段为致命错误，其余返回全部错误及错误矩阵"""
+        if validation_result['error_matrix'] is None:
+            return self._outcome(fatal=validation_result['error'])
+        return self._outcome(errors=validation_result['errors'], error_rows=validation_result['error_rows'],
+                             error_matrix=validation_result['error_matrix'])
+
+    def _converted(self, model, converter, **constants):
+        if converter.errors:
+            return self._outcome(errors=converter.errors, error_rows=int(converter.failed.sum()))
+        mappings = converter.to_mappings(**constants)
+        return self._outcome(count=len(mappings), model=model, mappings=mappings)
+
+    def _convert_material_transactions(self, df, created_by, context, coerced=None):
+        """物料进出厂记录：按列转换为批量写入的字典列表（日期、数值列复用整表校验的转换结果）"""
+        converter = _FrameConverter(df, MATERIAL_TRANSACTION_REQUIRED_COLUMNS, coerced)
+        converter.date('日期', 'date')
+        converter.lookup('分厂', 'factory_id', context['factories'], '分厂')
+        for column, field in MATERIAL_TRANSACTION_TEXT_COLUMNS.items():
+            converter.text(column, field)
+        for column, field in MATERIAL_TRANSACTION_NUMERIC_COLUMNS.items():
+            converter.numeric(column, field)
+        return self._converted(MaterialTransaction, converter, created_by=created_by)
+
+    def _convert_assay_data(self, df, created_by, context, coerced=None):
+        """化验数据：按列转换为批量写入的字典列表（含量的数值及非负校验由excel_validator完成，复用其转换结果）"""
+        converter = _FrameConverter(df, ASSAY_DATA_REQUIRED_COLUMNS, coerced)
+        converter.text('样品名称', 'sample_name')
+        converter.lookup('分厂', 'factory_id', context['factories'], '分厂')
+        for column, field in ASSAY_DATA_NUMERIC_COLUMNS.items():
+            converter.numeric(column, field)
+        converter.text('备注', 'remarks')
+        return self._converted(AssayData, converter, created_by=created_by)
+
+    def _convert_production_records(self, df, created_by, context):
+        """产能记录：物料须为用途"产品"的物料，班组不存在时置空"""
+        converter = _FrameConverter(df, PRODUCTION_RECORD_REQUIRED_COLUMNS)
+        converter.date('日期', 'date')
+        converter.lookup('分厂', 'factory_id', context['factories'], '分厂')
+        converter.lookup('班组', 'team_id', context['teams'], '班组')
+        converter.text('物料名称', 'material_name')
+        converter.check(~converter.records['material_name'].isin(context['products']), '物料名称', '物料不存在')
+        for column, field in PRODUCTION_RECORD_NUMERIC_COLUMNS.items():
+            converter.numeric(column, field)
+        converter.text('备注', 'remarks')
+        return self._converted(ProductionRecord, converter, recorder_id=created_by, created_by=created_by)
+
+    def _process_chunk(self, module_name, df, user_id, context):
+        """校验并转换一块数据"""
+        if module_name == 'material_transaction':
+            validation_result = excel_validator.validate_material_transaction_data(df)
+            if not validation_result['valid']:
+                return self._frame_validation_failed(validation_result)
+            return self._convert_material_transactions(df, user_id, context, validation_result['coerced'])
+
+        if module_name == 'assay_data':
+            validation_result = excel_validator.validate_assay_data(df)
+            if not validation_result['valid']:
+                return self._frame_validation_failed(validation_result)
+            return self._convert_assay_data(df, user_id, context, validation_result['coerced'])
+
+        if module_name == 'production_record':
+            validation_result = excel_service.validate_excel_data(df, PRODUCTION_RECORD_REQUIRED_COLUMNS)
+            if not validation_result['is_valid']:
+                return self._outcome(fatal='; '.join(validation_result['errors']))
+            return self._convert_production_records(df, user_id, context)
+
+        raise ValueError(f'不支持的模块: {module_name}')
+
+    def _insert(self, model, mappings):
+        """分批执行Core insert（executemany），提交由调用方负责"""
+        table = model.__table__
+        for start in range(0, len(mappings), self.chunk_size):
+            db.session.execute(table.insert(), mappings[start:start + self.chunk_size])
+        mark_tables_changed(db.session, table.name)
+
+    def import_chunks(self, module_name, chunks, user_id=None, progress=None):
+        """
+        逐块校验并导入数据
+
+        每块校验通过后立即写入（同一事务）；出现错误行后不再写入，但继续校验剩余数据以报告全部错误，
+        最终回滚，不导入任何数据。全部通过时一次提交。没有数据行时（空块仍校验必需列）导入失败。
+
+        :param module_name: 模块名称，见IMPORT_MODULE_LABELS
+        :param chunks: DataFrame可迭代对象，索引为数据行位置
+        :param user_id: 导入人ID
+        :param progress: 每块处理后的回调，参数为已处理行数；抛出ImportCancelled时回滚
+        :return: {'total', 'success_count', 'error_count', 'errors', 'message', 'error_matrix'}
+        """
+        if module_name not in IMPORT_MODULE_LABELS:
+            raise ValueError(f'不支持的模块: {module_name}')
+
+        total = success_count = error_rows = 0
+        errors, matrices = [], []
+        try:
+            context = self._load_context(module_name)
+            for df in chunks:
+                outcome = self._process_chunk(module_name, df, user_id, context)
+                total += len(df)
+                if outcome['fatal']:
+                    db.session.rollback()
+                    return self._result(total, error_count=total, message=f"数据验证失败，{outcome['fatal']}",
+                                        errors=[{'type': '验证错误', 'message': outcome['fatal']}])
+                if outcome['errors']:
+                    errors.extend(outcome['errors'])
+                    error_rows += outcome['error_rows']
+                    if outcome['error_matrix'] is not None:
+                        matrices.append(outcome['error_matrix'])
+                elif not errors:
+                    if outcome['mappings']:
+                        self._insert(outcome['model'], outcome['mappings'])
+                    success_count += outcome['count']
+                if progress is not None:
+                    progress(total)
+
+            if total == 0:
+                db.session.rollback()
+                message = '文件中没有数据'
+                return self._result(0, message=f"数据验证失败，{message}",
+                                    errors=[{'type': '验证错误', 'message': message}])
+            if errors:
+                db.session.rollback()
+                return self._result(
+                    total, errors=errors, error_count=error_rows,
+                    message=f"数据导入失败，共{total}条，{error_rows}条有误，未导入任何数据",
+                    error_matrix=pd.concat(matrices).fillna('') if matrices else None
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        logger.info(f"{IMPORT_MODULE_LABELS[module_name]}完成: {success_count}条")
+        return self._result(total, success_count=success_count)
+
+    def import_dataframe(self, module_name, df, user_id=None, progress=None):
+        """按模块校验并导入已读取的整表数据"""
+        return self.import_chunks(module_name, [df], user_id, progress)
+
+    def import_file(self, module_name, file_path, user_id=None, progress=None, chunk_rows=None):
+        """
+        分块读取Excel文件并导入，内存占用与文件大小无关
+
+        :param chunk_rows: 每块行数，默认取配置EXCEL_IMPORT_CHUNK_ROWS
+        """
+        chunk_rows = chunk_rows or current_app.config.get('EXCEL_IMPORT_CHUNK_ROWS', 5000)
+        chunks = excel_service.iter_excel_chunks(file_path, chunk_size=chunk_rows)
+        return self.import_chunks(module_name, chunks, user_id, progress)
+
+# 创建全局实例
+import_service = ExcelImportService()
@@ -6,6 +6,8 @@ import pandas as pd
 import os
 from datetime import datetime
 from flask import current_app
+from openpyxl import load_workbook
+from app.utils.temp_artifact_service import temp_artifact_service, UPLOAD_CATEGORY
 import logging
 
 # 配置日志
@@ -26,16 +28,12 @@ class ExcelService:
         :param data: 要导出的数据（列表或DataFrame）
         :param filename: 导出文件名
         :param sheet_name: 工作表名称
-        :return: 文件路径
+        :return: (文件对象, 下载文件名)，小文件保存在内存中，大文件转存到临时目录，关闭后删除
         """
         try:
-            # 创建临时目录
-            temp_dir = os.path.join(current_app.config.get('TEMP_FOLDER', 'temp'), 'excel')
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # 生成文件路径
+            # 生成下载文件名
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            file_path = os.path.join(temp_dir, f"{filename}_{timestamp}.xlsx")
+            download_name = f"{filename}_{timestamp}.xlsx"
             
             # 转换数据为DataFrame
             if isinstance(data, list):
@@ -43,11 +41,14 @@ class ExcelService:
             else:
                 df = data
             
-            # 导出到Excel
-            df.to_excel(file_path, sheet_name=sheet_name, index=False)
+            # 导出到缓冲文件
+            output = temp_artifact_service.spool()
+            with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+            output.seek(0)
             
-            logger.info(f"Excel文件导出成功: {file_path}")
-            return file_path
+            logger.info(f"Excel文件导出成功: {download_name}")
+            return output, download_name
             
         except Exception as e:
             logger.error(f"导出Excel文件时发生错误: {str(e)}")
@@ -76,40 +77,94 @@ class ExcelService:
             logger.error(f"导入Excel文件时发生错误: {str(e)}")
             raise
     
-    def generate_template(self, columns, filename, sample_data=None):
+    def save_upload(self, file, max_size=None):
         """
-        生成Excel导入模板
-        
-        :param columns: 列名列表
-        :param filename: 模板文件名
-        :param sample_data: 示例数据（可选）
-        :return: 文件路径
+        将上传文件分块写入临时文件（随机文件名，不使用客户端文件名）
+
+        :param file: 上传的FileStorage对象
+        :param max_size: 大小上限（字节），默认取配置EXCEL_UPLOAD_MAX_SIZE
+        :return: 临时文件路径，调用方负责删除
         """
+        extension = os.path.splitext(file.filename or '')[1].lower()
+        if extension not in ('.xlsx', '.xls'):
+            raise ValueError('只支持Excel文件(.xls, .xlsx)')
+        max_size = max_size or current_app.config.get('EXCEL_UPLOAD_MAX_SIZE', 16 * 1024 * 1024)
+
+        size = 0
+        with temp_artifact_service.new_file(UPLOAD_CATEGORY, extension) as output:
+            try:
+                while True:
+                    chunk = file.stream.read(64 * 1024)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError(f'文件大小超过限制（{max_size // (1024 * 1024)}MB）')
+                    output.write(chunk)
+            except Exception:
+                output.close()
+                os.remove(output.name)
+                raise
+        return output.name
+
+    def count_rows(self, file_path, sheet_name=0):
+        """根据工作表尺寸估算数据行数（不含表头），无法确定时返回None"""
+        if not file_path.lower().endswith('.xlsx'):
+            return None
+        workbook = load_workbook(file_path, read_only=True)
         try:
-            # 创建临时目录
-            temp_dir = os.path.join(current_app.config.get('TEMP_FOLDER', 'temp'), 'excel')
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # 生成文件路径
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            file_path = os.path.join(temp_dir, f"{filename}_template_{timestamp}.xlsx")
-            
-            # 创建DataFrame
-            if sample_data:
-                df = pd.DataFrame([sample_data], columns=columns)
-            else:
-                df = pd.DataFrame(columns=columns)
-            
-            # 保存为Excel模板
-            df.to_excel(file_path, index=False)
-            
-            logger.info(f"Excel模板生成成功: {file_path}")
-            return file_path
-            
-        except Exception as e:
-            logger.error(f"生成Excel模板时发生错误: {str(e)}")
-            raise
-    
+            worksheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+            return max(worksheet.max_row - 1, 0) if worksheet.max_row else None
+        finally:
+            workbook.close()
+
+    def iter_excel_chunks(self, file_path, chunk_size=5000, sheet_name=0):
+        """
+        按块读取Excel文件，每块为一个DataFrame，内存占用与文件大小无关
+
+        xlsx使用openpyxl只读模式逐行读取；跳过空行，索引为数据行在表中的位置（从0开始），
+        与整表读取时的行号一致。xls格式不支持只读模式，整表读取后分块返回。
+        没有数据行时返回一个只有表头的空DataFrame，调用方仍可校验列。
+
+        :param chunk_size: 每块行数
+        :return: DataFrame生成器
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+
+        if not file_path.lower().endswith('.xlsx'):
+            df = pd.read_excel(file_path, sheet_name=sheet_name)
+            for start in range(0, max(len(df), 1), chunk_size):
+                yield df.iloc[start:start + chunk_size]
+            return
+
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            worksheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                yield pd.DataFrame()
+                return
+            columns = [str(column).strip() if column is not None else f'Unnamed: {i}'
+                       for i, column in enumerate(header)]
+
+            batch, index = [], []
+            yielded = False
+            for position, row in enumerate(rows):
+                if all(value is None for value in row):
+                    continue
+                batch.append(row[:len(columns)])
+                index.append(position)
+                if len(batch) >= chunk_size:
+                    yield pd.DataFrame(batch, columns=columns, index=index)
+                    batch, index = [], []
+                    yielded = True
+            if batch or not yielded:
+                yield pd.DataFrame(batch, columns=columns, index=index)
+        finally:
+            workbook.close()
+
     def validate_excel_data(self, df, required_columns=None):
         """
         验证Excel数据
@@ -3,213 +3,188 @@ Excel模板管理器
 提供Excel导入模板的生成功能
 """
 import pandas as pd
-import os
-from datetime import datetime
-from flask import current_app
+import hashlib
+import json
+import threading
+from io import BytesIO
+from flask import send_file
 import logging
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# 模板版本号：修改模板列或示例数据后递增，客户端缓存随ETag变化失效
+TEMPLATE_VERSION = 1
+
+# 各模块导入模板：下载文件名、工作表名、列及示例数据
+TEMPLATE_DEFINITIONS = {
+    'material_transaction': {
+        'filename': '物料进出厂记录模板.xlsx',
+        'sheet_name': 'Sheet1',
+        'columns': [
+            '日期', '客户', '物料名称', '分厂', '合同编号', '类型',
+            '包装', '车号', '发数', '到数', '水含量', '锌含量',
+            '铅含量', '氯含量', '氟含量', '备注'
+        ],
+        'sample_data': {
+            '日期': '2023-01-01',
+            '客户': '客户名称',
+            '物料名称': '物料名称',
+            '分厂': '一分厂',
+            '合同编号': 'HT20230101',
+            '类型': '进厂',
+            '包装': '包装方式',
+            '车号': '车牌号',
+            '发数': 100.0,
+            '到数': 98.5,
+            '水含量': 5.2,
+            '锌含量': 10.3,
+            '铅含量': 2.1,
+            '氯含量': 0.8,
+            '氟含量': 0.1,
+            '备注': '备注信息'
+        }
+    },
+    'assay_data': {
+        'filename': '化验数据模板.xlsx',
+        'sheet_name': 'Sheet1',
+        'columns': [
+            '样品名称', '分厂', '水含量', '锌含量', '铅含量', '氯含量',
+            '氟含量', '铁含量', '硅含量', '硫含量', '高热值', '低热值',
+            '银含量', '回收率', '备注'
+        ],
+        'sample_data': {
+            '样品名称': '样品名称',
+            '分厂': '一分厂',
+            '水含量': 10.5,
+            '锌含量': 20.3,
+            '铅含量': 5.2,
+            '氯含量': 1.8,
+            '氟含量': 0.5,
+            '铁含量': 3.7,
+            '硅含量': 2.1,
+            '硫含量': 1.2,
+            '高热值': 4500,
+            '低热值': 3200,
+            '银含量': 0.01,
+            '回收率': 95.5,
+            '备注': '备注信息'
+        }
+    },
+    'production_record': {
+        'filename': '产能记录模板.xlsx',
+        'sheet_name': 'Sheet1',
+        'columns': [
+            '日期', '分厂', '班组', '物料名称', '产量', '水含量', '锌含量',
+            '铅含量', '氯含量', '氟含量', '备注'
+        ],
+        'sample_data': {
+            '日期': '2023-01-01',
+            '分厂': '一分厂',
+            '班组': '一班',
+            '物料名称': '产品A',
+            '产量': 1000.0,
+            '水含量': 5.2,
+            '锌含量': 10.3,
+            '铅含量': 2.1,
+            '氯含量': 0.8,
+            '氟含量': 0.1,
+            '备注': '正常'
+        }
+    },
+    'metal_price': {
+        'filename': 'metal_price_template.xlsx',
+        'sheet_name': '金属价格模板',
+        'columns': ['金属种类', '报价日期', '最高价', '最低价', '均价', '涨跌'],
+        'sample_data': {
+            '金属种类': '1#锌',
+            '报价日期': '2023-01-01',
+            '最高价': 25000,
+            '最低价': 24000,
+            '均价': 24500,
+            '涨跌': 100
+        }
+    }
+}
+
 class ExcelTemplateManager:
-    """Excel模板管理器"""
-    
+    """Excel模板管理器
+
+    模板在首次下载时生成一次，文件内容保存在内存中，不再写入临时目录。
+    """
+
     def __init__(self):
         """初始化模板管理器"""
-        pass
-    
-    def generate_material_transaction_template(self):
-        """
-        生成物料进出厂记录导入模板
-        
-        :return: 模板文件路径
-        """
-        try:
-            # 定义模板列
-            columns = [
-                '日期', '客户', '物料名称', '分厂', '合同编号', '类型', 
-                '包装', '车号', '发数', '到数', '水含量', '锌含量', 
-                '铅含量', '氯含量', '氟含量', '备注'
-            ]
-            
-            # 示例数据
-            sample_data = {
-                '日期': '2023-01-01',
-                '客户': '客户名称',
-                '物料名称': '物料名称',
-                '分厂': '一分厂',
-                '合同编号': 'HT20230101',
-                '类型': '进厂',
-                '包装': '包装方式',
-                '车号': '车牌号',
-                '发数': 100.0,
-                '到数': 98.5,
-                '水含量': 5.2,
-                '锌含量': 10.3,
-                '铅含量': 2.1,
-                '氯含量': 0.8,
-                '氟含量': 0.1,
-                '备注': '备注信息'
-            }
-            
-            # 创建临时目录
-            temp_dir = os.path.join(current_app.config.get('TEMP_FOLDER', 'temp'), 'excel')
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # 生成文件路径
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            file_path = os.path.join(temp_dir, f"物料进出厂记录模板_{timestamp}.xlsx")
-            
-            # 创建DataFrame
-            df = pd.DataFrame([sample_data], columns=columns)
-            
-            # 保存为Excel模板
-            df.to_excel(file_path, index=False)
-            
-            logger.info(f"物料进出厂记录模板生成成功: {file_path}")
-            return file_path
-            
-        except Exception as e:
-            logger.error(f"生成物料进出厂记录模板时发生错误: {str(e)}")
-            raise
-    
-    def generate_assay_data_template(self):
+        # 模块名 -> (版本号, 文件内容, ETag)
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build_template(columns, sample_data=None, sheet_name='Sheet1'):
         """
-        生成化验数据导入模板
-        
-        :return: 模板文件路径
+        在内存中生成模板文件
+
+        :param columns: 列名列表
+        :param sample_data: 示例数据（可选）
+        :return: xlsx文件内容（bytes）
         """
-        try:
-            # 定义模板列
-            columns = [
-                '样品名称', '分厂', '水含量', '锌含量', '铅含量', '氯含量', 
-                '氟含量', '铁含量', '硅含量', '硫含量', '高热值', '低热值', 
-                '银含量', '回收率', '备注'
-            ]
-            
-            # 示例数据
-            sample_data = {
-                '样品名称': '样品名称',
-                '分厂': '一分厂',
-                '水含量': 10.5,
-                '锌含量': 20.3,
-                '铅含量': 5.2,
-                '氯含量': 1.8,
-                '氟含量': 0.5,
-                '铁含量': 3.7,
-                '硅含量': 2.1,
-                '硫含量': 1.2,
-                '高热值': 4500,
-                '低热值': 3200,
-                '银含量': 0.01,
-                '回收率': 95.5,
-                '备注': '备注信息'
-            }
-            
-            # 创建临时目录
-            temp_dir = os.path.join(current_app.config.get('TEMP_FOLDER', 'temp'), 'excel')
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # 生成文件路径
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            file_path = os.path.join(temp_dir, f"化验数据模板_{timestamp}.xlsx")
-            
-            # 创建DataFrame
+        if sample_data:
             df = pd.DataFrame([sample_data], columns=columns)
-            
-            # 保存为Excel模板
-            df.to_excel(file_path, index=False)
-            
-            logger.info(f"化验数据模板生成成功: {file_path}")
-            return file_path
-            
-        except Exception as e:
-            logger.error(f"生成化验数据模板时发生错误: {str(e)}")
-            raise
-
-    def generate_production_record_template(self):
+        else:
+            df = pd.DataFrame(columns=columns)
+
+        output = BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            df.to_excel(writer, index=False, sheet_name=sheet_name)
+        return output.getvalue()
+
+    @staticmethod
+    def _etag(module_name, definition):
+        """ETag由模板版本和定义内容计算，各进程一致（xlsx文件内含生成时间，不能直接哈希文件内容）"""
+        payload = json.dumps([TEMPLATE_VERSION, module_name, definition], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_template(self, module_name):
         """
-        生成产能记录导入模板
-        
-        :return: 模板文件路径
+        获取模块模板（按版本缓存）
+
+        :param module_name: 模块名称
+        :return: (文件内容, ETag)
         """
-        try:
-            # 定义模板列
-            columns = [
-                '日期', '分厂', '班组', '物料名称', '产量', '水含量', '锌含量', 
-                '铅含量', '氯含量', '氟含量', '备注'
-            ]
-            
-            # 示例数据
-            sample_data = {
-                '日期': '2023-01-01',
-                '分厂': '一分厂',
-                '班组': '一班',
-                '物料名称': '产品A',
-                '产量': 1000.0,
-                '水含量': 5.2,
-                '锌含量': 10.3,
-                '铅含量': 2.1,
-                '氯含量': 0.8,
-                '氟含量': 0.1,
-                '备注': '正常'
-            }
-            
-            # 创建临时目录
-            temp_dir = os.path.join(current_app.config.get('TEMP_FOLDER', 'temp'), 'excel')
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # 生成文件路径
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            file_path = os.path.join(temp_dir, f"产能记录模板_{timestamp}.xlsx")
-            
-            # 创建DataFrame
-            df = pd.DataFrame([sample_data], columns=columns)
-            
-            # 保存为Excel模板
-            df.to_excel(file_path, index=False)
-            
-            logger.info(f"产能记录模板生成成功: {file_path}")
-            return file_path
-            
-        except Exception as e:
-            logger.error(f"生成产能记录模板时发生错误: {str(e)}")
-            raise
-
-    def generate_custom_template(self, module_name, columns, sample_data=None):
+        definition = TEMPLATE_DEFINITIONS.get(module_name)
+        if definition is None:
+            raise ValueError(f'不支持的模块: {module_name}')
+
+        cached = self._templates.get(module_name)
+        if cached is None or cached[0] != TEMPLATE_VERSION:
+            with self._lock:
+                cached = self._templates.get(module_name)
+                if cached is None or cached[0] != TEMPLATE_VERSION:
+                    data = self.build_template(definition['columns'], definition['sample_data'],
+                                               definition['sheet_name'])
+                    cached = (TEMPLATE_VERSION, data, self._etag(module_name, definition))
+                    self._templates[module_name] = cached
+                    logger.info(f"模板生成成功: {definition['filename']}")
+        return cached[1], cached[2]
+
+    def send_template(self, module_name):
         """
-        生成自定义模块模板
-        
+        返回模板下载响应（带ETag，客户端ETag一致时返回304）
+
         :param module_name: 模块名称
-        :param columns: 列名列表
-        :param sample_data: 示例数据（可选）
-        :return: 模板文件路径
         """
-        try:
-            # 创建临时目录
-            temp_dir = os.path.join(current_app.config.get('TEMP_FOLDER', 'temp'), 'excel')
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # 生成文件路径
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            file_path = os.path.join(temp_dir, f"{module_name}_模板_{timestamp}.xlsx")
-            
-            # 创建DataFrame
-            if sample_data:
-                df = pd.DataFrame([sample_data], columns=columns)
-            else:
-                df = pd.DataFrame(columns=columns)
-            
-            # 保存为Excel模板
-            df.to_excel(file_path, index=False)
-            
-            logger.info(f"自定义模板生成成功: {file_path}")
-            return file_path
-            
-        except Exception as e:
-            logger.error(f"生成自定义模板时发生错误: {str(e)}")
-            raise
+        data, etag = self.get_template(module_name)
+        return send_file(
+            BytesIO(data),
+            mimetype=XLSX_MIMETYPE,
+            as_attachment=True,
+            download_name=TEMPLATE_DEFINITIONS[module_name]['filename'],
+            etag=etag,
+            conditional=True
+        )
 
 # 创建全局实例
 template_manager = ExcelTemplateManager()
@@ -10,6 +10,35 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 元素含量字段（0-100%）
+ELEMENT_CONTENT_FIELDS = ['水含量', '锌含量', '铅含量', '氯含量', '氟含量']
+
+def _is_future_date(values):
+    """日期晚于当前日期"""
+    return values.dt.normalize() > pd.Timestamp(datetime.now().date())
+
+# 物料进出厂数据校验规则
+MATERIAL_TRANSACTION_SCHEMA = {
+    'required': ['日期', '客户', '物料名称', '分厂', '类型', '发数', '到数'],
+    'types': dict({'日期': 'date', '发数': 'numeric', '到数': 'numeric'},
+                  **{field: 'numeric' for field in ELEMENT_CONTENT_FIELDS}),
+    'rules': [
+        (['发数', '到数'], lambda values: values <= 0, '必须大于0'),
+        (['日期'], _is_future_date, '不能晚于当前日期'),
+        (ELEMENT_CONTENT_FIELDS, lambda values: (values < 0) | (values > 100), '应在0-100范围内')
+    ]
+}
+
+# 化验数据校验规则
+ASSAY_DATA_NUMERIC_FIELDS = ELEMENT_CONTENT_FIELDS + ['铁含量', '硅含量', '硫含量', '高热值', '低热值', '银含量', '回收率']
+ASSAY_DATA_SCHEMA = {
+    'required': ['样品名称', '分厂'] + ELEMENT_CONTENT_FIELDS,
+    'types': {field: 'numeric' for field in ASSAY_DATA_NUMERIC_FIELDS},
+    'rules': [
+        (ASSAY_DATA_NUMERIC_FIELDS, lambda values: values < 0, '不能为负数')
+    ]
+}
+
 class ExcelValidator:
     """Excel数据验证器"""
     
@@ -103,168 +132,104 @@ class ExcelValidator:
         
         return {'valid': True}
     
-    def validate_assay_data(self, df):
+    def validate_frame(self, df, schema):
         """
-        验证化验数据
-        
-        :param df: DataFrame数据
-        :return: 验证结果
+        整表校验：每列只转换一次，一次计算所有规则的错误掩码，返回全部错误
+
+        :param df: DataFrame数据，索引为数据行位置（分块校验时各块索引连续），错误行号为索引+1
+        :param schema: 校验规则 {'required': 必需字段, 'types': {字段: 'date'/'numeric'},
+                       'rules': [(字段列表, 以转换后的列为参数返回错误掩码的函数, 错误说明)]}
+        :return: {'valid', 'error': 汇总信息, 'errors': 错误列表, 'error_matrix': 行×列错误矩阵, 'error_rows': 错误行数}；
+                 校验通过时为{'valid': True, 'coerced': {字段: 转换后的列}}，供导入时直接使用
         """
-        # 必需字段验证
-        required_fields = ['样品名称', '分厂', '水含量', '锌含量', '铅含量', '氯含量', '氟含量']
-        result = self.validate_required_fields(df, required_fields)
-        if not result['valid']:
-            return result
-        
-        # 数据类型验证
-        type_rules = {
-            '水含量': 'numeric',
-            '锌含量': 'numeric',
-            '铅含量': 'numeric',
-            '氯含量': 'numeric',
-            '氟含量': 'numeric',
-            '铁含量': 'numeric',
-            '硅含量': 'numeric',
-            '硫含量': 'numeric',
-            '高热值': 'numeric',
-            '低热值': 'numeric',
-            '银含量': 'numeric',
-            '回收率': 'numeric'
-        }
-        result = self.validate_data_types(df, type_rules)
-        if not result['valid']:
-            return result
-        
-        # 业务规则验证
-        business_rules = [
-            self._validate_non_negative_values
-        ]
-        result = self.validate_business_rules(df, business_rules)
-        if not result['valid']:
-            return result
-        
-        return {'valid': True}
-    
-    def _validate_non_negative_values(self, df):
-        """验证数值字段不能为负数"""
-        try:
-            # 获取所有数值列
-            numeric_columns = df.select_dtypes(include=['number']).columns
-            
-            # 检查是否有负数
-            for col in numeric_columns:
-                negative_values = df[df[col] < 0]
-                if len(negative_values) > 0:
-                    return {
-                        'valid': False,
-                        'error': f'字段 {col} 不能为负数'
-                    }
-            
-            return {'valid': True}
-        except Exception as e:
+        required_fields = schema.get('required', [])
+        missing_fields = [field for field in required_fields if field not in df.columns]
+        if missing_fields:
+            error = f"缺少必需字段: {', '.join(missing_fields)}"
             return {
                 'valid': False,
-                'error': f'验证数值字段时出错: {str(e)}'
+                'error': error,
+                'errors': [{'type': '验证错误', 'message': error}],
+                'error_matrix': None,
+                'error_rows': len(df)
             }
-    
+
+        # 行×列错误矩阵，单元格为该处全部错误说明
+        matrix = pd.DataFrame('', index=df.index, columns=df.columns, dtype=object)
+
+        def flag(field, mask, message):
+            if mask.any():
+                cells = matrix.loc[mask, field]
+                matrix.loc[mask, field] = cells.where(cells == '', cells + '；') + message
+
+        for field in required_fields:
+            values = df[field]
+            flag(field, values.isna() | (values.astype(str).str.strip() == ''), f'{field}不能为空')
+
+        # 每列只转换一次，后续规则复用转换结果
+        coerced = {}
+        for field, expected_type in schema.get('types', {}).items():
+            if field not in df.columns:
+                continue
+            if expected_type == 'date':
+                coerced[field] = pd.to_datetime(df[field], errors='coerce')
+                message = f'{field}日期格式不正确'
+            else:
+                coerced[field] = pd.to_numeric(df[field], errors='coerce')
+                message = f'{field}不是有效数值'
+            flag(field, df[field].notna() & coerced[field].isna(), message)
+
+        for fields, rule, message in schema.get('rules', []):
+            for field in fields:
+                if field in coerced:
+                    flag(field, rule(coerced[field]).fillna(False).astype(bool), f'{field}{message}')
+
+        has_error = matrix != ''
+        error_rows = has_error.any(axis=1)
+        if not error_rows.any():
+            return {'valid': True, 'coerced': coerced}
+
+        # 只保留有错误的行和列，行号与导入错误保持一致（从1开始）
+        error_matrix = matrix.loc[error_rows, has_error.any(axis=0)]
+        error_matrix.index = error_matrix.index + 1
+        error_matrix.index.name = '行号'
+
+        cells = error_matrix.where(error_matrix != '').stack()
+        errors = [
+            {
+                'type': '验证错误',
+                'message': f'第{row}行{message}',
+                'row': row,
+                'column': field,
+                'value': '' if pd.isna(df.at[row - 1, field]) else df.at[row - 1, field]
+            }
+            for (row, field), message in cells.items()
+        ]
+        return {
+            'valid': False,
+            'error': f'共{int(error_rows.sum())}行、{len(errors)}处数据有误，{errors[0]["message"]}',
+            'errors': errors,
+            'error_matrix': error_matrix,
+            'error_rows': int(error_rows.sum())
+        }
+
+    def validate_assay_data(self, df):
+        """
+        验证化验数据
+
+        :param df: DataFrame数据
+        :return: 验证结果，见validate_frame
+        """
+        return self.validate_frame(df, ASSAY_DATA_SCHEMA)
+
     def validate_material_transaction_data(self, df):
         """
         验证物料进出厂数据
-        
+
         :param df: DataFrame数据
-        :return: 验证结果
+        :return: 验证结果，见validate_frame
         """
-        # 必需字段验证
-        required_fields = ['日期', '客户', '物料名称', '分厂', '类型', '发数', '到数']
-        result = self.validate_required_fields(df, required_fields)
-        if not result['valid']:
-            return result
-        
-        # 数据类型验证
-        type_rules = {
-            '日期': 'date',
-            '发数': 'numeric',
-            '到数': 'numeric',
-            '水含量': 'numeric',
-            '锌含量': 'numeric',
-            '铅含量': 'numeric',
-            '氯含量': 'numeric',
-            '氟含量': 'numeric'
-        }
-        result = self.validate_data_types(df, type_rules)
-        if not result['valid']:
-            return result
-        
-        # 业务规则验证
-        business_rules = [
-            self._validate_positive_quantities,
-            self._validate_date_not_future,
-            self._validate_element_content_range
-        ]
-        result = self.validate_business_rules(df, business_rules)
-        if not result['valid']:
-            return result
-        
-        return {'valid': True}
-    
-    def _validate_positive_quantities(self, df):
-        """验证发数和到数必须大于0"""
-        try:
-            negative_shipped = df[df['发数'] <= 0]
-            negative_received = df[df['到数'] <= 0]
-            
-            if len(negative_shipped) > 0 or len(negative_received) > 0:
-                return {
-                    'valid': False,
-                    'error': '发数和到数必须大于0'
-                }
-            
-            return {'valid': True}
-        except Exception as e:
-            return {
-                'valid': False,
-                'error': f'验证发数和到数时出错: {str(e)}'
-            }
-    
-    def _validate_date_not_future(self, df):
-        """验证日期不能晚于当前日期"""
-        try:
-            today = pd.Timestamp(datetime.now().date())
-            future_dates = df[pd.to_datetime(df['日期']).dt.date > today.date()]
-            
-            if len(future_dates) > 0:
-                return {
-                    'valid': False,
-                    'error': '日期不能晚于当前日期'
-                }
-            
-            return {'valid': True}
-        except Exception as e:
-            return {
-                'valid': False,
-                'error': f'验证日期时出错: {str(e)}'
-            }
-    
-    def _validate_element_content_range(self, df):
-        """验证元素含量范围（0-100%）"""
-        try:
-            element_columns = ['水含量', '锌含量', '铅含量', '氯含量', '氟含量']
-            
-            for col in element_columns:
-                if col in df.columns:
-                    invalid_values = df[(df[col] < 0) | (df[col] > 100)]
-                    if len(invalid_values) > 0:
-                        return {
-                            'valid': False,
-                            'error': f'{col} 应在0-100范围内'
-                        }
-            
-            return {'valid': True}
-        except Exception as e:
-            return {
-                'valid': False,
-                'error': f'验证元素含量时出错: {str(e)}'
-            }
+        return self.validate_frame(df, MATERIAL_TRANSACTION_SCHEMA)
 
 # 创建全局实例
 excel_validator = ExcelValidator()
\ No newline at end of file
@@ -0,0 +1,81 @@
+from flask import g, has_app_context
+from flask_login import current_user
+from sqlalchemy import select, false
+from app import db
+from app.utils.cache_service import cache_service, CACHE_TIMEOUT
+from app.utils.cache_hooks import on_tables_committed
+
+# 分厂范围版本号：负责人关系或部门变更后递增，旧版本缓存自然失效
+FACTORY_SCOPE_VERSION_KEY = 'factory_scope_version'
+# 影响用户分厂范围的表（通过department.managers修改负责人时，cache_hooks按关系集合的变更登记department_managers）
+FACTORY_SCOPE_TABLES = {'department_managers', 'departments'}
+
+def _resolve_user(user=None):
+    """默认使用装饰器设置的g.current_user（JWT），其次为会话登录用户"""
+    if user is not None:
+        return user
+    if has_app_context():
+        user = getattr(g, 'current_user', None)
+    return user or current_user
+
+def build_factory_ids_stmt(user_id):
+    """用户负责的分厂（一级部门）ID查询"""
+    from app.models.department import Department, DepartmentManager
+
+    return (
+        select(DepartmentManager.department_id)
+        .join(Department, Department.id == DepartmentManager.department_id)
+        .where(DepartmentManager.user_id == user_id, Department.level == 1)
+        .distinct()
+    )
+
+def get_user_factory_ids(user=None):
+    """获取用户负责的分厂ID列表
+
+    同一请求内只查询一次（缓存在g上），跨请求缓存在Redis中并以版本号作为键的一部分。
+    """
+    user = _resolve_user(user)
+    if not getattr(user, 'is_authenticated', False):
+        return []
+
+    request_cache = None
+    if has_app_context():
+        request_cache = g.setdefault('_factory_scopes', {})
+        if user.id in request_cache:
+            return request_cache[user.id]
+
+    version = cache_service.get(FACTORY_SCOPE_VERSION_KEY) or 0
+    cache_key = f"factory_scope:{user.id}:{version}"
+    factory_ids = cache_service.get(cache_key)
+    if factory_ids is None:
+        factory_ids = sorted(db.session.execute(build_factory_ids_stmt(user.id)).scalars())
+        cache_service.set(cache_key, factory_ids, CACHE_TIMEOUT['LONG'])
+
+    if request_cache is not None:
+        request_cache[user.id] = factory_ids
+    return factory_ids
+
+def factory_scope_filter(column, user=None, subquery=False):
+    """生成分厂范围的SQL筛选条件：column IN (用户负责的分厂)
+
+    Args:
+        column: 分厂ID列，如 MaterialTransaction.factory_id
+        subquery: 为True时直接在SQL中以子查询关联负责人表，不读取缓存
+    """
+    user = _resolve_user(user)
+    if not getattr(user, 'is_authenticated', False):
+        return false()
+    if subquery:
+        return column.in_(build_factory_ids_stmt(user.id).scalar_subquery())
+    factory_ids = get_user_factory_ids(user)
+    if not factory_ids:
+        return false()
+    return column.in_(factory_ids)
+
+def invalidate_factory_scopes(tables=None):
+    """负责人关系变更后递增版本号，并清空当前请求内的分厂范围"""
+    cache_service.incr(FACTORY_SCOPE_VERSION_KEY)
+    if has_app_context():
+        g.pop('_factory_scopes', None)
+
+on_tables_committed(FACTORY_SCOPE_TABLES, invalidate_factory_scopes)
@@ -0,0 +1,126 @@
+from flask import g, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db
+from app.utils.cache_service import cache_service, CACHE_TIMEOUT
+from app.utils.cache_hooks import on_tables_committed
+
+# 身份版本号：每个用户一个（identity_version:<用户ID>），该用户、其角色或负责分厂变更后递增；
+# 全局版本号在无法确定涉及哪些用户时（批量更新、部门变更）递增，旧版本的身份快照自然失效
+IDENTITY_VERSION_KEY = 'identity_version'
+# session.info中记录本次事务涉及的用户ID，ALL_USERS表示无法确定
+PENDING_USERS_KEY = 'identity_changed_users'
+ALL_USERS = '*'
+# 批量更新时无法确定用户的表
+IDENTITY_TABLES = {'users', 'user_roles', 'department_managers'}
+# 快照中的用户字段（不含密码哈希，其余列在访问时按需加载）
+IDENTITY_FIELDS = ('id', 'username', 'name', 'is_active', 'is_superuser')
+ROLE_FIELDS = ('id', 'name')
+
+def _snapshot(user):
+    from app.utils.factory_scope import get_user_factory_ids
+
+    snapshot = {field: getattr(user, field) for field in IDENTITY_FIELDS}
+    snapshot['roles'] = [{field: getattr(role, field) for field in ROLE_FIELDS} for role in user.roles]
+    snapshot['factory_ids'] = get_user_factory_ids(user)
+    return snapshot
+
+def _detached(model, fields):
+    """由快照字段构造属于当前会话的对象（不查询数据库）"""
+    obj = model(**fields)
+    make_transient_to_detached(obj)
+    return db.session.merge(obj, load=False)
+
+def _from_snapshot(snapshot):
+    """由快照还原User对象，角色集合和当前请求内的分厂范围直接使用快照内容"""
+    from app.models.role import Role
+    from app.models.user import User
+
+    user = _detached(User, {field: snapshot[field] for field in IDENTITY_FIELDS})
+    set_committed_value(user, 'roles', [_detached(Role, role) for role in snapshot['roles']])
+    if has_app_context():
+        g.setdefault('_factory_scopes', {})[user.id] = snapshot['factory_ids']
+    return user
+
+def _version_key(user_id):
+    return f"{IDENTITY_VERSION_KEY}:{user_id}"
+
+def load_user(user_id):
+    """按ID加载用户（登录会话和JWT认证共用）
+
+    用户快照（含角色和负责的分厂）短时间缓存在Redis中，以全局及该用户的身份版本号作为键的一部分；
+    权限集合由permission_service缓存。
+    """
+    from app.models.user import User
+
+    version = cache_service.get(IDENTITY_VERSION_KEY) or 0
+    user_version = cache_service.get(_version_key(user_id)) or 0
+    cache_key = f"identity:{user_id}:{version}.{user_version}"
+    snapshot = cache_service.get(cache_key)
+    if snapshot is not None:
+        return _from_snapshot(snapshot)
+
+    user = User.query.get(user_id)
+    if user is not None:
+        cache_service.set(cache_key, _snapshot(user), CACHE_TIMEOUT['SHORT'])
+    return user
+
+def _mark_users_changed(session, *user_ids):
+    session.info.setdefault(PENDING_USERS_KEY, set()).update(user_ids)
+
+def _collect_changed_users(session, flush_context):
+    """flush后收集身份快照受影响的用户：用户本身、用户角色及分厂负责人关联的变更"""
+    from app.models.department import DepartmentManager
+    from app.models.role import UserRole
+    from app.models.user import User
+
+    user_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            user_ids.add(obj.id)
+        elif isinstance(obj, (UserRole, DepartmentManager)):
+            user_ids.add(obj.user_id)
+        else:
+            # 通过role.users、department.managers修改关联时，变更的用户在关系集合的历史中
+            state = inspect(obj)
+            for relationship in state.mapper.relationships:
+                if relationship.secondary is not None and relationship.mapper.class_ is User:
+                    history = state.attrs[relationship.key].history
+                    user_ids.update(user.id for user in list(history.added or ()) + list(history.deleted or ()))
+    user_ids.discard(None)
+    if user_ids:
+        _mark_users_changed(session, *user_ids)
+
+def _collect_bulk_users(update_context):
+    """Query.update()/Query.delete()批量修改用户或关联时无法确定用户，使全部快照失效"""
+    mapper = getattr(update_context, 'mapper', None)
+    if mapper is not None and mapper.local_table.name in IDENTITY_TABLES:
+        _mark_users_changed(update_context.session, ALL_USERS)
+
+def _invalidate_committed_users(session):
+    """事务提交后递增涉及用户的版本号"""
+    user_ids = session.info.pop(PENDING_USERS_KEY, None)
+    if not user_ids:
+        return
+    if ALL_USERS in user_ids:
+        invalidate_identities()
+        return
+    for user_id in user_ids:
+        cache_service.incr(_version_key(user_id))
+
+def _discard_pending_users(session):
+    session.info.pop(PENDING_USERS_KEY, None)
+
+def invalidate_identities(tables=None):
+    """递增全局版本号，使全部身份快照失效（部门变更可能改变任意用户负责的分厂）"""
+    cache_service.incr(IDENTITY_VERSION_KEY)
+
+if not event.contains(db.session, 'after_flush', _collect_changed_users):
+    event.listen(db.session, 'after_flush', _collect_changed_users)
+    event.listen(db.session, 'after_bulk_update', _collect_bulk_users)
+    event.listen(db.session, 'after_bulk_delete', _collect_bulk_users)
+    event.listen(db.session, 'after_commit', _invalidate_committed_users)
+    event.listen(db.session, 'after_rollback', _discard_pending_users)
+
+on_tables_committed({'departments'}, invalidate_identities)
@@ -0,0 +1,159 @@
+"""
+Excel后台导入任务
+上传后立即返回任务ID，分块解析、校验和写入在线程池中执行，进度保存在实例目录下的SQLite文件中
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from app.utils.excel_service import excel_service
+from app.utils.excel_error_manager import error_manager
+from app.utils.excel_import_service import import_service, ImportCancelled, IMPORT_MODULE_LABELS
+from app.utils.import_job_store import SQLiteImportJobStore
+from app.utils.temp_artifact_service import temp_artifact_service
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 任务状态文件（实例目录下）
+IMPORT_JOB_DB_FILE = 'import_jobs.db'
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATUSES = {JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED}
+
+class ImportJobService:
+    """Excel后台导入任务服务"""
+
+    def __init__(self):
+        """初始化任务服务"""
+        self.max_workers = 2
+        self.job_ttl = 86400
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+        self._store = None
+
+    def init_app(self, app):
+        """读取线程数和任务保留时间配置，打开任务状态存储"""
+        self.max_workers = app.config.get('IMPORT_JOB_WORKERS', 2)
+        self.job_ttl = app.config.get('IMPORT_JOB_TTL', 86400)
+        self._store = SQLiteImportJobStore(os.path.join(app.instance_path, IMPORT_JOB_DB_FILE))
+        # 排队或执行中任务的上传文件不被临时文件清理线程删除，任务结束后由任务自身删除
+        temp_artifact_service.register_upload_guard(self.active_upload_paths)
+
+    def active_upload_paths(self):
+        """未结束任务的上传文件路径"""
+        return self._store.file_paths({JOB_PENDING, JOB_RUNNING})
+
+    def _get_executor(self):
+        """按进程创建线程池（fork后的子进程不能使用父进程的线程池）"""
+        if self._executor_pid != os.getpid():
+            with self._executor_lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='excel-import')
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _update(self, job, **fields):
+        job.update(fields, updated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        self._store.save(job, time.time() + self.job_ttl)
+
+    def get_job(self, job_id):
+        """获取任务状态，不存在或已过期返回None"""
+        return self._store.get(job_id)
+
+    def is_cancel_requested(self, job_id):
+        return self._store.is_cancel_requested(job_id)
+
+    def submit(self, app, module_name, file_path, filename, user_id):
+        """
+        提交导入任务
+
+        :param app: Flask应用对象（工作线程中创建应用上下文）
+        :param file_path: 已保存的上传文件路径，任务结束后删除
+        :return: 任务信息
+        """
+        if module_name not in IMPORT_MODULE_LABELS:
+            raise ValueError(f'不支持的模块: {module_name}')
+
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        job = {
+            'id': uuid.uuid4().hex,
+            'module': module_name,
+            'filename': filename,
+            'status': JOB_PENDING,
+            'total_rows': None,
+            'processed_rows': 0,
+            'failed_rows': 0,
+            'error_report': None,
+            'message': None,
+            'created_by': user_id,
+            'created_at': now,
+            'updated_at': now
+        }
+        # 顺带清理过期任务
+        self._store.remove_expired(time.time())
+        self._store.save(job, time.time() + self.job_ttl, file_path)
+        self._get_executor().submit(self._run, app, job, file_path)
+        return job
+
+    def cancel(self, job_id):
+        """请求取消任务：未开始的任务不再执行，执行中的任务在下一批写入后回滚"""
+        job = self.get_job(job_id)
+        if job is None or job['status'] in FINISHED_STATUSES:
+            return job
+        self._store.request_cancel(job_id)
+        return job
+
+    def _run(self, app, job, file_path):
+        """工作线程：读取、校验并写入数据，逐批更新进度"""
+        with app.app_context():
+            from app import db
+
+            label = IMPORT_MODULE_LABELS[job['module']]
+
+            def progress(processed_rows):
+                self._update(job, processed_rows=processed_rows)
+                if self.is_cancel_requested(job['id']):
+                    raise ImportCancelled()
+
+            try:
+                if self.is_cancel_requested(job['id']):
+                    raise ImportCancelled()
+                self._update(job, status=JOB_RUNNING)
+
+                # 总行数按工作表尺寸估算，完成后以实际读取行数为准
+                self._update(job, total_rows=excel_service.count_rows(file_path))
+
+                result = import_service.import_file(job['module'], file_path, job['created_by'], progress)
+                error_manager.log_import_result(result['total'], result['success_count'],
+                                                result['error_count'], label)
+                if result['errors']:
+                    error_file = error_manager.generate_error_report(result['errors'], label, result['error_matrix'],
+                                                                      job['created_by'])
+                    self._update(job, status=JOB_FAILED, total_rows=result['total'], failed_rows=result['error_count'],
+                                 error_report=error_file, message=result['message'])
+                else:
+                    self._update(job, status=JOB_COMPLETED, total_rows=result['total'], processed_rows=result['total'],
+                                 message='数据导入成功')
+            except ImportCancelled:
+                self._update(job, status=JOB_CANCELLED, message='任务已取消，未导入任何数据')
+            except Exception as e:
+                logger.error(f"导入任务{job['id']}执行失败: {str(e)}")
+                self._update(job, status=JOB_FAILED, message=f'导入Excel数据时发生错误: {str(e)}')
+            finally:
+                db.session.remove()
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+
+# 创建全局实例
+import_job_service = ImportJobService()
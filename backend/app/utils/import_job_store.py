@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Excel导入任务存储
+任务状态保存在实例目录下的SQLite文件（WAL模式）中，同一主机的多个worker共享，
+不受缓存清空（flushdb）影响
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Set
+
+
+class SQLiteImportJobStore:
+    """SQLite导入任务存储"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # 每个线程使用独立连接，fork后的子进程重新连接
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS import_jobs ('
+                'id TEXT PRIMARY KEY, data TEXT NOT NULL, status TEXT NOT NULL, file_path TEXT, '
+                'cancel_requested INTEGER NOT NULL DEFAULT 0, expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_import_jobs_expires_at ON import_jobs (expires_at)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def save(self, job: dict, expires_at: float, file_path: Optional[str] = None) -> None:
+        """写入任务状态（不覆盖已请求的取消标记和上传文件路径）"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO import_jobs (id, data, status, file_path, expires_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET data = excluded.data, status = excluded.status, '
+                'expires_at = excluded.expires_at',
+                (job['id'], json.dumps(job, ensure_ascii=False), job['status'], file_path, expires_at)
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._connect().execute(
+            'SELECT data FROM import_jobs WHERE id = ? AND expires_at > ?', (job_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def request_cancel(self, job_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute('UPDATE import_jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        row = self._connect().execute('SELECT cancel_requested FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def file_paths(self, statuses: Iterable[str]) -> Set[str]:
+        """指定状态的未过期任务的上传文件路径"""
+        statuses = list(statuses)
+        rows = self._connect().execute(
+            'SELECT file_path FROM import_jobs WHERE file_path IS NOT NULL AND expires_at > ? '
+            f'AND status IN ({", ".join("?" * len(statuses))})', [time.time()] + statuses
+        )
+        return {file_path for (file_path,) in rows}
+
+    def remove_expired(self, now: float) -> int:
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM import_jobs WHERE expires_at <= ?', (now,)).rowcount
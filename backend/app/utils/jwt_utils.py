@@ -6,7 +6,7 @@ JWT工具类
 
 import jwt
 import datetime
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any
 from flask import current_app
 
 
@@ -58,7 +58,7 @@ class JWTManager:
         try:
             from .session_manager import session_manager
             expires_at = now + datetime.timedelta(seconds=expires_in)
-            session_manager.register_session(user_id, token, expires_at)
+            session_manager.register_session(user_id, token, expires_at, payload['jti'])
         except ImportError:
             pass  # 如果会话管理器不可用，继续正常流程
         
@@ -247,6 +247,44 @@ class JWTManager:
                 pass
         return False
     
+    @staticmethod
+    def revoke_tokens(tokens: List[str]) -> int:
+        """
+        批量撤销JWT token（一次写入黑名单）
+        
+        Args:
+            tokens: JWT token字符串列表
+            
+        Returns:
+            撤销的token数量
+        """
+        blacklist_manager = JWTManager._get_blacklist_manager()
+        if not blacklist_manager:
+            return 0
+        
+        revoked = []
+        for token in tokens:
+            try:
+                payload = jwt.decode(token, options={"verify_signature": False})
+            except jwt.InvalidTokenError:
+                continue
+            jti = payload.get('jti')
+            if jti:
+                exp = payload.get('exp')
+                revoked.append((token, jti, datetime.datetime.fromtimestamp(exp) if exp else None))
+        
+        blacklist_manager.add_many_to_blacklist([(jti, expires_at) for _, jti, expires_at in revoked])
+        
+        # 从会话管理器中移除会话
+        try:
+            from .session_manager import session_manager
+            for token, _, _ in revoked:
+                session_manager.remove_session(token)
+        except ImportError:
+            pass
+        
+        return len(revoked)
+    
     @staticmethod
     def is_token_revoked(token: str) -> bool:
         """
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+# 未命中标记（缓存值可能是空列表等假值，不能用None区分）
+MISSING = object()
+
+class LocalCache:
+    """进程内LRU/TTL缓存（Redis前的一级缓存）
+
+    按键前缀（第一个冒号前的部分）分区，每个分区独立限制条目数并按LRU淘汰。
+    缓存值直接返回给调用方，调用方应将其视为只读。
+    """
+
+    def __init__(self, max_items: int = 1000, max_ttl: int = 60,
+                 prefix_limits: Optional[Dict[str, int]] = None):
+        self.max_items = max_items
+        self.max_ttl = max_ttl
+        self.prefix_limits = dict(prefix_limits or {})
+        self._partitions: Dict[str, OrderedDict] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prefix(key: str) -> str:
+        return key.split(':', 1)[0]
+
+    def _partition_stats(self, prefix: str) -> Dict[str, int]:
+        stats = self._stats.get(prefix)
+        if stats is None:
+            stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+            self._stats[prefix] = stats
+        return stats
+
+    def get(self, key: str) -> Any:
+        """获取缓存，未命中或已过期返回MISSING"""
+        prefix = self._prefix(key)
+        with self._lock:
+            stats = self._partition_stats(prefix)
+            partition = self._partitions.get(prefix)
+            entry = partition.get(key) if partition is not None else None
+            if entry is None:
+                stats['misses'] += 1
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del partition[key]
+                stats['expirations'] += 1
+                stats['misses'] += 1
+                return MISSING
+            partition.move_to_end(key)
+            stats['hits'] += 1
+            return value
+
+    def set(self, key: str, value: Any, expire: int) -> None:
+        """写入缓存，有效期不超过max_ttl"""
+        ttl = min(expire, self.max_ttl) if expire and expire > 0 else self.max_ttl
+        if ttl <= 0:
+            return
+        prefix = self._prefix(key)
+        limit = self.prefix_limits.get(prefix, self.max_items)
+        if limit <= 0:
+            return
+        with self._lock:
+            partition = self._partitions.setdefault(prefix, OrderedDict())
+            partition[key] = (value, time.monotonic() + ttl)
+            partition.move_to_end(key)
+            while len(partition) > limit:
+                partition.popitem(last=False)
+                self._partition_stats(prefix)['evictions'] += 1
+
+    def delete(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                partition = self._partitions.get(self._prefix(key))
+                if partition is not None:
+                    partition.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._partitions.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各前缀分区的条目数、命中/未命中/淘汰/过期次数"""
+        with self._lock:
+            partitions = {}
+            for prefix, stats in self._stats.items():
+                lookups = stats['hits'] + stats['misses']
+                partitions[prefix] = dict(
+                    stats,
+                    size=len(self._partitions.get(prefix, ())),
+                    limit=self.prefix_limits.get(prefix, self.max_items),
+                    hit_rate=round(stats['hits'] / lookups, 4) if lookups else 0.0
+                )
+            return {
+                'max_items': self.max_items,
+                'max_ttl': self.max_ttl,
+                'partitions': partitions
+            }
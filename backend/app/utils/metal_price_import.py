@@ -0,0 +1,108 @@
+"""
+金属价格批量导入
+以(金属种类, 报价日期)为键，已存在的报价更新，不存在的新增
+"""
+import pandas as pd
+from app import db
+from app.models.metal_price import MetalPrice
+from app.utils.cache_hooks import mark_tables_changed
+
+DEFAULT_METAL_TYPE = '1#锌'
+METAL_PRICE_REQUIRED_COLUMNS = ['金属种类', '报价日期', '均价', '涨跌']
+# 每批写入的行数
+UPSERT_BATCH_SIZE = 1000
+
+def _row_errors(df, mask, message):
+    """错误掩码转换为错误信息（行号与原逐行导入一致，从1开始）"""
+    return [(index, f'第{index + 1}行: {message}') for index in df.index[mask]]
+
+def prepare_metal_prices(df):
+    """
+    按列转换和校验金属价格
+
+    :return: (转换后的DataFrame, 错误信息列表)
+    """
+    df = df.reset_index(drop=True)
+    metal_type = df['金属种类'].astype(object).where(df['金属种类'].notna(), None)
+    metal_type = metal_type.map(lambda value: str(value).strip() or None, na_action='ignore')
+    quote_date = pd.to_datetime(df['报价日期'], errors='coerce')
+    average_price = pd.to_numeric(df['均价'], errors='coerce')
+    price_change = pd.to_numeric(df['涨跌'], errors='coerce')
+    empty = pd.Series(float('nan'), index=df.index)
+    high_given = pd.to_numeric(df['最高价'], errors='coerce') if '最高价' in df.columns else empty
+    low_given = pd.to_numeric(df['最低价'], errors='coerce') if '最低价' in df.columns else empty
+    # 未填写最高价/最低价时取均价
+    high_price = high_given.fillna(average_price)
+    low_price = low_given.fillna(average_price)
+
+    missing = df['报价日期'].isna() | df['均价'].isna() | df['涨跌'].isna()
+    checks = [
+        (missing, '必填字段不能为空'),
+        (quote_date.isna(), '日期格式不正确'),
+        (average_price.isna() | price_change.isna(), '均价和涨跌必须是有效的数字'),
+        (high_price < low_price, '最高价不能低于最低价'),
+        (high_given.notna() & (average_price > high_price), '均价不能高于最高价'),
+        (low_given.notna() & (average_price < low_price), '均价不能低于最低价')
+    ]
+    errors, failed = [], pd.Series(False, index=df.index)
+    for mask, message in checks:
+        mask = mask & ~failed
+        errors.extend(_row_errors(df, mask, message))
+        failed |= mask
+
+    prices = pd.DataFrame({
+        'metal_type': metal_type.fillna(DEFAULT_METAL_TYPE),
+        'quote_date': quote_date.dt.date,
+        'high_price': high_price,
+        'low_price': low_price,
+        'average_price': average_price,
+        'price_change': price_change
+    })
+    return prices, [message for _, message in sorted(errors)]
+
+def upsert_metal_prices(prices):
+    """
+    批量新增或更新金属价格（同一上传中重复的键以最后一行为准）
+
+    :param prices: prepare_metal_prices返回的DataFrame（已通过校验）
+    :return: (新增条数, 更新条数)
+    """
+    prices = prices.drop_duplicates(subset=['metal_type', 'quote_date'], keep='last')
+    if prices.empty:
+        return 0, 0
+
+    # 一次查询报价日期范围内已存在的键
+    existing = dict(
+        ((metal_type, quote_date), price_id)
+        for price_id, metal_type, quote_date in db.session.query(
+            MetalPrice.id, MetalPrice.metal_type, MetalPrice.quote_date
+        ).filter(
+            MetalPrice.quote_date.between(prices['quote_date'].min(), prices['quote_date'].max()),
+            MetalPrice.metal_type.in_(prices['metal_type'].unique().tolist())
+        )
+    )
+
+    records = prices.astype(object).where(prices.notna(), None).to_dict('records')
+    inserts, updates = [], []
+    for record in records:
+        price_id = existing.get((record['metal_type'], record['quote_date']))
+        if price_id is None:
+            inserts.append(record)
+        else:
+            updates.append(dict(record, id=price_id))
+
+    for start in range(0, len(inserts), UPSERT_BATCH_SIZE):
+        db.session.execute(MetalPrice.__table__.insert(), inserts[start:start + UPSERT_BATCH_SIZE])
+    for start in range(0, len(updates), UPSERT_BATCH_SIZE):
+        db.session.bulk_update_mappings(MetalPrice, updates[start:start + UPSERT_BATCH_SIZE])
+    mark_tables_changed(db.session, MetalPrice.__tablename__)
+    return len(inserts), len(updates)
+
+def price_key_exists(metal_type, quote_date, exclude_id=None):
+    """同一金属种类在该日期是否已有报价（编辑时排除自身）"""
+    # 调用方可能已修改了待保存对象，查询前不自动flush，避免先触发唯一索引冲突
+    with db.session.no_autoflush:
+        query = MetalPrice.query.filter_by(metal_type=metal_type, quote_date=quote_date)
+        if exclude_id is not None:
+            query = query.filter(MetalPrice.id != exclude_id)
+        return db.session.query(query.exists()).scalar()
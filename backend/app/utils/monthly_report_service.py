@@ -0,0 +1,209 @@
+"""
+分厂月度报表
+物料进出厂、产能、化验和金属价格明细在线程池中并行查询（各线程使用独立的数据库会话），
+合并为一个带汇总工作表的工作簿保存为临时文件，按各表数据的最后更新时间和记录数缓存文件ID
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+import pandas as pd
+from sqlalchemy import func, select
+from app import db
+from app.models.assay_data import AssayData
+from app.models.material_transaction import MaterialTransaction
+from app.models.metal_price import MetalPrice
+from app.models.production_record import ProductionRecord
+from app.utils.cache_service import cache_service
+from app.utils.temp_artifact_service import temp_artifact_service
+from app.utils.excel_export_service import (
+    export_service, material_transaction_export, production_record_export,
+    assay_data_export, metal_price_export
+)
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 报表缓存键前缀（缓存值为临时文件ID，工作簿保存在临时目录中）
+REPORT_KEY_PREFIX = 'monthly_report'
+# 报表临时文件子目录
+REPORT_CATEGORY = 'reports'
+# 按数量加权平均的含量列
+CONTENT_COLUMNS = ['水含量', '锌含量', '铅含量', '氯含量', '氟含量']
+# 化验汇总的指标列
+ASSAY_COLUMNS = CONTENT_COLUMNS + ['铁含量', '硅含量', '硫含量', '高热值', '低热值', '银含量', '回收率']
+
+def parse_month(month):
+    """
+    解析月份
+
+    :param month: YYYY-MM
+    :return: (当月第一天, 下月第一天)
+    """
+    start = datetime.strptime(month, '%Y-%m').date()
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+def _weighted_summary(df, group_column, sum_columns, weight_column):
+    """按分组统计记录数、数量合计及以数量加权的平均含量（缺少含量或数量的行不计入该项），末行为合计"""
+    df = df.astype({column: float for column in sum_columns + CONTENT_COLUMNS})
+
+    def summarize(name, group):
+        row = {group_column: name, '记录数': len(group)}
+        for column in sum_columns:
+            row[f'{column}合计'] = group[column].sum()
+        for column in CONTENT_COLUMNS:
+            mask = group[column].notna() & group[weight_column].notna()
+            weight = group.loc[mask, weight_column].sum()
+            row[f'{column}(加权平均)'] = (
+                round((group.loc[mask, column] * group.loc[mask, weight_column]).sum() / weight, 4)
+                if weight else None
+            )
+        return row
+
+    rows = [summarize(name, group) for name, group in df.groupby(group_column, dropna=False)]
+    rows.append(summarize('合计', df))
+    return pd.DataFrame(rows)
+
+def _assay_summary(df):
+    """化验指标的样品数、平均值、最高值和最低值"""
+    values = df[ASSAY_COLUMNS].astype(float)
+    return pd.DataFrame({
+        '指标': ASSAY_COLUMNS,
+        '样品数': values.count().values,
+        '平均值': values.mean().round(4).values,
+        '最高值': values.max().values,
+        '最低值': values.min().values
+    })
+
+def _price_summary(df):
+    """各金属种类当月报价天数、均价平均值及最高、最低价"""
+    df = df.astype({'均价': float, '最高价': float, '最低价': float})
+    summary = df.groupby('金属种类').agg(
+        报价天数=('报价日期', 'count'),
+        均价平均=('均价', 'mean'),
+        最高价=('最高价', 'max'),
+        最低价=('最低价', 'min')
+    ).reset_index()
+    summary['均价平均'] = summary['均价平均'].round(2)
+    return summary
+
+class MonthlyReportService:
+    """分厂月度报表服务"""
+
+    def __init__(self):
+        """初始化报表服务"""
+        self.max_workers = 4
+        self.cache_ttl = 86400
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+
+    def init_app(self, app):
+        """读取线程数和缓存时间配置"""
+        self.max_workers = app.config.get('REPORT_WORKERS', 4)
+        self.cache_ttl = app.config.get('REPORT_CACHE_TTL', 86400)
+
+    def _get_executor(self):
+        """按进程创建线程池（fork后的子进程不能使用父进程的线程池）"""
+        if self._executor_pid != os.getpid():
+            with self._executor_lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='monthly-report')
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    @staticmethod
+    def _datasets(factory_id, start, end):
+        """各明细工作表：(工作表名, 模型, 筛选条件, 排序列, 导出列函数)"""
+        start_time, end_time = datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+        return [
+            ('物料进出厂', MaterialTransaction,
+             [MaterialTransaction.factory_id == factory_id, MaterialTransaction.date >= start,
+              MaterialTransaction.date < end],
+             MaterialTransaction.date, material_transaction_export),
+            ('产能记录', ProductionRecord,
+             [ProductionRecord.factory_id == factory_id, ProductionRecord.date >= start, ProductionRecord.date < end],
+             ProductionRecord.date, production_record_export),
+            ('化验数据', AssayData,
+             [AssayData.factory_id == factory_id, AssayData.created_at >= start_time, AssayData.created_at < end_time],
+             AssayData.created_at, assay_data_export),
+            ('金属价格', MetalPrice,
+             [MetalPrice.quote_date >= start, MetalPrice.quote_date < end],
+             MetalPrice.quote_date, metal_price_export)
+        ]
+
+    @staticmethod
+    def _data_version(datasets):
+        """一次查询各表范围内的最后更新时间和记录数（记录数用于识别删除）"""
+        columns = []
+        for _, model, conditions, _, _ in datasets:
+            columns.append(select(func.max(model.updated_at)).where(*conditions).scalar_subquery())
+            columns.append(select(func.count(model.id)).where(*conditions).scalar_subquery())
+        return list(db.session.query(*columns).one())
+
+    @staticmethod
+    def _fetch_sheet(app, model, conditions, order_column, export):
+        """工作线程：在独立的数据库会话中读取一个明细工作表"""
+        with app.app_context():
+            try:
+                headers, query = export(model.query.filter(*conditions).order_by(order_column))
+                return pd.DataFrame(list(export_service.iter_rows(query)), columns=headers)
+            finally:
+                db.session.remove()
+
+    def _build(self, app, datasets, download_name):
+        """生成工作簿并保存为临时文件，返回文件ID"""
+        futures = [
+            (name, self._get_executor().submit(self._fetch_sheet, app, model, conditions, order_column, export))
+            for name, model, conditions, order_column, export in datasets
+        ]
+        sheets = {name: future.result() for name, future in futures}
+
+        summaries = {
+            '进出厂汇总': _weighted_summary(sheets['物料进出厂'], '类型', ['发数', '到数'], '到数'),
+            '产能汇总': _weighted_summary(sheets['产能记录'], '物料名称', ['产量'], '产量'),
+            '化验汇总': _assay_summary(sheets['化验数据']),
+            '金属价格汇总': _price_summary(sheets['金属价格'])
+        }
+
+        with temp_artifact_service.spool() as output:
+            with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                for name, df in list(summaries.items()) + list(sheets.items()):
+                    df.to_excel(writer, sheet_name=name, index=False)
+            return temp_artifact_service.save(REPORT_CATEGORY, output, download_name, ttl=self.cache_ttl)
+
+    def get_report(self, app, factory_id, month, download_name):
+        """
+        获取分厂月度报表工作簿
+
+        :param app: Flask应用对象（工作线程中创建应用上下文）
+        :param month: YYYY-MM
+        :param download_name: 生成时使用的下载文件名
+        :return: 临时文件元数据，通过temp_artifact_service.send下载
+        """
+        start, end = parse_month(month)
+        datasets = self._datasets(factory_id, start, end)
+        version = hashlib.md5(json.dumps(self._data_version(datasets), default=str).encode()).hexdigest()
+        cache_key = f"{REPORT_KEY_PREFIX}:{factory_id}:{month}:{version}"
+
+        # 缓存的临时文件已被清理（超过容量上限等）时重新生成
+        artifact_id = cache_service.get(cache_key)
+        meta = temp_artifact_service.get(artifact_id) if artifact_id else None
+        if meta is not None:
+            return meta
+
+        artifact_id = self._build(app, datasets, download_name)
+        # 以表名作为标签，提交变更时立即失效（同一秒内的修改不改变最后更新时间）
+        tables = [model.__tablename__ for _, model, _, _, _ in datasets]
+        cache_service.set(cache_key, artifact_id, self.cache_ttl, tags=tables)
+        logger.info(f"月度报表生成成功: 分厂{factory_id} {month}")
+        return temp_artifact_service.get(artifact_id)
+
+# 创建全局实例
+monthly_report_service = MonthlyReportService()
@@ -1,7 +1,11 @@
 from flask import request
-from sqlalchemy import desc, asc
+from sqlalchemy import desc, asc, and_, or_
 from sqlalchemy.orm import joinedload
 from typing import Optional, Dict, Any, List, Tuple
+from datetime import date, datetime
+from decimal import Decimal
+import base64
+import json
 from app import db
 from app.utils.cache_service import cache_service, CACHE_TIMEOUT
 
@@ -49,12 +53,129 @@ class PaginationService:
         
         return query
     
+    def is_cursor_request(self) -> bool:
+        """请求是否使用游标（keyset）分页：携带cursor参数或pagination=cursor"""
+        return request.args.get('cursor') is not None or request.args.get('pagination') == 'cursor'
+    
+    def encode_cursor(self, sort_by: str, sort_order: str, sort_value: Any, last_id: int) -> str:
+        """生成不透明游标：记录排序字段、方向以及最后一行的排序值和ID"""
+        if isinstance(sort_value, (date, datetime)):
+            sort_value = sort_value.isoformat()
+        payload = json.dumps([sort_by, sort_order, sort_value, last_id], separators=(',', ':'), default=str)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+    
+    def decode_cursor(self, cursor: str, model_class, sort_by: str, sort_order: str) -> Optional[Tuple[Any, int]]:
+        """解析游标，排序条件与当前请求不一致或格式错误时返回None（从第一页开始）"""
+        if not cursor:
+            return None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            cursor_sort, cursor_order, sort_value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            last_id = int(last_id)
+        except (ValueError, TypeError):
+            return None
+        if cursor_sort != sort_by or cursor_order != sort_order:
+            return None
+        # 按列类型还原日期/时间值，保证与数据库比较时类型一致；
+        # 排序值须为与列类型相符的标量（列表、字典、布尔值等无法与列比较）
+        if sort_value is None:
+            return sort_value, last_id
+        if isinstance(sort_value, bool) or not isinstance(sort_value, (str, int, float)):
+            return None
+        column = getattr(model_class, sort_by, None) if sort_by != 'id' else None
+        try:
+            python_type = column.property.columns[0].type.python_type if column is not None else int
+        except (AttributeError, NotImplementedError):
+            python_type = None
+        try:
+            if python_type in (datetime, date):
+                if not isinstance(sort_value, str):
+                    return None
+                sort_value = python_type.fromisoformat(sort_value)
+            elif python_type is str and not isinstance(sort_value, str):
+                return None
+            elif python_type in (int, float, Decimal) and isinstance(sort_value, str):
+                return None
+        except ValueError:
+            return None
+        return sort_value, last_id
+    
+    def apply_keyset(self, query, model_class, sort_by: str, sort_order: str, position: Optional[Tuple[Any, int]]):
+        """按 (排序字段, id) 应用keyset排序和起始位置过滤
+        
+        排序字段为空值时按SQLite/MySQL的规则处理：升序时NULL在前，降序时NULL在后。
+        """
+        id_column = model_class.id
+        sort_column = getattr(model_class, sort_by) if sort_by != 'id' and hasattr(model_class, sort_by) else None
+        is_desc = sort_order == 'desc'
+        direction = desc if is_desc else asc
+        
+        if sort_column is not None:
+            query = query.order_by(direction(sort_column), direction(id_column))
+        else:
+            query = query.order_by(direction(id_column))
+        
+        if position is None:
+            return query
+        
+        sort_value, last_id = position
+        id_after = id_column < last_id if is_desc else id_column > last_id
+        if sort_column is None:
+            return query.filter(id_after)
+        
+        if sort_value is None:
+            same_group = and_(sort_column.is_(None), id_after)
+            if is_desc:
+                return query.filter(same_group)
+            return query.filter(or_(same_group, sort_column.isnot(None)))
+        
+        value_after = sort_column < sort_value if is_desc else sort_column > sort_value
+        condition = or_(value_after, and_(sort_column == sort_value, id_after))
+        if is_desc:
+            # 降序时NULL排在最后，仍属于后续页
+            condition = or_(condition, sort_column.is_(None))
+        return query.filter(condition)
+    
+    def paginate_keyset(self, query, model_class, sort_by: str, sort_order: str, per_page: int) -> Dict[str, Any]:
+        """游标分页：不使用OFFSET，默认不统计总数（with_total=true时统计）"""
+        cursor = request.args.get('cursor', '')
+        position = self.decode_cursor(cursor, model_class, sort_by, sort_order)
+        
+        total = None
+        if request.args.get('with_total', 'false').lower() == 'true':
+            total = query.order_by(None).count()
+        
+        query = self.apply_keyset(query, model_class, sort_by, sort_order, position)
+        # 多取一行用于判断是否还有下一页
+        rows = query.limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        
+        next_cursor = None
+        if has_next and items:
+            last = items[-1]
+            sort_value = getattr(last, sort_by, None) if sort_by != 'id' else last.id
+            next_cursor = self.encode_cursor(sort_by, sort_order, sort_value, last.id)
+        
+        return {
+            'items': items,
+            'total': total,
+            'per_page': per_page,
+            'has_prev': position is not None,
+            'has_next': has_next,
+            'cursor': cursor or None,
+            'next_cursor': next_cursor,
+            'sort_by': sort_by,
+            'sort_order': sort_order
+        }
+    
     def paginate_query(self, query, model_class, 
                       default_sort: str = 'created_at',
                       allowed_sorts: Optional[List[str]] = None,
                       eager_load: Optional[List[str]] = None,
                       use_cache: bool = False,
-                      cache_timeout: Optional[int] = None) -> Dict[str, Any]:
+                      cache_timeout: Optional[int] = None,
+                      allow_cursor: bool = False) -> Dict[str, Any]:
         """执行分页查询
         
         Args:
@@ -65,6 +186,7 @@ class PaginationService:
             eager_load: 需要预加载的关联关系列表
             use_cache: 是否使用缓存
             cache_timeout: 缓存超时时间
+            allow_cursor: 是否允许游标分页（请求携带cursor或pagination=cursor时启用）
         
         Returns:
             包含分页数据和元信息的字典
@@ -75,6 +197,16 @@ class PaginationService:
         # 获取排序参数
         sort_by, sort_order = self.get_sort_params(default_sort, allowed_sorts)
         
+        # 应用预加载
+        if eager_load:
+            for relation in eager_load:
+                if hasattr(model_class, relation):
+                    query = query.options(joinedload(getattr(model_class, relation)))
+        
+        # 游标分页：不走页码缓存
+        if allow_cursor and self.is_cursor_request():
+            return self.paginate_keyset(query, model_class, sort_by, sort_order, per_page)
+        
         # 简化的缓存处理（可选）
         cache_key = None
         if use_cache and cache_service.enabled:
@@ -83,12 +215,6 @@ class PaginationService:
             if cached_result:
                 return cached_result
         
-        # 应用预加载
-        if eager_load:
-            for relation in eager_load:
-                if hasattr(model_class, relation):
-                    query = query.options(joinedload(getattr(model_class, relation)))
-        
         # 应用排序
         query = self.apply_sorting(query, model_class, sort_by, sort_order)
         
@@ -118,7 +244,7 @@ class PaginationService:
             timeout = cache_timeout or CACHE_TIMEOUT['MEDIUM']
             cache_result = result.copy()
             cache_result['items'] = [item.to_dict() if hasattr(item, 'to_dict') else str(item) for item in pagination.items]
-            cache_service.set(cache_key, cache_result, timeout)
+            cache_service.set(cache_key, cache_result, timeout, tags=[model_class.__tablename__])
         
         return result
     
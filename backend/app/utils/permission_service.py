@@ -0,0 +1,79 @@
+from flask import g, has_app_context
+from sqlalchemy import select
+from app import db
+from app.utils.cache_service import cache_service, CACHE_TIMEOUT
+from app.utils.cache_hooks import on_tables_committed
+
+# 权限版本号：角色、权限及其关联变更后递增，旧版本的权限集合缓存自然失效
+PERMISSION_VERSION_KEY = 'permission_version'
+# 影响用户权限集合的表（通过user.roles修改角色时，cache_hooks按关系集合的变更登记user_roles）
+PERMISSION_TABLES = {'roles', 'user_roles', 'permissions', 'role_permissions'}
+
+def build_user_permissions_stmt(user_id, *columns):
+    """用户通过角色获得的权限查询（permissions、role_permissions、user_roles三表联查，一次往返）
+
+    columns为空时查询Permission实体。
+    """
+    from app.models.permission import Permission, RolePermission
+    from app.models.role import UserRole
+
+    return (
+        select(*(columns or (Permission,)))
+        .join(RolePermission, RolePermission.permission_id == Permission.id)
+        .join(UserRole, UserRole.role_id == RolePermission.role_id)
+        .where(UserRole.user_id == user_id)
+        .distinct()
+    )
+
+def resolve_permissions(user_id):
+    """一次查询获取用户的全部Permission对象"""
+    return db.session.execute(build_user_permissions_stmt(user_id)).scalars().all()
+
+def _load_permission_names(user_id):
+    """一次查询加载用户通过角色获得的全部权限名"""
+    from app.models.permission import Permission
+
+    return frozenset(db.session.execute(build_user_permissions_stmt(user_id, Permission.name)).scalars())
+
+def get_permission_version():
+    """当前权限版本号（缓存不可用时为0）"""
+    return cache_service.get(PERMISSION_VERSION_KEY) or 0
+
+def get_permission_set(user):
+    """获取用户的权限名集合
+
+    同一请求内只加载一次（缓存在g上），跨请求缓存在Redis中并以权限版本号作为键的一部分。
+    超级管理员拥有全部权限，由调用方单独判断。
+    """
+    request_cache = None
+    if has_app_context():
+        request_cache = g.setdefault('_permission_sets', {})
+        if user.id in request_cache:
+            return request_cache[user.id]
+
+    cache_key = f"user_permissions:{user.id}:{get_permission_version()}"
+    cached = cache_service.get(cache_key)
+    if cached is not None:
+        permissions = frozenset(cached)
+    else:
+        permissions = _load_permission_names(user.id)
+        cache_service.set(cache_key, sorted(permissions), CACHE_TIMEOUT['LONG'])
+
+    if request_cache is not None:
+        request_cache[user.id] = permissions
+    return permissions
+
+def user_has_permission(user, permission):
+    """检查用户是否具有权限，permission可以是权限名或Permission对象"""
+    if user.is_superuser:
+        return True
+    name = permission if isinstance(permission, str) else permission.name
+    return name in get_permission_set(user)
+
+def invalidate_permission_sets(tables=None):
+    """角色/权限变更后递增版本号，并清空当前请求内的权限集合"""
+    cache_service.incr(PERMISSION_VERSION_KEY)
+    if has_app_context():
+        g.pop('_permission_sets', None)
+
+on_tables_committed(PERMISSION_TABLES, invalidate_permission_sets)
@@ -0,0 +1,83 @@
+import hashlib
+import json
+from contextlib import nullcontext
+from functools import wraps
+from typing import Iterable, Optional
+from flask import current_app, request, jsonify, g
+from flask_login import current_user
+from app.utils.cache_service import cache_service, CACHE_TIMEOUT
+from app.utils.factory_scope import get_user_factory_ids
+
+def get_user_scope():
+    """当前用户的数据范围：超级管理员标识、负责的分厂ID、权限集合
+
+    数据范围相同的用户可以共享同一份缓存。
+    """
+    user = getattr(g, 'current_user', None) or current_user
+    if not user or not getattr(user, 'is_authenticated', False):
+        return None
+    if user.is_superuser:
+        return {'superuser': True}
+    factory_ids = get_user_factory_ids(user)
+    permissions = sorted(user.get_permission_names())
+    return {'factory_ids': factory_ids, 'permissions': permissions}
+
+def build_response_cache_key(prefix: str, vary_on_user: bool = True) -> str:
+    """按路径、规范化的查询参数及用户数据范围生成缓存键（完整SHA-256）"""
+    key_data = {
+        'path': request.path,
+        'args': sorted(request.args.items(multi=True)),
+        'scope': get_user_scope() if vary_on_user else None
+    }
+    key_hash = hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{prefix}:{key_hash}"
+
+def make_cached_response(body, etag: str, expire: int):
+    """生成带ETag的JSON响应，客户端ETag一致时返回304"""
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(body)
+    response.set_etag(etag)
+    # 浏览器每次都需用ETag向服务端确认，服务端缓存时间为expire
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['X-Cache-TTL'] = str(expire)
+    return response
+
+def cache_response(prefix: str, expire: int = CACHE_TIMEOUT['MEDIUM'],
+                   tags: Optional[Iterable[str]] = None, vary_on_user: bool = True):
+    """视图级响应缓存装饰器
+
+    仅缓存返回dict/list的视图（返回Response或(body, status)元组时不缓存）。
+
+    Args:
+        prefix: 缓存键前缀
+        expire: 路由的缓存时间（秒）
+        tags: 数据依赖的表名，相关表提交变更后缓存自动失效
+        vary_on_user: 是否按用户数据范围区分缓存，数据与用户无关的路由可关闭
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return func(*args, **kwargs)
+
+            # 缓存未启用时仍计算ETag，支持304
+            cache_key = build_response_cache_key(prefix, vary_on_user) if cache_service.enabled else None
+            entry = cache_service.get(cache_key) if cache_key else None
+            if entry is None:
+                # 未命中时同一缓存键只由一个请求执行视图，拿到锁后再检查一次
+                with cache_service.single_flight(cache_key) if cache_key else nullcontext():
+                    entry = cache_service.get(cache_key) if cache_key else None
+                    if entry is None:
+                        body = func(*args, **kwargs)
+                        if not isinstance(body, (dict, list)):
+                            return body
+                        payload = json.dumps(body, sort_keys=True, default=str)
+                        entry = {'body': body, 'etag': hashlib.sha256(payload.encode()).hexdigest()}
+                        if cache_key:
+                            cache_service.set(cache_key, entry, expire, tags=tags)
+
+            return make_cached_response(entry['body'], entry['etag'], expire)
+        return wrapper
+    return decorator
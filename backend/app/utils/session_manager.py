@@ -7,9 +7,9 @@
 import threading
 import time
 import datetime
-from typing import Dict, Set
-from flask import current_app
-from .jwt_utils import JWTManager
+from .cache_service import cache_service
+from .blacklist_manager import blacklist_manager
+from .session_store import MemorySessionStore, RedisSessionStore, session_id
 
 
 class SessionManager:
@@ -22,8 +22,23 @@ class SessionManager:
     def __init__(self):
         self._cleanup_thread = None
         self._stop_cleanup = False
-        self._active_sessions = {}  # 存储活跃会话信息
-        self._lock = threading.Lock()
+        self.cleanup_interval = 300
+        # 活跃会话存储，init_app中按配置选择Redis或进程内存储
+        self.store = MemorySessionStore()
+    
+    def init_app(self, app):
+        """选择会话存储：SESSION_STORE为memory（默认）或redis
+        
+        多worker部署需要显式启用Redis，否则请求落到未签发token的worker时会被判定为会话超时；
+        清空缓存（flushdb）会同时清空Redis中的会话。
+        """
+        self.cleanup_interval = app.config.get('SESSION_CLEANUP_INTERVAL', self.cleanup_interval)
+        if app.config.get('SESSION_STORE', 'memory') == 'redis':
+            if cache_service.enabled:
+                self.store = RedisSessionStore(cache_service.redis_client)
+                return
+            app.logger.warning("Redis不可用，会话存储使用进程内存储")
+        self.store = MemorySessionStore()
     
     def start_cleanup_thread(self):
         """启动清理线程"""
@@ -48,30 +63,18 @@ class SessionManager:
             try:
                 self._remove_expired_sessions()  # 清理过期会话
                 # 注意：黑名单清理已移至BlacklistManager，此处专注于会话管理
-                # 每5分钟清理一次
-                time.sleep(300)
+                # 按SESSION_CLEANUP_INTERVAL间隔清理（默认5分钟）
+                time.sleep(self.cleanup_interval)
             except Exception as e:
                 # 记录错误但不停止线程
                 print(f"Token cleanup error: {e}")
                 time.sleep(60)  # 出错时等待1分钟再重试
     
     def _remove_expired_sessions(self):
-        """移除过期的会话"""
-        with self._lock:
-            current_time = datetime.datetime.utcnow()
-            expired_tokens = []
-            
-            # 检查活跃会话，移除过期的
-            for token, session in list(self._active_sessions.items()):
-                if session['expires_at'] <= current_time:
-                    expired_tokens.append(token)
-            
-            # 移除过期会话
-            for token in expired_tokens:
-                self._active_sessions.pop(token, None)
-            
-            if expired_tokens:
-                print(f"Cleaned up {len(expired_tokens)} expired sessions")
+        """移除过期的会话（存储按过期时间排序，只处理已过期的条目）"""
+        removed = self.store.remove_expired(datetime.datetime.utcnow())
+        if removed:
+            print(f"Cleaned up {removed} expired sessions")
     
     def _remove_expired_tokens(self):
         """专注于会话清理，不再处理黑名单清理
@@ -81,101 +84,88 @@ class SessionManager:
         # 此方法现在专注于会话管理，黑名单清理由BlacklistManager负责
         pass
     
-    def register_session(self, user_id: int, token: str, expires_at: datetime.datetime):
-        """注册活跃会话"""
-        with self._lock:
-            self._active_sessions[token] = {
-                'user_id': user_id,
-                'expires_at': expires_at,
-                'last_activity': datetime.datetime.utcnow()
-            }
+    def register_session(self, user_id: int, token: str, expires_at: datetime.datetime, jti: str = None):
+        """注册活跃会话（只保存token摘要和jti）"""
+        self.store.add(session_id(token), jti, user_id, expires_at, datetime.datetime.utcnow())
     
     def update_session_activity(self, token: str):
         """更新会话活动时间"""
-        with self._lock:
-            if token in self._active_sessions:
-                self._active_sessions[token]['last_activity'] = datetime.datetime.utcnow()
+        sid = session_id(token)
+        session = self.store.get(sid)
+        if session:
+            self.store.touch(sid, datetime.datetime.utcnow(), session['expires_at'])
+    
+    def refresh_session(self, token: str, timeout_minutes: int = 30) -> bool:
+        """检查会话是否超时，未超时时更新活动时间（只读取一次会话）
+        
+        Returns:
+            会话有效返回True，不存在或已超时返回False
+        """
+        sid = session_id(token)
+        session = self.store.get(sid)
+        current_time = datetime.datetime.utcnow()
+        if not session or current_time - session['last_activity'] > datetime.timedelta(minutes=timeout_minutes):
+            return False
+        self.store.touch(sid, current_time, session['expires_at'])
+        return True
     
     def remove_session(self, token: str):
         """移除会话"""
-        with self._lock:
-            self._active_sessions.pop(token, None)
+        self.store.remove(session_id(token))
     
     def get_active_sessions_count(self, user_id: int = None) -> int:
         """获取活跃会话数量"""
-        with self._lock:
-            if user_id is None:
-                return len(self._active_sessions)
-            
-            count = 0
-            for session in self._active_sessions.values():
-                if session['user_id'] == user_id:
-                    count += 1
-            return count
+        return self.store.count(datetime.datetime.utcnow(), user_id)
     
     def get_user_sessions(self, user_id: int) -> list:
         """获取用户的所有活跃会话"""
-        with self._lock:
-            sessions = []
-            current_time = datetime.datetime.utcnow()
-            
-            for token, session in self._active_sessions.items():
-                if session['user_id'] == user_id:
-                    # 检查会话是否过期
-                    if session['expires_at'] > current_time:
-                        sessions.append({
-                            'token': token[:20] + '...',  # 只显示部分token
-                            'expires_at': session['expires_at'],
-                            'last_activity': session['last_activity']
-                        })
-            
-            return sessions
+        sessions = self.store.get_user_sessions(user_id, datetime.datetime.utcnow())
+        return [{
+            'session_id': session['id'][:16],  # 只显示部分会话ID（token摘要）
+            'expires_at': session['expires_at'],
+            'last_activity': session['last_activity']
+        } for session in sessions]
     
     def revoke_user_sessions(self, user_id: int, exclude_token: str = None) -> int:
-        """撤销用户的所有会话（除了指定的token）"""
-        with self._lock:
-            revoked_count = 0
-            tokens_to_revoke = []
-            
-            for token, session in self._active_sessions.items():
-                if session['user_id'] == user_id and token != exclude_token:
-                    tokens_to_revoke.append(token)
-            
-            for token in tokens_to_revoke:
-                JWTManager.revoke_token(token)
-                self._active_sessions.pop(token, None)
-                revoked_count += 1
-            
-            return revoked_count
+        """撤销用户的所有会话（除了指定的token），按会话记录的jti一次写入黑名单"""
+        exclude_sid = session_id(exclude_token) if exclude_token else None
+        sessions = [session for session in self.store.get_user_sessions(user_id, datetime.datetime.utcnow())
+                    if session['id'] != exclude_sid]
+        # 黑名单过期时间与JWTManager.revoke_tokens一致，使用本地时间
+        blacklist_manager.add_many_to_blacklist([
+            (session['jti'], datetime.datetime.fromtimestamp(
+                session['expires_at'].replace(tzinfo=datetime.timezone.utc).timestamp()))
+            for session in sessions if session['jti']
+        ])
+        # 没有jti的会话移除后，其token在下次请求时按会话超时处理
+        for session in sessions:
+            self.store.remove(session['id'])
+        return len(sessions)
     
     def check_session_timeout(self, token: str, timeout_minutes: int = 30) -> bool:
         """检查会话是否超时"""
-        with self._lock:
-            session = self._active_sessions.get(token)
-            if not session:
-                return True  # 会话不存在，视为超时
-            
-            current_time = datetime.datetime.utcnow()
-            last_activity = session['last_activity']
-            timeout_delta = datetime.timedelta(minutes=timeout_minutes)
-            
-            return current_time - last_activity > timeout_delta
+        session = self.store.get(session_id(token))
+        if not session:
+            return True  # 会话不存在，视为超时
+        
+        current_time = datetime.datetime.utcnow()
+        timeout_delta = datetime.timedelta(minutes=timeout_minutes)
+        return current_time - session['last_activity'] > timeout_delta
     
     def get_session_info(self, token: str) -> dict:
         """获取会话信息"""
-        with self._lock:
-            session = self._active_sessions.get(token)
-            if not session:
-                return None
-            
-            current_time = datetime.datetime.utcnow()
-            return {
-                'user_id': session['user_id'],
-                'expires_at': session['expires_at'],
-                'last_activity': session['last_activity'],
-                'is_expired': session['expires_at'] <= current_time,
-                'time_until_expiry': (session['expires_at'] - current_time).total_seconds() if session['expires_at'] > current_time else 0
-            }
+        session = self.store.get(session_id(token))
+        if not session:
+            return None
+        
+        current_time = datetime.datetime.utcnow()
+        return {
+            'user_id': session['user_id'],
+            'expires_at': session['expires_at'],
+            'last_activity': session['last_activity'],
+            'is_expired': session['expires_at'] <= current_time,
+            'time_until_expiry': (session['expires_at'] - current_time).total_seconds() if session['expires_at'] > current_time else 0
+        }
 
 
 # 全局会话管理器实例
@@ -185,6 +175,7 @@ session_manager = SessionManager()
 def init_session_manager(app):
     """初始化会话管理器"""
     with app.app_context():
+        session_manager.init_app(app)
         session_manager.start_cleanup_thread()
         app.logger.info("Session manager initialized and cleanup thread started")
 
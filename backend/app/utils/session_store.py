@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+会话存储
+会话按token摘要（会话ID）保存，并按用户建立二级索引；只记录token的jti，不保存token本身：
+- MemorySessionStore：进程内字典，适用于单进程部署
+- RedisSessionStore：各worker共享，会话键使用Redis原生过期时间
+"""
+
+import datetime
+import hashlib
+import heapq
+import threading
+from typing import Dict, List, Optional
+
+
+def session_id(token: str) -> str:
+    """会话ID：token的SHA-256摘要"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _to_timestamp(value: datetime.datetime) -> float:
+    """UTC时间（不带时区）转时间戳"""
+    return value.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def _from_timestamp(value) -> datetime.datetime:
+    """时间戳转UTC时间（不带时区），与datetime.utcnow()一致"""
+    return datetime.datetime.utcfromtimestamp(float(value))
+
+
+class MemorySessionStore:
+    """进程内会话存储
+
+    过期时间保存在最小堆中，清理时只弹出已过期的条目；移除会话时不从堆中删除，弹出时再跳过。
+    """
+
+    # 每次持有锁时最多清理的条目数，清理大量过期会话时不长时间阻塞请求线程
+    CLEANUP_BATCH_SIZE = 1000
+
+    def __init__(self):
+        self._sessions = {}  # 会话ID -> 会话信息
+        self._user_sessions = {}  # 用户ID -> 会话ID集合
+        self._expiry_heap = []  # (过期时间, 会话ID)
+        self._lock = threading.Lock()
+
+    def add(self, sid: str, jti: Optional[str], user_id: int, expires_at: datetime.datetime,
+            last_activity: datetime.datetime):
+        with self._lock:
+            self._sessions[sid] = {
+                'id': sid,
+                'jti': jti,
+                'user_id': user_id,
+                'expires_at': expires_at,
+                'last_activity': last_activity
+            }
+            self._user_sessions.setdefault(user_id, set()).add(sid)
+            heapq.heappush(self._expiry_heap, (expires_at, sid))
+
+    def get(self, sid: str) -> Optional[Dict]:
+        with self._lock:
+            session = self._sessions.get(sid)
+            return dict(session) if session else None
+
+    def touch(self, sid: str, last_activity: datetime.datetime, expires_at: datetime.datetime):
+        with self._lock:
+            if sid in self._sessions:
+                self._sessions[sid]['last_activity'] = last_activity
+
+    def _pop(self, sid: str):
+        session = self._sessions.pop(sid, None)
+        if session:
+            sids = self._user_sessions.get(session['user_id'])
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._user_sessions[session['user_id']]
+
+    def remove(self, sid: str):
+        with self._lock:
+            self._pop(sid)
+
+    def get_user_sessions(self, user_id: int, now: datetime.datetime) -> List[Dict]:
+        with self._lock:
+            return [dict(self._sessions[sid]) for sid in self._user_sessions.get(user_id, ())
+                    if self._sessions[sid]['expires_at'] > now]
+
+    def count(self, now: datetime.datetime, user_id: int = None) -> int:
+        with self._lock:
+            if user_id is None:
+                return len(self._sessions)
+            return sum(1 for sid in self._user_sessions.get(user_id, ())
+                       if self._sessions[sid]['expires_at'] > now)
+
+    def remove_expired(self, now: datetime.datetime) -> int:
+        removed = 0
+        while True:
+            with self._lock:
+                for _ in range(self.CLEANUP_BATCH_SIZE):
+                    if not self._expiry_heap or self._expiry_heap[0][0] > now:
+                        return removed
+                    expires_at, sid = heapq.heappop(self._expiry_heap)
+                    session = self._sessions.get(sid)
+                    # 已移除或重新注册（过期时间不同）的会话跳过
+                    if session and session['expires_at'] == expires_at:
+                        self._pop(sid)
+                        removed += 1
+
+
+class RedisSessionStore:
+    """Redis会话存储
+
+    - <前缀>:token:<会话ID>：会话哈希（jti、用户ID、过期时间、最后活动时间），按token过期时间自动删除
+    - <前缀>:user:<用户ID>：用户会话索引（有序集合，分值为过期时间戳）
+    - <前缀>:all：全部会话索引，用于统计总数
+    索引按过期时间排序，过期成员在写入、读取和定期清理时按分值区间移除。
+    """
+
+    def __init__(self, client, prefix: str = 'session'):
+        self.client = client
+        self.prefix = prefix
+        self._all_key = f"{prefix}:all"
+
+    def _session_key(self, sid: str) -> str:
+        return f"{self.prefix}:token:{sid}"
+
+    def _user_key(self, user_id) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    @staticmethod
+    def _parse(sid: str, data: Dict) -> Optional[Dict]:
+        # 只有最后活动时间的哈希是会话移除后并发更新留下的残余，视为不存在（随过期时间删除）
+        if not data or 'user_id' not in data:
+            return None
+        return {
+            'id': sid,
+            'jti': data.get('jti') or None,
+            'user_id': int(data['user_id']),
+            'expires_at': _from_timestamp(data['expires_at']),
+            'last_activity': _from_timestamp(data['last_activity'])
+        }
+
+    def add(self, sid: str, jti: Optional[str], user_id: int, expires_at: datetime.datetime,
+            last_activity: datetime.datetime):
+        expires_ts = _to_timestamp(expires_at)
+        key = self._session_key(sid)
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping={
+            'jti': jti or '',
+            'user_id': user_id,
+            'expires_at': expires_ts,
+            'last_activity': _to_timestamp(last_activity)
+        })
+        pipe.expireat(key, int(expires_ts) + 1)
+        # 顺带移除该用户索引中已过期的成员（按分值区间删除，只涉及过期的条目）
+        pipe.zremrangebyscore(self._user_key(user_id), '-inf', _to_timestamp(last_activity))
+        pipe.zadd(self._user_key(user_id), {sid: expires_ts})
+        pipe.zadd(self._all_key, {sid: expires_ts})
+        pipe.execute()
+
+    def get(self, sid: str) -> Optional[Dict]:
+        return self._parse(sid, self.client.hgetall(self._session_key(sid)))
+
+    def touch(self, sid: str, last_activity: datetime.datetime, expires_at: datetime.datetime):
+        # 写入和过期时间在同一事务中设置，会话恰好被移除时也不会留下没有过期时间的键
+        key = self._session_key(sid)
+        pipe = self.client.pipeline()
+        pipe.hset(key, 'last_activity', _to_timestamp(last_activity))
+        pipe.expireat(key, int(_to_timestamp(expires_at)) + 1)
+        pipe.execute()
+
+    def remove(self, sid: str):
+        key = self._session_key(sid)
+        user_id = self.client.hget(key, 'user_id')
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        if user_id is not None:
+            pipe.zrem(self._user_key(user_id), sid)
+        pipe.zrem(self._all_key, sid)
+        pipe.execute()
+
+    def get_user_sessions(self, user_id: int, now: datetime.datetime) -> List[Dict]:
+        user_key = self._user_key(user_id)
+        self.client.zremrangebyscore(user_key, '-inf', _to_timestamp(now))
+        sids = self.client.zrange(user_key, 0, -1)
+        if not sids:
+            return []
+        pipe = self.client.pipeline()
+        for sid in sids:
+            pipe.hgetall(self._session_key(sid))
+        sessions = [self._parse(sid, data) for sid, data in zip(sids, pipe.execute())]
+        return [session for session in sessions if session]
+
+    def count(self, now: datetime.datetime, user_id: int = None) -> int:
+        key = self._all_key if user_id is None else self._user_key(user_id)
+        return self.client.zcount(key, f"({_to_timestamp(now)}", '+inf')
+
+    def remove_expired(self, now: datetime.datetime) -> int:
+        # 会话键由Redis自动过期，这里只清理全部会话索引；用户索引在读取时清理
+        return self.client.zremrangebyscore(self._all_key, '-inf', _to_timestamp(now))
@@ -0,0 +1,215 @@
+"""
+临时文件管理
+导出文件、错误报告和上传文件统一在此创建：生成过程中小文件保存在内存中，大文件写入临时目录；
+供下载的文件及其元数据保存在临时目录中（不受缓存清空影响），按保留时间和容量上限由后台线程定期清理
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from flask import send_file
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 下载文件元数据子目录：<文件ID>.json，记录下载文件名、可下载用户、文件路径和过期时间
+META_CATEGORY = 'meta'
+# 上传文件子目录：文件可能仍在等待导入任务处理，不参与容量淘汰，按较长的保留时间清理
+UPLOAD_CATEGORY = 'uploads'
+ARTIFACT_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+class TempArtifactService:
+    """临时文件服务"""
+
+    def __init__(self):
+        """初始化临时文件服务"""
+        self.root = os.path.abspath(os.path.join('temp', 'excel'))
+        self.memory_limit = 1024 * 1024
+        self.ttl = 3600
+        self.upload_ttl = 86400
+        self.disk_quota = 512 * 1024 * 1024
+        self.reap_interval = 300
+        # 返回仍在使用的上传文件路径的回调（如未结束的导入任务），清理时跳过这些文件
+        self._upload_guards = []
+        self._reaper_pid = None
+        self._reaper_lock = threading.Lock()
+
+    def init_app(self, app):
+        """读取临时目录、内存阈值、保留时间和容量上限配置"""
+        self.root = os.path.abspath(os.path.join(app.config.get('TEMP_FOLDER', 'temp'), 'excel'))
+        self.memory_limit = app.config.get('TEMP_ARTIFACT_MEMORY_LIMIT', self.memory_limit)
+        self.ttl = app.config.get('TEMP_ARTIFACT_TTL', self.ttl)
+        self.upload_ttl = app.config.get('TEMP_ARTIFACT_UPLOAD_TTL', self.upload_ttl)
+        self.disk_quota = app.config.get('TEMP_ARTIFACT_DISK_QUOTA', self.disk_quota)
+        self.reap_interval = app.config.get('TEMP_ARTIFACT_REAP_INTERVAL', self.reap_interval)
+
+    def register_upload_guard(self, callback):
+        """
+        注册上传文件保护回调
+
+        :param callback: 无参数，返回仍在使用、不能清理的上传文件路径集合
+        """
+        self._upload_guards.append(callback)
+
+    def _dir(self, category):
+        path = os.path.join(self.root, category)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _ensure_reaper(self):
+        """在当前进程中启动清理线程（fork后的子进程需要重新启动）"""
+        if self._reaper_pid == os.getpid():
+            return
+        with self._reaper_lock:
+            if self._reaper_pid == os.getpid():
+                return
+            threading.Thread(target=self._reap_loop, name='temp-artifact-reaper', daemon=True).start()
+            self._reaper_pid = os.getpid()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.reap_interval)
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"清理临时文件时发生错误: {str(e)}")
+
+    def spool(self):
+        """
+        创建缓冲文件：不超过内存阈值时保存在内存中，超过后转存到临时目录，关闭后自动删除
+        """
+        self._ensure_reaper()
+        return tempfile.SpooledTemporaryFile(max_size=self.memory_limit, dir=self._dir('spool'))
+
+    def new_file(self, category, suffix=''):
+        """
+        在临时目录中创建命名文件（随机文件名）
+
+        :param category: 子目录名，如uploads
+        :return: 已打开的文件对象，调用方负责删除；遗留文件超过保留时间后由清理线程删除
+        """
+        self._ensure_reaper()
+        return tempfile.NamedTemporaryFile(dir=self._dir(category), suffix=suffix, delete=False)
+
+    def _meta_path(self, artifact_id):
+        return os.path.join(self._dir(META_CATEGORY), f"{artifact_id}.json")
+
+    def save(self, category, output, download_name, owner_id=None, ttl=None):
+        """
+        保存生成的文件供下载
+
+        :param category: 子目录名，如errors、exports
+        :param output: 已写入内容的文件对象（通常由spool创建）
+        :param download_name: 下载文件名
+        :param owner_id: 可下载的用户ID
+        :param ttl: 保留秒数，默认取配置TEMP_ARTIFACT_TTL
+        :return: 文件ID
+        """
+        artifact_id = uuid.uuid4().hex
+        output.seek(0)
+        with self.new_file(category, os.path.splitext(download_name)[1]) as target:
+            shutil.copyfileobj(output, target)
+            size = target.tell()
+
+        meta = {'name': download_name, 'owner': owner_id, 'size': size, 'path': target.name,
+                'expires_at': time.time() + (ttl or self.ttl)}
+        # 先写临时文件再替换，读取时不会读到写了一半的元数据
+        meta_path = self._meta_path(artifact_id)
+        with open(f"{meta_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(f"{meta_path}.tmp", meta_path)
+        return artifact_id
+
+    def get(self, artifact_id):
+        """获取文件元数据，不存在、已过期或已被清理返回None"""
+        if not ARTIFACT_ID_PATTERN.fullmatch(artifact_id or ''):
+            return None
+        try:
+            with open(self._meta_path(artifact_id), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if meta['expires_at'] <= time.time() or not os.path.exists(meta['path']):
+            return None
+        return meta
+
+    def send(self, meta, download_name=None):
+        """返回文件下载响应，download_name默认为保存时的文件名"""
+        return send_file(meta['path'], as_attachment=True, download_name=download_name or meta['name'])
+
+    def _guarded_uploads(self):
+        paths = set()
+        for callback in self._upload_guards:
+            paths.update(os.path.abspath(path) for path in callback())
+        return paths
+
+    def reap(self):
+        """
+        清理过期的下载文件（连同元数据）和临时目录中超过保留时间的遗留文件；
+        目录总大小超过上限时从最早的文件开始删除（上传文件除外）；仍在使用的上传文件不清理
+
+        :return: 删除的文件数
+        """
+        now = time.time()
+        # (修改时间, 大小, 文件路径列表, 是否已过期, 是否参与容量淘汰)
+        entries = []
+        referenced = set()
+        meta_dir = self._dir(META_CATEGORY)
+        for filename in os.listdir(meta_dir):
+            meta_path = os.path.join(meta_dir, filename)
+            try:
+                mtime = os.stat(meta_path).st_mtime
+                with open(meta_path, encoding='utf-8') as f:
+                    meta = json.load(f)
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                # 写了一半的临时元数据文件，超过保留时间后删除
+                entries.append((mtime, 0, [meta_path], mtime <= now - self.ttl, False))
+                continue
+            referenced.add(meta['path'])
+            entries.append((mtime, meta['size'], [meta['path'], meta_path], meta['expires_at'] <= now, True))
+
+        guarded = self._guarded_uploads()
+        for dirpath, _, filenames in os.walk(self.root):
+            category = os.path.relpath(dirpath, self.root).split(os.sep)[0]
+            if category == META_CATEGORY:
+                continue
+            is_upload = category == UPLOAD_CATEGORY
+            ttl = self.upload_ttl if is_upload else self.ttl
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if path in referenced or (is_upload and path in guarded):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, [path], stat.st_mtime <= now - ttl, not is_upload))
+
+        entries.sort(key=lambda entry: entry[0])
+        total = sum(size for _, size, _, _, _ in entries)
+        removed = 0
+        for _, size, paths, expired, evictable in entries:
+            if not expired and (total <= self.disk_quota or not evictable):
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+        if removed:
+            logger.info(f"清理临时文件{removed}个")
+        return removed
+
+# 创建全局实例
+temp_artifact_service = TempArtifactService()
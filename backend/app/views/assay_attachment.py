@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from app import db
 from app.models.attachment import Attachment
 from app.models.assay_data import AssayData
+from app.utils.factory_scope import get_user_factory_ids
 import os
 from datetime import datetime
 import logging
@@ -133,8 +134,7 @@ def preview_assay_attachment(attachment_id):
             
         # 检查用户权限
         if not current_user.has_permission('assay_data_delete_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if assay_data.factory_id not in factory_ids:
                 return jsonify({'error': '您没有权限查看此附件'}), 403
         
@@ -202,8 +202,7 @@ def delete_assay_attachment(attachment_id):
             
         # 检查用户权限
         if not current_user.has_permission('assay_data_delete_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if assay_data.factory_id not in factory_ids:
                 return jsonify({'error': '您没有权限删除此附件'}), 403
         
@@ -256,8 +255,7 @@ def list_assay_attachments(assay_data_id):
         
         # 检查用户权限
         if not current_user.has_permission('assay_data_update_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if assay_data.factory_id not in factory_ids:
                 return jsonify({'error': '您没有权限查看此化验数据的附件'}), 403
         
@@ -4,6 +4,7 @@ from app import db
 from app.models.assay_data import AssayData
 from app.models.department import Department
 from app.models.attachment import Attachment
+from app.utils.factory_scope import get_user_factory_ids, factory_scope_filter
 import os
 from datetime import datetime
 import logging
@@ -24,9 +25,7 @@ def list_assay_data():
         assay_data_list = AssayData.query.all()
     else:
         # 其他用户只能看到自己分厂的数据
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
-        assay_data_list = AssayData.query.filter(AssayData.factory_id.in_(factory_ids)).all()
+        assay_data_list = AssayData.query.filter(factory_scope_filter(AssayData.factory_id)).all()
     
     return render_template('assay_data/list.html', assay_data_list=assay_data_list)
 
@@ -40,7 +39,7 @@ def create_assay_data():
         
         # 检查权限
         if not current_user.has_permission('assay_data_create_all'):
-            user_factories = [dept.id for dept in current_user.managed_departments if dept.level == 1]
+            user_factories = get_user_factory_ids()
             if factory_id and int(factory_id) not in user_factories:
                 flash('您没有权限在此分厂创建化验数据')
                 return redirect(url_for('assay_data.create_assay_data'))
@@ -150,7 +149,7 @@ def edit_assay_data(id):
     
     # 检查权限
     if not current_user.has_permission('assay_data_update_all'):
-        user_factories = [dept.id for dept in current_user.managed_departments if dept.level == 1]
+        user_factories = get_user_factory_ids()
         if assay_data.factory_id not in user_factories:
             flash('您没有权限编辑此化验数据')
             return redirect(url_for('assay_data.list_assay_data'))
@@ -193,7 +192,7 @@ def delete_assay_data(id):
     
     # 检查权限
     if not current_user.has_permission('assay_data_delete_all'):
-        user_factories = [dept.id for dept in current_user.managed_departments if dept.level == 1]
+        user_factories = get_user_factory_ids()
         if assay_data.factory_id not in user_factories:
             flash('您没有权限删除此化验数据')
             return redirect(url_for('assay_data.list_assay_data'))
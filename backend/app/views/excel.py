@@ -2,23 +2,24 @@
 Excel导入导出视图控制器
 处理Excel相关的HTTP请求
 """
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, request, jsonify, current_app, render_template, redirect, url_for, flash
 from flask_login import login_required, current_user
 from app.utils.excel_service import excel_service
-from app.utils.excel_validator import excel_validator
 from app.utils.excel_template_manager import template_manager
-from app.utils.excel_error_manager import error_manager
+from app.utils.temp_artifact_service import temp_artifact_service
+from app.utils.excel_import_service import IMPORT_MODULE_LABELS
+from app.utils.import_job_service import import_job_service
+from app.utils.monthly_report_service import monthly_report_service
+from app.utils.excel_export_service import export_service, assay_data_export, material_transaction_export, production_record_export
 from app.models.material_transaction import MaterialTransaction
+from app.models.assay_data import AssayData
 from app.models.customer import Customer
-from app.models.material import Material
 from app.models.department import Department
 from app.models.contract import Contract
 from app.models.production_record import ProductionRecord
-from app import db
-import os
+from app.utils.factory_scope import factory_scope_filter, get_user_factory_ids
 import logging
-import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +27,13 @@ logger = logging.getLogger(__name__)
 
 excel_bp = Blueprint('excel', __name__, url_prefix='/excel')
 
+# 导入任务进度页面的返回链接：模块 -> 列表页面
+IMPORT_LIST_ENDPOINTS = {
+    'material_transaction': 'material_transaction.list_transactions',
+    'assay_data': 'assay_data.list_assay_data',
+    'production_record': 'production_record.list_records'
+}
+
 @excel_bp.route('/template/<module_name>')
 @login_required
 def download_template(module_name):
@@ -35,241 +43,108 @@ def download_template(module_name):
     :param module_name: 模块名称
     """
     try:
-        # 根据模块名称生成相应模板
-        if module_name == 'material_transaction':
-            file_path = template_manager.generate_material_transaction_template()
-        elif module_name == 'assay_data':
-            file_path = template_manager.generate_assay_data_template()
-        elif module_name == 'production_record':
-            file_path = template_manager.generate_custom_template(
-                '产能记录',
-                ['日期', '分厂', '班组', '物料名称', '产量', '水含量', '锌含量', '铅含量', '氯含量', '氟含量', '备注'],
-                {
-                    '日期': '2023-01-01',
-                    '分厂': '一分厂',
-                    '班组': '一班',
-                    '物料名称': '产品A',
-                    '产量': 1000.0,
-                    '水含量': 5.2,
-                    '锌含量': 10.3,
-                    '铅含量': 2.1,
-                    '氯含量': 0.8,
-                    '氟含量': 0.1,
-                    '备注': '正常'
-                }
-            )
-        else:
+        if module_name not in IMPORT_MODULE_LABELS:
             return jsonify({'error': f'不支持的模块: {module_name}'}), 400
         
-        # 返回文件下载
-        return send_file(file_path, as_attachment=True)
+        # 返回内存中缓存的模板（带ETag）
+        return template_manager.send_template(module_name)
         
     except Exception as e:
         logger.error(f"下载模板时发生错误: {str(e)}")
         return jsonify({'error': f'下载模板时发生错误: {str(e)}'}), 500
 
+def _wants_html():
+    """页面表单提交（浏览器优先接受HTML）时返回True，接口调用返回JSON"""
+    return request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'text/html'
+
+def _import_error(message, status_code):
+    """导入提交失败：页面表单提示后返回原页面，接口调用返回JSON错误"""
+    if _wants_html():
+        flash(message, 'error')
+        return redirect(request.referrer or url_for('main.index'))
+    return jsonify({'error': message}), status_code
+
+@excel_bp.route('/import-jobs/<module_name>', methods=['POST'])
 @excel_bp.route('/import/<module_name>', methods=['POST'])
 @login_required
 def import_excel_data(module_name):
     """
-    导入Excel数据
+    导入Excel数据：保存上传文件后提交后台导入任务，立即返回任务信息（202），
+    通过/import-jobs/<任务ID>查询进度和错误报告；页面表单提交时跳转到任务进度页面
     
     :param module_name: 模块名称
     """
     try:
-        # 检查是否有上传文件
-        if 'file' not in request.files:
-            return jsonify({'error': '请选择要上传的文件'}), 400
-        
-        file = request.files['file']
-        if not file.filename:
-            return jsonify({'error': '请选择要上传的文件'}), 400
-        
-        # 保存上传文件
-        temp_dir = os.path.join(current_app.config.get('TEMP_FOLDER', 'temp'), 'excel', 'uploads')
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        file_path = os.path.join(temp_dir, file.filename)
-        file.save(file_path)
-        
-        # 读取Excel文件
-        df = excel_service.import_from_excel(file_path)
-        
-        # 根据模块名称进行数据验证和处理
-        if module_name == 'material_transaction':
-            # 验证物料进出厂数据
-            validation_result = excel_validator.validate_material_transaction_data(df)
-            if not validation_result['valid']:
-                # 生成错误报告
-                error_file = error_manager.generate_error_report(
-                    [{'type': '验证错误', 'message': validation_result['error']}], 
-                    '物料进出厂数据导入'
-                )
-                return jsonify({
-                    'error': '数据验证失败', 
-                    'error_report': error_file
-                }), 400
-            
-            # 导入数据到数据库
-            success_count = 0
-            error_count = 0
-            errors = []
-            
-            for index, row in df.iterrows():
-                try:
-                    # 处理日期
-                    date_obj = pd.to_datetime(row['日期']).date()
-                    
-                    # 创建物料进出厂记录
-                    transaction = MaterialTransaction(
-                        date=date_obj,
-                        customer=row['客户'],
-                        material_name=row['物料名称'],
-                        factory_id=Department.query.filter_by(name=row['分厂']).first().id if Department.query.filter_by(name=row['分厂']).first() else None,
-                        contract_number=row.get('合同编号', ''),
-                        transaction_type=row['类型'],
-                        packaging=row.get('包装', ''),
-                        vehicle_number=row.get('车号', ''),
-                        shipped_quantity=float(row['发数']),
-                        received_quantity=float(row['到数']),
-                        water_content=float(row['水含量']) if pd.notna(row.get('水含量')) else None,
-                        zinc_content=float(row['锌含量']) if pd.notna(row.get('锌含量')) else None,
-                        lead_content=float(row['铅含量']) if pd.notna(row.get('铅含量')) else None,
-                        chlorine_content=float(row['氯含量']) if pd.notna(row.get('氯含量')) else None,
-                        fluorine_content=float(row['氟含量']) if pd.notna(row.get('氟含量')) else None,
-                        remarks=row.get('备注', '')
-                    )
-                    
-                    db.session.add(transaction)
-                    success_count += 1
-                except Exception as e:
-                    error_count += 1
-                    errors.append({
-                        'type': '导入错误',
-                        'message': f'第{index+1}行导入失败: {str(e)}',
-                        'row': index+1
-                    })
-            
-            if errors:
-                # 生成错误报告
-                error_file = error_manager.generate_error_report(errors, '物料进出厂数据导入')
-                db.session.rollback()
-                return jsonify({
-                    'error': f'部分数据导入失败，成功导入{success_count}条，失败{error_count}条',
-                    'error_report': error_file
-                }), 400
-            else:
-                db.session.commit()
-            
-        elif module_name == 'assay_data':
-            # 验证化验数据
-            validation_result = excel_validator.validate_assay_data(df)
-            if not validation_result['valid']:
-                # 生成错误报告
-                error_file = error_manager.generate_error_report(
-                    [{'type': '验证错误', 'message': validation_result['error']}], 
-                    '化验数据导入'
-                )
-                return jsonify({
-                    'error': '数据验证失败', 
-                    'error_report': error_file
-                }), 400
-            
-            # TODO: 实际的数据导入逻辑需要根据具体的数据模型实现
-            # 这里只是示例，实际需要根据业务逻辑处理数据
-        elif module_name == 'production_record':
-            # 验证产能记录数据
-            required_columns = ['日期', '分厂', '物料名称', '产量']
-            validation_result = excel_service.validate_excel_data(df, required_columns)
-            if not validation_result['is_valid']:
-                # 生成错误报告
-                error_file = error_manager.generate_error_report(
-                    [{'type': '验证错误', 'message': '; '.join(validation_result['errors'])}], 
-                    '产能记录数据导入'
-                )
-                return jsonify({
-                    'error': '数据验证失败', 
-                    'error_report': error_file
-                }), 400
-            
-            # 导入数据到数据库
-            success_count = 0
-            error_count = 0
-            errors = []
-            
-            for index, row in df.iterrows():
-                try:
-                    # 处理日期
-                    date_obj = pd.to_datetime(row['日期']).date()
-                    
-                    # 获取分厂ID
-                    factory = Department.query.filter_by(name=row['分厂'], level=1).first()
-                    if not factory:
-                        raise ValueError(f"分厂不存在: {row['分厂']}")
-                    
-                    # 获取班组ID（如果提供）
-                    team_id = None
-                    if pd.notna(row.get('班组')):
-                        team = Department.query.filter_by(name=row['班组'], level=2).first()
-                        if team:
-                            team_id = team.id
-                    
-                    # 获取物料ID
-                    material = Material.query.filter_by(name=row['物料名称'], purpose='产品').first()
-                    if not material:
-                        raise ValueError(f"物料不存在: {row['物料名称']}")
-                    
-                    # 创建产能记录
-                    record = ProductionRecord(
-                        date=date_obj,
-                        factory_id=factory.id,
-                        team_id=team_id,
-                        recorder_id=current_user.id,
-                        material_name=row['物料名称'],
-                        quantity=float(row['产量']),
-                        water_content=float(row['水含量']) if pd.notna(row.get('水含量')) else None,
-                        zinc_content=float(row['锌含量']) if pd.notna(row.get('锌含量')) else None,
-                        lead_content=float(row['铅含量']) if pd.notna(row.get('铅含量')) else None,
-                        chlorine_content=float(row['氯含量']) if pd.notna(row.get('氯含量')) else None,
-                        fluorine_content=float(row['氟含量']) if pd.notna(row.get('氟含量')) else None,
-                        remarks=row.get('备注', ''),
-                        created_by=current_user.id
-                    )
-                    
-                    db.session.add(record)
-                    success_count += 1
-                except Exception as e:
-                    error_count += 1
-                    errors.append({
-                        'type': '导入错误',
-                        'message': f'第{index+1}行导入失败: {str(e)}',
-                        'row': index+1
-                    })
-            
-            if errors:
-                # 生成错误报告
-                error_file = error_manager.generate_error_report(errors, '产能记录数据导入')
-                db.session.rollback()
-                return jsonify({
-                    'error': f'部分数据导入失败，成功导入{success_count}条，失败{error_count}条',
-                    'error_report': error_file
-                }), 400
-            else:
-                db.session.commit()
-        else:
-            return jsonify({'error': f'不支持的模块: {module_name}'}), 400
-        
-        # 清理临时文件
-        os.remove(file_path)
-        
-        return jsonify({
-            'message': '数据导入成功',
-            'imported_rows': len(df)
-        }), 200
-        
+        if module_name not in IMPORT_MODULE_LABELS:
+            return _import_error(f'不支持的模块: {module_name}', 400)
+
+        file = request.files.get('file')
+        if not file or not file.filename:
+            return _import_error('请选择要上传的文件', 400)
+
+        # 上传文件分块写入临时文件（超过大小上限时拒绝）
+        try:
+            file_path = excel_service.save_upload(file)
+        except ValueError as e:
+            return _import_error(str(e), 400)
+
+        job = import_job_service.submit(
+            current_app._get_current_object(), module_name, file_path, file.filename, current_user.id
+        )
+        if _wants_html():
+            return redirect(url_for('excel.import_job_page', job_id=job['id']))
+        return jsonify(job), 202
+
     except Exception as e:
-        logger.error(f"导入Excel数据时发生错误: {str(e)}")
-        return jsonify({'error': f'导入Excel数据时发生错误: {str(e)}'}), 500
+        logger.error(f"提交导入任务时发生错误: {str(e)}")
+        return _import_error(f'提交导入任务时发生错误: {str(e)}', 500)
+
+def _get_own_import_job(job_id):
+    """获取当前用户可查看的导入任务（创建人或超级管理员）"""
+    job = import_job_service.get_job(job_id)
+    if job is None or (job['created_by'] != current_user.id and not current_user.is_superuser):
+        return None
+    return job
+
+@excel_bp.route('/import-jobs/<job_id>', methods=['GET'])
+@login_required
+def get_import_job(job_id):
+    """查询导入任务进度"""
+    job = _get_own_import_job(job_id)
+    if job is None:
+        return jsonify({'error': '导入任务不存在或已过期'}), 404
+    return jsonify(job)
+
+@excel_bp.route('/import-jobs/<job_id>/status')
+@login_required
+def import_job_page(job_id):
+    """导入任务进度页面（页面定时查询任务状态）"""
+    job = _get_own_import_job(job_id)
+    if job is None:
+        flash('导入任务不存在或已过期', 'error')
+        return redirect(url_for('main.index'))
+    return render_template('excel/import_job.html', job=job,
+                           module_label=IMPORT_MODULE_LABELS[job['module']],
+                           back_url=url_for(IMPORT_LIST_ENDPOINTS[job['module']]))
+
+@excel_bp.route('/import-jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_import_job(job_id):
+    """取消导入任务"""
+    job = _get_own_import_job(job_id)
+    if job is None:
+        return jsonify({'error': '导入任务不存在或已过期'}), 404
+    job = import_job_service.cancel(job_id)
+    return jsonify({'message': '已请求取消导入任务', 'job': job})
+
+@excel_bp.route('/artifacts/<artifact_id>')
+@login_required
+def download_artifact(artifact_id):
+    """下载错误报告等生成的临时文件（创建人或超级管理员）"""
+    meta = temp_artifact_service.get(artifact_id)
+    if meta is None or (meta['owner'] != current_user.id and not current_user.is_superuser):
+        return jsonify({'error': '文件不存在或已过期'}), 404
+    return temp_artifact_service.send(meta)
 
 @excel_bp.route('/export/<module_name>')
 @login_required
@@ -287,95 +162,88 @@ def export_excel_data(module_name):
             
             # 根据用户权限筛选数据
             if not current_user.has_permission('assay_data_create_all'):
-                user_departments = current_user.managed_departments
-                factory_ids = [dept.id for dept in user_departments if dept.level == 1]
-                query = query.filter(MaterialTransaction.factory_id.in_(factory_ids))
-            
-            transactions = query.all()
+                query = query.filter(factory_scope_filter(MaterialTransaction.factory_id))
             
-            # 转换为导出格式
-            export_data = []
-            for transaction in transactions:
-                export_data.append({
-                    '日期': transaction.date.strftime('%Y-%m-%d') if transaction.date else '',
-                    '客户': transaction.customer,
-                    '物料名称': transaction.material_name,
-                    '分厂': transaction.factory.name if transaction.factory else '',
-                    '合同编号': transaction.contract_number,
-                    '类型': transaction.transaction_type,
-                    '包装': transaction.packaging,
-                    '车号': transaction.vehicle_number,
-                    '发数': transaction.shipped_quantity,
-                    '到数': transaction.received_quantity,
-                    '水含量': transaction.water_content,
-                    '锌含量': transaction.zinc_content,
-                    '铅含量': transaction.lead_content,
-                    '氯含量': transaction.chlorine_content,
-                    '氟含量': transaction.fluorine_content,
-                    '备注': transaction.remarks
-                })
+            headers, query = material_transaction_export(query)
+            return export_service.export_response(headers, query, f"{module_name}_导出数据")
         elif module_name == 'assay_data':
-            # TODO: 根据模块名称查询相应数据
-            # 这里只是示例数据
-            export_data = [
-                {
-                    '样品名称': '样品1',
-                    '分厂': '一分厂',
-                    '水含量': 10.5,
-                    '锌含量': 20.3,
-                    '铅含量': 5.2,
-                    '氯含量': 1.8,
-                    '氟含量': 0.5,
-                    '铁含量': 3.7,
-                    '硅含量': 2.1,
-                    '硫含量': 1.2,
-                    '高热值': 4500,
-                    '低热值': 3200,
-                    '银含量': 0.01,
-                    '回收率': 95.5,
-                    '备注': '正常'
-                }
-            ]
+            # 查询化验数据
+            query = AssayData.query
+            
+            # 根据用户权限筛选数据
+            if not current_user.has_permission('assay_data_read_all'):
+                query = query.filter(factory_scope_filter(AssayData.factory_id))
+            
+            # 按化验日期（创建时间）和分厂筛选
+            try:
+                date_from = request.args.get('date_from', '').strip()
+                date_to = request.args.get('date_to', '').strip()
+                date_from = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
+                date_to = datetime.strptime(date_to, '%Y-%m-%d') if date_to else None
+            except ValueError:
+                return jsonify({'error': '日期格式不正确，应为YYYY-MM-DD'}), 400
+            if date_from:
+                query = query.filter(AssayData.created_at >= date_from)
+            if date_to:
+                # 截止日期包含当天
+                query = query.filter(AssayData.created_at < date_to + timedelta(days=1))
+            factory_id = request.args.get('factory_id', type=int)
+            if factory_id:
+                query = query.filter(AssayData.factory_id == factory_id)
+            
+            headers, query = assay_data_export(query)
+            return export_service.export_response(headers, query, f"{module_name}_导出数据")
         elif module_name == 'production_record':
             # 查询产能记录
             query = ProductionRecord.query
             
             # 根据用户权限筛选数据
             if not current_user.has_permission('production_record_create_all'):
-                user_departments = current_user.managed_departments
-                factory_ids = [dept.id for dept in user_departments if dept.level == 1]
-                query = query.filter(ProductionRecord.factory_id.in_(factory_ids))
-            
-            records = query.all()
+                query = query.filter(factory_scope_filter(ProductionRecord.factory_id))
             
-            # 转换为导出格式
-            export_data = []
-            for record in records:
-                export_data.append({
-                    '日期': record.date.strftime('%Y-%m-%d') if record.date else '',
-                    '分厂': record.factory.name if record.factory else '',
-                    '班组': record.team.name if record.team else '',
-                    '物料名称': record.material_name,
-                    '产量': record.quantity,
-                    '水含量': record.water_content,
-                    '锌含量': record.zinc_content,
-                    '铅含量': record.lead_content,
-                    '氯含量': record.chlorine_content,
-                    '氟含量': record.fluorine_content,
-                    '备注': record.remarks
-                })
+            headers, query = production_record_export(query)
+            return export_service.export_response(headers, query, f"{module_name}_导出数据")
         else:
             return jsonify({'error': f'不支持的模块: {module_name}'}), 400
         
-        # 导出数据
-        file_path = excel_service.export_to_excel(
-            export_data, 
-            f"{module_name}_导出数据"
-        )
+    except Exception as e:
+        logger.error(f"导出Excel数据时发生错误: {str(e)}")
+        return jsonify({'error': f'导出Excel数据时发生错误: {str(e)}'}), 500
+
+# 查看所有分厂月度报表所需的权限
+MONTHLY_REPORT_ALL_PERMISSIONS = ('material_transaction_read_all', 'production_record_read_all', 'assay_data_read_all')
+
+@excel_bp.route('/reports/monthly')
+@login_required
+def export_monthly_report():
+    """
+    导出分厂月度报表（物料进出厂、产能、化验、金属价格明细及汇总）
+
+    参数：factory_id（分厂ID）、month（YYYY-MM）
+    """
+    try:
+        factory_id = request.args.get('factory_id', type=int)
+        month = request.args.get('month', '').strip()
+        if not factory_id or not month:
+            return jsonify({'error': '请选择分厂和月份'}), 400
+        try:
+            datetime.strptime(month, '%Y-%m')
+        except ValueError:
+            return jsonify({'error': '月份格式不正确，应为YYYY-MM'}), 400
         
-        # 返回文件下载
-        return send_file(file_path, as_attachment=True)
+        factory = Department.query.get(factory_id)
+        if factory is None:
+            return jsonify({'error': '分厂不存在'}), 404
+        
+        # 非全局权限用户只能导出自己负责的分厂
+        if (factory_id not in get_user_factory_ids()
+                and not all(current_user.has_permission(name) for name in MONTHLY_REPORT_ALL_PERMISSIONS)):
+            return jsonify({'error': '没有权限导出该分厂的报表'}), 403
+        
+        download_name = f"{factory.name}_{month}_月度报表.xlsx"
+        meta = monthly_report_service.get_report(current_app._get_current_object(), factory_id, month, download_name)
+        return temp_artifact_service.send(meta, download_name)
         
     except Exception as e:
-        logger.error(f"导出Excel数据时发生错误: {str(e)}")
-        return jsonify({'error': f'导出Excel数据时发生错误: {str(e)}'}), 500
\ No newline at end of file
+        logger.error(f"导出月度报表时发生错误: {str(e)}")
+        return jsonify({'error': f'导出月度报表时发生错误: {str(e)}'}), 500
@@ -7,6 +7,7 @@ from app.models.material import Material
 from app.models.department import Department
 from app.models.contract import Contract
 from app.utils.pagination_service import pagination_service
+from app.utils.factory_scope import get_user_factory_ids, factory_scope_filter
 from sqlalchemy.orm import joinedload
 from datetime import datetime
 
@@ -43,9 +44,7 @@ def list_transactions():
     
     # 根据用户权限筛选数据
     if not current_user.has_permission('material_transaction_read_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
-        query = query.filter(MaterialTransaction.factory_id.in_(factory_ids))
+        query = query.filter(factory_scope_filter(MaterialTransaction.factory_id))
     
     # 使用分页服务
     pagination_result = pagination_service.paginate_query(
@@ -99,8 +98,7 @@ def create_transaction():
         
         # 检查权限
         if not current_user.has_permission('material_transaction_create_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if int(factory_id) not in factory_ids:
                 flash('您没有权限在此分厂创建记录')
                 return redirect(url_for('material_transaction.create_transaction'))
@@ -159,8 +157,7 @@ def edit_transaction(transaction_id):
     
     # 检查权限
     if not current_user.has_permission('material_transaction_update_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if transaction.factory_id not in factory_ids:
             flash('您没有权限编辑此记录')
             return redirect(url_for('material_transaction.list_transactions'))
@@ -191,8 +188,7 @@ def edit_transaction(transaction_id):
         
         # 检查权限
         if not current_user.has_permission('material_transaction_update_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if int(factory_id) not in factory_ids:
                 flash('您没有权限将记录转移到此分厂')
                 return redirect(url_for('material_transaction.edit_transaction', transaction_id=transaction_id))
@@ -248,8 +244,7 @@ def delete_transaction(transaction_id):
     
     # 检查权限
     if not current_user.has_permission('material_transaction_delete_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if transaction.factory_id not in factory_ids:
             flash('您没有权限删除此记录')
             return redirect(url_for('material_transaction.list_transactions'))
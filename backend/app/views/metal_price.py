@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, redirect, url_for, request, flash,
 from flask_login import login_required, current_user
 from app import db
 from app.models.metal_price import MetalPrice
+from app.utils.metal_price_import import price_key_exists
 from datetime import datetime
 import os
 
@@ -101,6 +102,10 @@ def create_price():
             flash('价格字段必须是有效的数字')
             return redirect(url_for('metal_price.create_price'))
         
+        if price_key_exists(metal_type, quote_date):
+            flash('该金属种类在该日期已有报价')
+            return redirect(url_for('metal_price.create_price'))
+        
         # 创建记录
         metal_price = MetalPrice(
             metal_type=metal_type,
@@ -172,6 +177,10 @@ def edit_price(price_id):
             flash('价格字段必须是有效的数字')
             return redirect(url_for('metal_price.edit_price', price_id=price_id))
         
+        if price_key_exists(metal_type, quote_date, exclude_id=metal_price.id):
+            flash('该金属种类在该日期已有报价')
+            return redirect(url_for('metal_price.edit_price', price_id=price_id))
+        
         # 更新记录
         metal_price.metal_type = metal_type
         metal_price.quote_date = quote_date
@@ -2,7 +2,7 @@ from flask import Blueprint, render_template, redirect, url_for, request, flash
 from flask_login import login_required
 from app import db
 from app.models.role import Role
-from app.models.permission import Permission, RolePermission
+from app.models.permission import Permission
 from app.views.decorators import permission_required
 
 permission_bp = Blueprint('permission', __name__)
@@ -83,7 +83,9 @@ def role_permissions(role_id):
     """查看角色权限"""
     role = Role.query.get_or_404(role_id)
     permissions = Permission.query.all()
-    return render_template('permissions/role_permissions.html', role=role, permissions=permissions)
+    # 一次查询获取已分配的权限，避免模板中逐条检查
+    granted_ids = role.get_permission_ids()
+    return render_template('permissions/role_permissions.html', role=role, permissions=permissions, granted_ids=granted_ids)
 
 @permission_bp.route('/roles/<int:role_id>/permissions/update', methods=['POST'])
 @login_required
@@ -95,13 +97,8 @@ def update_role_permissions(role_id):
     # 获取所有权限ID
     permission_ids = request.form.getlist('permissions')
     
-    # 删除现有权限关联
-    RolePermission.query.filter_by(role_id=role.id).delete()
-    
-    # 添加新的权限关联
-    for permission_id in permission_ids:
-        rp = RolePermission(role_id=role.id, permission_id=int(permission_id))
-        db.session.add(rp)
+    # 仅增删与现有权限的差异部分
+    role.set_permissions(int(permission_id) for permission_id in permission_ids)
     
     db.session.commit()
     flash('角色权限更新成功')
@@ -5,6 +5,7 @@ from app.models.production_record import ProductionRecord
 from app.models.material import Material
 from app.models.department import Department
 from app.utils.pagination_service import pagination_service
+from app.utils.factory_scope import get_user_factory_ids, factory_scope_filter
 from sqlalchemy.orm import joinedload
 from datetime import datetime, date
 
@@ -42,9 +43,7 @@ def list_records():
     
     # 根据用户权限筛选数据
     if not current_user.has_permission('production_record_read_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
-        query = query.filter(ProductionRecord.factory_id.in_(factory_ids))
+        query = query.filter(factory_scope_filter(ProductionRecord.factory_id))
     
     # 使用分页服务
     pagination_result = pagination_service.paginate_query(
@@ -92,8 +91,7 @@ def create_record():
         
         # 检查权限
         if not current_user.has_permission('production_record_create_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if int(factory_id) not in factory_ids:
                 flash('您没有权限在此分厂创建记录')
                 return redirect(url_for('production_record.create_record'))
@@ -152,8 +150,7 @@ def edit_record(record_id):
     
     # 检查权限
     if not current_user.has_permission('production_record_update_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if record.factory_id not in factory_ids:
             flash('您没有权限编辑此记录')
             return redirect(url_for('production_record.list_records'))
@@ -179,8 +176,7 @@ def edit_record(record_id):
         
         # 检查权限
         if not current_user.has_permission('production_record_update_all'):
-            user_departments = current_user.managed_departments
-            factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+            factory_ids = get_user_factory_ids()
             if int(factory_id) not in factory_ids:
                 flash('您没有权限将记录转移到此分厂')
                 return redirect(url_for('production_record.edit_record', record_id=record_id))
@@ -229,8 +225,7 @@ def delete_record(record_id):
     
     # 检查权限
     if not current_user.has_permission('production_record_delete_all'):
-        user_departments = current_user.managed_departments
-        factory_ids = [dept.id for dept in user_departments if dept.level == 1]
+        factory_ids = get_user_factory_ids()
         if record.factory_id not in factory_ids:
             flash('您没有权限删除此记录')
             return redirect(url_for('production_record.list_records'))
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, jsonify, request
 from flask_login import login_required
 from app.utils.query_monitor import query_monitor
+from app.utils.cache_service import cache_service
 from app.views.decorators import permission_required
 
 query_monitor_bp = Blueprint('query_monitor', __name__)
@@ -69,6 +70,16 @@ def get_performance_report():
         'data': report
     })
 
+@query_monitor_bp.route('/api/cache-stats')
+@login_required
+@permission_required('system_monitor')
+def get_cache_stats():
+    """获取缓存统计信息"""
+    return jsonify({
+        'success': True,
+        'data': cache_service.get_stats()
+    })
+
 @query_monitor_bp.route('/api/clear-stats', methods=['POST'])
 @login_required
 @permission_required('system_monitor')
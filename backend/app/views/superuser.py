@@ -34,7 +34,7 @@ def status():
         'is_superuser': current_user.is_superuser,
         'is_active': current_user.is_active,
         'roles': [role.name for role in current_user.roles],
-        'permission_count': len(current_user.get_all_permissions())
+        'permission_count': len(current_user.get_permission_names())
     }
     
     return render_template('superuser_status.html', user_info=user_info)
\ No newline at end of file
@@ -45,13 +45,39 @@ class Config:
     # 会话超时配置
     SESSION_TIMEOUT_MINUTES = 30  # 30分钟无活动自动超时
     SESSION_CLEANUP_INTERVAL = 300  # 5分钟清理一次过期会话
+    SESSION_STORE = os.environ.get('SESSION_STORE', 'memory')  # 会话存储：memory、redis（多worker部署）
     
     # Token黑名单配置
-    JWT_BLACKLIST_FILE = 'token_blacklist.json'  # 黑名单文件名
+    JWT_BLACKLIST_FILE = 'token_blacklist.db'  # 黑名单SQLite文件名（位于实例目录）
+    JWT_BLACKLIST_STORE = os.environ.get('JWT_BLACKLIST_STORE', 'sqlite')  # 黑名单存储：sqlite、redis（多主机部署）
     JWT_BLACKLIST_CLEANUP_DAYS = 7  # 黑名单条目保留天数
     
     # Redis缓存配置
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    # 进程内一级缓存（位于Redis之前，通过Redis发布订阅跨进程失效）
+    CACHE_L1_ENABLED = os.environ.get('CACHE_L1_ENABLED', 'false').lower() == 'true'
+    CACHE_L1_MAX_ITEMS = int(os.environ.get('CACHE_L1_MAX_ITEMS', 1000))  # 每个前缀默认最多缓存条目数
+    CACHE_L1_MAX_TTL = int(os.environ.get('CACHE_L1_MAX_TTL', 60))  # 一级缓存条目最长存活秒数
+    CACHE_L1_PREFIX_LIMITS = {  # 按缓存键前缀单独限制条目数
+        'latest_metal_prices': 50,
+        'metal_prices_list': 200
+    }
+    
+    # Excel导入：上传文件大小上限（不超过MAX_CONTENT_LENGTH），分块读取的每块行数
+    EXCEL_UPLOAD_MAX_SIZE = int(os.environ.get('EXCEL_UPLOAD_MAX_SIZE', MAX_CONTENT_LENGTH))
+    EXCEL_IMPORT_CHUNK_ROWS = int(os.environ.get('EXCEL_IMPORT_CHUNK_ROWS', 5000))
+    # Excel后台导入任务
+    IMPORT_JOB_WORKERS = int(os.environ.get('IMPORT_JOB_WORKERS', 2))  # 每个进程的导入线程数
+    IMPORT_JOB_TTL = int(os.environ.get('IMPORT_JOB_TTL', 86400))  # 任务状态保留秒数
+    # 临时文件（导出文件、错误报告、上传文件）：不超过内存阈值的保存在内存中，过期或超出容量后自动清理
+    TEMP_ARTIFACT_MEMORY_LIMIT = int(os.environ.get('TEMP_ARTIFACT_MEMORY_LIMIT', 1024 * 1024))
+    TEMP_ARTIFACT_DISK_QUOTA = int(os.environ.get('TEMP_ARTIFACT_DISK_QUOTA', 512 * 1024 * 1024))
+    TEMP_ARTIFACT_TTL = int(os.environ.get('TEMP_ARTIFACT_TTL', 3600))  # 保留秒数
+    TEMP_ARTIFACT_UPLOAD_TTL = int(os.environ.get('TEMP_ARTIFACT_UPLOAD_TTL', 86400))  # 未被导入任务引用的遗留上传文件保留秒数
+    TEMP_ARTIFACT_REAP_INTERVAL = int(os.environ.get('TEMP_ARTIFACT_REAP_INTERVAL', 300))  # 清理间隔秒数
+    # 分厂月度报表：各工作表并行查询的线程数，工作簿缓存秒数（数据变更后缓存键随之变化）
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 4))
+    REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL', 86400))
     
     # 查询监控配置
     ENABLE_QUERY_MONITORING = os.environ.get('ENABLE_QUERY_MONITORING', 'false').lower() == 'true'